@@ -0,0 +1,229 @@
+from kafi.storage_consumer import StorageConsumer
+from kafi.helpers import get_millis
+
+# Constants
+
+ALL_MESSAGES = -1
+OFFSET_INVALID = -1001
+
+#
+
+# The consumer loop shared by the storages of the Kafka emulation (file systems, SQLite, memory): a cursor kept between foldl()/consume() calls, follow mode and batched offset commits. The storages only implement the storage calls:
+# * read_messages(**kwargs) - a generator of the messages from the start offsets (see get_start_offsets()) on, updating self.topic_str_position_dict_dict (by default in batches with read_messages() of the admin)
+# * get_committed_offsets(topic_str) - the committed offsets of the group for the topic
+# * commit_offsets(topic_str_offsets_dict_dict) - commit offsets for the group
+# * wait_for_new_messages(topic_str_version_dict) - block until the versions of the topics (see get_topic_versions()) change
+# * topics_exist() - (optional) whether all the topics still exist (follow mode stops once a topic has been deleted)
+# * leave_group() - on close()
+class CursorConsumer(StorageConsumer):
+    def __init__(self, storage_obj, *topics, **kwargs):
+        super().__init__(storage_obj, *topics, **kwargs)
+        #  required for commit() without offsets.
+        self.next_topic_str_offsets_dict_dict = {topic_str: {partition_int: OFFSET_INVALID for partition_int in range(self.storage_obj.admin.get_partitions(topic_str))} for topic_str in self.topic_str_list}
+        #
+        # Offset commits are batched (e.g. on the file systems, every commit is a read-modify-write of the group file).
+        self.commit_interval_messages_int = int(self.consumer_config_dict["commit.interval.messages"]) if "commit.interval.messages" in self.consumer_config_dict else storage_obj.commit_interval_messages()
+        self.commit_interval_ms_int = int(self.consumer_config_dict["commit.interval.ms"]) if "commit.interval.ms" in self.consumer_config_dict else storage_obj.commit_interval_ms()
+        #
+        self.pending_topic_str_offsets_dict_dict = {}
+        self.pending_messages_int = 0
+        self.last_commit_millis_int = get_millis()
+        #
+        # The cursor - see foldl().
+        self.message_dict_generator = None
+        self.topic_str_position_dict_dict = {}
+
+    #
+
+    def close(self):
+        self.close_cursor()
+        self.commit_pending()
+        #
+        self.leave_group()
+        #
+        return self.topic_str_list
+
+    #
+
+    def foldl(self, foldl_function, initial_acc, n=ALL_MESSAGES, commit_after_processing=None, **kwargs):
+        n_int = n
+        #
+        commit_after_processing_bool = self.storage_obj.commit_after_processing() if commit_after_processing is None else commit_after_processing
+        #
+        follow_bool = kwargs["follow"] if "follow" in kwargs else False
+        idle_function = kwargs["idle_function"] if "idle_function" in kwargs else None
+        #
+        topic_str_version_dict = None
+        #
+        message_counter_int = 0
+        acc = initial_acc
+        while n_int == ALL_MESSAGES or message_counter_int < n_int:
+            # Keep the cursor (the suspended generator of messages and the positions) between calls such that repeated small foldl()/consume() calls only read the next messages.
+            if self.is_cursor_stale():
+                self.close_cursor()
+            #
+            if self.message_dict_generator is None:
+                if follow_bool:
+                    # Remember the versions of the topics before reading (to not miss messages produced in the meantime).
+                    topic_str_version_dict = self.get_topic_versions()
+                #
+                self.message_dict_generator = self.read_messages(**kwargs)
+            #
+            message_dict = next(self.message_dict_generator, None)
+            if message_dict is None:
+                # All messages read - the next call (or iteration in follow mode) starts a new cursor from the current positions.
+                self.message_dict_generator = None
+                #
+                if not follow_bool:
+                    break
+                # Follow mode - commit, let the caller flush (e.g. its producer) and wait for new messages.
+                self.commit_pending()
+                if idle_function is not None:
+                    acc = idle_function(acc)
+                if topic_str_version_dict is not None:
+                    self.wait_for_new_messages(topic_str_version_dict)
+                #
+                if not self.topics_exist():
+                    break
+                continue
+            #
+            topic_str = message_dict["topic"]
+            partition_int = message_dict["partition"]
+            self.next_topic_str_offsets_dict_dict[topic_str][partition_int] = message_dict["offset"] + 1
+            if self.enable_auto_commit_bool:
+                # Commit after reading the message if enable.auto.commit == True
+                self.add_pending_commit(topic_str, partition_int, message_dict["offset"] + 1)
+            #
+            try:
+                acc = foldl_function(acc, message_dict)
+            except Exception:
+                # Commit the offsets of the messages processed so far before propagating the error, and restart from the committed offsets with the next call.
+                self.commit_pending()
+                self.close_cursor()
+                raise
+            #
+            message_counter_int += 1
+            #
+            if not self.enable_auto_commit_bool and commit_after_processing_bool:
+                # Only commit once the message has been processed if enable.auto.commit == False and commit.after.processing == True
+                self.add_pending_commit(topic_str, partition_int, message_dict["offset"] + 1)
+        #
+        self.commit_pending()
+        #
+        return acc
+
+    def is_cursor_stale(self):
+        return False
+
+    def topics_exist(self):
+        return True
+
+    def close_cursor(self):
+        if self.message_dict_generator is not None:
+            self.message_dict_generator.close()
+            self.message_dict_generator = None
+        #
+        self.topic_str_position_dict_dict = {}
+
+    def get_topic_versions(self):
+        # By default, the versions of the topics are their high watermarks.
+        topic_str_high_offsets_dict_dict = {topic_str: {partition_int: offsets_tuple[1] for partition_int, offsets_tuple in self.storage_obj.admin.get_watermarks(topic_str).items()} for topic_str in self.topic_str_list}
+        #
+        return topic_str_high_offsets_dict_dict
+
+    def read_messages(self, **kwargs):
+        # By default, read the messages in batches with read_messages() of the admin (the file systems read whole partition files instead).
+        consume_batch_size_int = kwargs["consume_batch_size"] if "consume_batch_size" in kwargs else self.storage_obj.consume_batch_size()
+        #
+        for topic_str in self.topic_str_list:
+            start_offsets_dict = self.get_start_offsets(topic_str)
+            self.topic_str_position_dict_dict[topic_str] = dict(start_offsets_dict)
+            #
+            # Read the partitions round-robin, one batch (e.g. a range query on the primary key) at a time.
+            partition_int_list = sorted(start_offsets_dict.keys())
+            while len(partition_int_list) > 0:
+                for partition_int in list(partition_int_list):
+                    message_dict_list = self.storage_obj.admin.read_messages(topic_str, partition_int, self.topic_str_position_dict_dict[topic_str][partition_int], consume_batch_size_int)
+                    if len(message_dict_list) < consume_batch_size_int:
+                        partition_int_list.remove(partition_int)
+                    #
+                    for message_dict in message_dict_list:
+                        message_dict["key"] = self.deserialize(message_dict["key"], self.topic_str_key_type_str_dict[topic_str], topic_str=topic_str, key_bool=True)
+                        #
+                        message_dict["value"] = self.deserialize(message_dict["value"], self.topic_str_value_type_str_dict[topic_str], topic_str=topic_str, key_bool=False)
+                        #
+                        self.topic_str_position_dict_dict[topic_str][partition_int] = message_dict["offset"] + 1
+                        #
+                        yield message_dict
+
+    def get_start_offsets(self, topic_str):
+        auto_offset_reset_str = self.consumer_config_dict["auto.offset.reset"]
+        #
+        start_offsets_dict = self.topic_str_start_offsets_dict_dict[topic_str] if self.topic_str_start_offsets_dict_dict is not None and topic_str in self.topic_str_start_offsets_dict_dict else None
+        #
+        if start_offsets_dict is None:
+            # If we got no start offsets, use the committed offsets of the group (and auto.offset.reset for the partitions without committed offsets).
+            group_offsets_dict = self.get_committed_offsets(topic_str)
+            #
+            if any(offset_int == OFFSET_INVALID for offset_int in group_offsets_dict.values()):
+                if auto_offset_reset_str.lower() == "latest":
+                    auto_offset_reset_offsets_dict = {partition_int: offsets_tuple[1] for partition_int, offsets_tuple in self.storage_obj.admin.get_watermarks(topic_str).items()}
+                elif auto_offset_reset_str.lower() == "earliest":
+                    auto_offset_reset_offsets_dict = {partition_int: offsets_tuple[0] for partition_int, offsets_tuple in self.storage_obj.admin.get_watermarks(topic_str).items()}
+                else:
+                    raise Exception("Only \"earliest\" and \"latest\" supported for \"auto.offset.reset\".")
+                #
+                start_offsets_dict = {partition_int: auto_offset_reset_offsets_dict[partition_int] if offset_int == OFFSET_INVALID else offset_int for partition_int, offset_int in group_offsets_dict.items()}
+            else:
+                start_offsets_dict = group_offsets_dict
+        #
+        # Continue from the positions of the previous cursor (if any).
+        if topic_str in self.topic_str_position_dict_dict:
+            start_offsets_dict = {**start_offsets_dict, **self.topic_str_position_dict_dict[topic_str]}
+        #
+        return start_offsets_dict
+
+    #
+
+    def consume(self, n=ALL_MESSAGES, **kwargs):
+        def foldl_function(message_dict_list, message_dict):
+            message_dict_list.append(message_dict)
+            #
+            return message_dict_list
+        #
+        return self.foldl(foldl_function, [], n, **kwargs)
+
+    def commit(self, offsets=None):
+        if offsets is None:
+            topic_str_offsets_dict_dict = self.get_next_offsets()
+        else:
+            str_or_int = list(offsets.keys())[0]
+            if isinstance(str_or_int, str):
+                topic_str_offsets_dict_dict = offsets
+            elif isinstance(str_or_int, int):
+                topic_str_offsets_dict_dict = {topic_str: offsets for topic_str in self.topic_str_list}
+        #
+        self.commit_offsets(topic_str_offsets_dict_dict)
+        #
+        self.pending_topic_str_offsets_dict_dict = {}
+        self.pending_messages_int = 0
+        self.last_commit_millis_int = get_millis()
+        #
+        return topic_str_offsets_dict_dict
+
+    def get_next_offsets(self):
+        return self.next_topic_str_offsets_dict_dict
+
+    def add_pending_commit(self, topic_str, partition_int, offset_int):
+        if topic_str not in self.pending_topic_str_offsets_dict_dict:
+            self.pending_topic_str_offsets_dict_dict[topic_str] = {}
+        self.pending_topic_str_offsets_dict_dict[topic_str][partition_int] = offset_int
+        self.pending_messages_int += 1
+        #
+        if self.pending_messages_int >= self.commit_interval_messages_int or get_millis() - self.last_commit_millis_int >= self.commit_interval_ms_int:
+            self.commit_pending()
+
+    def commit_pending(self):
+        # Only commit the offsets of messages which have already been read (enable.auto.commit == True) or processed (commit.after.processing == True).
+        if self.pending_messages_int > 0:
+            self.commit(self.pending_topic_str_offsets_dict_dict)
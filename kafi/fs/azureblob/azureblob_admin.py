@@ -1,4 +1,5 @@
 import os
+import time
 
 from kafi.fs.fs_admin import FSAdmin
 
@@ -11,7 +12,8 @@ class AzureBlobAdmin(FSAdmin):
 
         super().__init__(azureblob_obj)
         #
-        blobServiceClient = BlobServiceClient.from_connection_string(azureblob_obj.azure_blob_config_dict["connection.string"])
+        # One long-lived client per storage object (all blob clients share its connection pool). Blobs larger than part.size are uploaded/downloaded in blocks/chunks of part.size with max.concurrency parallel connections.
+        blobServiceClient = BlobServiceClient.from_connection_string(azureblob_obj.azure_blob_config_dict["connection.string"], max_single_put_size=azureblob_obj.part_size(), max_block_size=azureblob_obj.part_size(), max_single_get_size=azureblob_obj.part_size(), max_chunk_get_size=azureblob_obj.part_size())
         self.containerClient = blobServiceClient.get_container_client(azureblob_obj.container_name())
 
     # Topics/Files
@@ -25,6 +27,16 @@ class AzureBlobAdmin(FSAdmin):
         #
         return rel_dir_str_list
 
+    def list_child_dirs(self, abs_path_dir_str):
+        from azure.storage.blob import BlobPrefix
+        # Hierarchical listing, i.e. only the virtual directories directly below abs_path_dir_str are returned.
+        blobProperties_or_blobPrefix_itemPaged = self.containerClient.walk_blobs(name_starts_with=os.path.join(abs_path_dir_str, ""), delimiter="/")
+        rel_dir_str_list = [os.path.basename(os.path.dirname(blobPrefix.name)) for blobPrefix in blobProperties_or_blobPrefix_itemPaged if isinstance(blobPrefix, BlobPrefix)]
+        #
+        rel_dir_str_list.sort()
+        #
+        return rel_dir_str_list
+
     def list_files(self, abs_path_dir_str):
         blob_str_itemPaged = self.containerClient.list_blob_names(name_starts_with=abs_path_dir_str)
         rel_file_str_set = set([os.path.relpath(blob_str, abs_path_dir_str) for blob_str in blob_str_itemPaged])
@@ -35,6 +47,22 @@ class AzureBlobAdmin(FSAdmin):
         return rel_file_str_list
 
 
+    def list_file_versions(self, abs_path_dir_str):
+        from azure.storage.blob import BlobPrefix
+        # Get the versions (ETags, see get_file_version()) of all the blobs directly below abs_path_dir_str from the listing itself.
+        blobProperties_or_blobPrefix_itemPaged = self.containerClient.walk_blobs(name_starts_with=os.path.join(abs_path_dir_str, ""), delimiter="/")
+        rel_file_str_version_dict = {os.path.basename(blobProperties.name): blobProperties.etag for blobProperties in blobProperties_or_blobPrefix_itemPaged if not isinstance(blobProperties, BlobPrefix)}
+        #
+        return rel_file_str_version_dict
+
+    def list_file_sizes(self, abs_path_dir_str):
+        from azure.storage.blob import BlobPrefix
+        # Get the sizes of all the blobs directly below abs_path_dir_str from the listing itself (without downloading them).
+        blobProperties_or_blobPrefix_itemPaged = self.containerClient.walk_blobs(name_starts_with=os.path.join(abs_path_dir_str, ""), delimiter="/")
+        rel_file_str_size_int_dict = {os.path.basename(blobProperties.name): blobProperties.size for blobProperties in blobProperties_or_blobPrefix_itemPaged if not isinstance(blobProperties, BlobPrefix)}
+        #
+        return rel_file_str_size_int_dict
+
     def delete_file(self, abs_path_file_str):
         self.containerClient.delete_blob(abs_path_file_str)
 
@@ -42,55 +70,109 @@ class AzureBlobAdmin(FSAdmin):
         pass
 
     def exists_file(self, abs_path_file_str):
-        from azure.storage.blob import BlobClient
+        blobClient = self.containerClient.get_blob_client(abs_path_file_str)
         #
+        return blobClient.exists()
 
-        blobClient = BlobClient.from_connection_string(self.storage_obj.azure_blob_config_dict["connection.string"], container_name=self.storage_obj.azure_blob_config_dict["container.name"], blob_name=abs_path_file_str)
+    def get_file_version(self, abs_path_file_str):
+        from azure.core.exceptions import ResourceNotFoundError
         #
-        return blobClient.exists()
 
-    # Metadata
-    
-    def read_str(self, abs_path_file_str):
-        from azure.storage.blob import BlobClient
+        blobClient = self.containerClient.get_blob_client(abs_path_file_str)
         #
+        try:
+            return blobClient.get_blob_properties().etag
+        except ResourceNotFoundError:
+            return None
 
-        blobClient = BlobClient.from_connection_string(conn_str=self.storage_obj.azure_blob_config_dict["connection.string"], container_name=self.storage_obj.azure_blob_config_dict["container.name"], blob_name=abs_path_file_str)
+    def get_file_mtime_millis(self, abs_path_file_str):
+        from azure.core.exceptions import ResourceNotFoundError
         #
-        storageStreamDownloader = blobClient.download_blob()
-        blob_bytes = storageStreamDownloader.read()
+
+        blobClient = self.containerClient.get_blob_client(abs_path_file_str)
+        #
+        try:
+            return int(blobClient.get_blob_properties().last_modified.timestamp() * 1000)
+        except ResourceNotFoundError:
+            return None
+
+    def get_segment_cache_key_str(self, abs_path_file_str, version):
+        return f"azureblob://{self.containerClient.account_name}/{self.storage_obj.container_name()}/{abs_path_file_str}#{version}"
+
+    # Metadata
+    
+    def read_str(self, abs_path_file_str):
+        blob_bytes = self.read_bytes(abs_path_file_str)
         #
         blob_str = blob_bytes.decode("utf-8")
         #
         return blob_str
 
     def write_str(self, abs_path_file_str, data_str):
-        from azure.storage.blob import BlobClient
+        data_bytes = data_str.encode("utf-8")
         #
+        self.write_bytes(abs_path_file_str, data_bytes)
 
-        blobClient = BlobClient.from_connection_string(conn_str=self.storage_obj.azure_blob_config_dict["connection.string"], container_name=self.storage_obj.azure_blob_config_dict["container.name"], blob_name=abs_path_file_str)
+    def create_file_exclusive(self, abs_path_file_str, data_str):
+        from azure.core.exceptions import ResourceExistsError
         #
-        data_bytes = data_str.encode("utf-8")
+
+        blobClient = self.containerClient.get_blob_client(abs_path_file_str)
+        # Conditional write (only create the blob if it does not exist yet, e.g. for lock files).
+        try:
+            blobClient.upload_blob(data_str.encode("utf-8"), overwrite=False)
+            return True
+        except ResourceExistsError:
+            return False
+
+    def delete_file_if_version(self, abs_path_file_str, version):
+        from azure.core import MatchConditions
+        from azure.core.exceptions import ResourceModifiedError, ResourceNotFoundError
         #
-        blobClient.upload_blob(data_bytes, overwrite=True)        
+
+        blobClient = self.containerClient.get_blob_client(abs_path_file_str)
+        # Conditional delete (only delete the blob if its ETag has not changed, e.g. for breaking expired lock files).
+        try:
+            blobClient.delete_blob(etag=version, match_condition=MatchConditions.IfNotModified)
+            return True
+        except (ResourceModifiedError, ResourceNotFoundError):
+            return False
 
     #
 
-    def read_bytes(self, abs_path_file_str):
-        from azure.storage.blob import BlobClient
+    def read_bytes(self, abs_path_file_str, start_pos_int=0, size_int=-1):
+        blobClient = self.containerClient.get_blob_client(abs_path_file_str)
+        # Ranged download if only a part of the blob is needed.
+        storageStreamDownloader = blobClient.download_blob(offset=start_pos_int if start_pos_int > 0 or size_int >= 0 else None, length=size_int if size_int >= 0 else None, max_concurrency=self.storage_obj.max_concurrency())
+        blob_bytes = storageStreamDownloader.readall()
         #
+        return blob_bytes
 
-        blobClient = BlobClient.from_connection_string(conn_str=self.storage_obj.azure_blob_config_dict["connection.string"], container_name=self.storage_obj.azure_blob_config_dict["container.name"], blob_name=abs_path_file_str)
-        #
-        storageStreamDownloader = blobClient.download_blob()
-        blob_bytes = storageStreamDownloader.read()
+    def read_stream(self, abs_path_file_str, start_pos_int=0):
+        blobClient = self.containerClient.get_blob_client(abs_path_file_str)
         #
-        return blob_bytes
+        storageStreamDownloader = blobClient.download_blob(offset=start_pos_int if start_pos_int > 0 else None, max_concurrency=self.storage_obj.max_concurrency())
+        for chunk_bytes in storageStreamDownloader.chunks():
+            yield chunk_bytes
 
     def write_bytes(self, abs_path_file_str, data_bytes):
-        from azure.storage.blob import BlobClient
+        blobClient = self.containerClient.get_blob_client(abs_path_file_str)
         #
+        blobClient.upload_blob(data_bytes, overwrite=True, max_concurrency=self.storage_obj.max_concurrency())
 
-        blobClient = BlobClient.from_connection_string(conn_str=self.storage_obj.azure_blob_config_dict["connection.string"], container_name=self.storage_obj.azure_blob_config_dict["container.name"], blob_name=abs_path_file_str)
+    def copy_file(self, source_admin, source_abs_path_file_str, target_abs_path_file_str):
+        # Server-side copies (authorized by the shared key) are only possible within the same storage account.
+        if not isinstance(source_admin, AzureBlobAdmin) or source_admin.containerClient.account_name != self.containerClient.account_name:
+            return super().copy_file(source_admin, source_abs_path_file_str, target_abs_path_file_str)
+        #
+        sourceBlobClient = source_admin.containerClient.get_blob_client(source_abs_path_file_str)
+        blobClient = self.containerClient.get_blob_client(target_abs_path_file_str)
+        #
+        copy_status_str = blobClient.start_copy_from_url(sourceBlobClient.url)["copy_status"]
+        # The copy is asynchronous - wait until it has completed.
+        while copy_status_str == "pending":
+            time.sleep(0.1)
+            copy_status_str = blobClient.get_blob_properties().copy.status
         #
-        blobClient.upload_blob(data_bytes)
+        if copy_status_str != "success":
+            raise Exception(f"Copying \"{source_abs_path_file_str}\" to \"{target_abs_path_file_str}\" failed (copy status: \"{copy_status_str}\").")
@@ -1,5 +1,10 @@
 from kafi.storage import Storage
 from kafi.files import Files
+from kafi.fs.fs_segment import SEGMENT_FORMAT_ARROW
+
+# Constants
+
+ALL_MESSAGES = -1
 
 #
 
@@ -32,6 +37,16 @@ class FS(Storage):
                 self.container_name("test")
             else:
                 self.container_name(str(self.azure_blob_config_dict["container.name"]))
+            #
+            if "part.size" not in self.azure_blob_config_dict:
+                self.part_size(16777216)
+            else:
+                self.part_size(int(self.azure_blob_config_dict["part.size"]))
+            #
+            if "max.concurrency" not in self.azure_blob_config_dict:
+                self.max_concurrency(4)
+            else:
+                self.max_concurrency(int(self.azure_blob_config_dict["max.concurrency"]))
         else:
             self.azure_blob_config_dict = None
         # s3
@@ -47,16 +62,240 @@ class FS(Storage):
                 self.bucket_name("test")
             else:
                 self.bucket_name(str(self.s3_config_dict["bucket.name"]))
+            #
+            if "part.size" not in self.s3_config_dict:
+                self.part_size(16777216)
+            else:
+                self.part_size(int(self.s3_config_dict["part.size"]))
+            #
+            if "max.concurrency" not in self.s3_config_dict:
+                self.max_concurrency(4)
+            else:
+                self.max_concurrency(int(self.s3_config_dict["max.concurrency"]))
         else:
             self.s3_config_dict = None
         #
+        # kafi section
+        #
+        if "segment.format" not in self.kafi_config_dict:
+            self.segment_format("binary")
+        else:
+            self.segment_format(str(self.kafi_config_dict["segment.format"]))
+        #
+        if "index.interval.bytes" not in self.kafi_config_dict:
+            self.index_interval_bytes(4096)
+        else:
+            self.index_interval_bytes(int(self.kafi_config_dict["index.interval.bytes"]))
+        #
+        if "segment.bytes" not in self.kafi_config_dict:
+            self.segment_bytes(16777216)
+        else:
+            self.segment_bytes(int(self.kafi_config_dict["segment.bytes"]))
+        #
+        if "segment.messages" not in self.kafi_config_dict:
+            self.segment_messages(1000000)
+        else:
+            self.segment_messages(int(self.kafi_config_dict["segment.messages"]))
+        #
+        if "linger.ms" not in self.kafi_config_dict:
+            self.linger_ms(1000)
+        else:
+            self.linger_ms(int(self.kafi_config_dict["linger.ms"]))
+        #
+        if "file.delete.delay.ms" not in self.kafi_config_dict:
+            self.file_delete_delay_ms(60000)
+        else:
+            self.file_delete_delay_ms(int(self.kafi_config_dict["file.delete.delay.ms"]))
+        #
+        if "commit.interval.messages" not in self.kafi_config_dict:
+            self.commit_interval_messages(1000)
+        else:
+            self.commit_interval_messages(int(self.kafi_config_dict["commit.interval.messages"]))
+        #
+        if "commit.interval.ms" not in self.kafi_config_dict:
+            self.commit_interval_ms(5000)
+        else:
+            self.commit_interval_ms(int(self.kafi_config_dict["commit.interval.ms"]))
+        #
+        if "fetch.num.workers" not in self.kafi_config_dict:
+            # Only prefetch partition files concurrently from object stores by default.
+            self.fetch_num_workers(1 if "local" in mandatory_section_str_list else 8)
+        else:
+            self.fetch_num_workers(int(self.kafi_config_dict["fetch.num.workers"]))
+        #
+        if "fetch.max.bytes" not in self.kafi_config_dict:
+            self.fetch_max_bytes(67108864)
+        else:
+            self.fetch_max_bytes(int(self.kafi_config_dict["fetch.max.bytes"]))
+        #
+        if "fetch.mmap" not in self.kafi_config_dict:
+            self.fetch_mmap(False)
+        else:
+            self.fetch_mmap(bool(self.kafi_config_dict["fetch.mmap"]))
+        #
+        if "fetch.max.wait.ms" not in self.kafi_config_dict:
+            self.fetch_max_wait_ms(500)
+        else:
+            self.fetch_max_wait_ms(int(self.kafi_config_dict["fetch.max.wait.ms"]))
+        #
+        if "cache.dir" not in self.kafi_config_dict:
+            # No local disk cache by default.
+            self.cache_dir("")
+        else:
+            self.cache_dir(str(self.kafi_config_dict["cache.dir"]))
+        #
+        if "cache.max.bytes" not in self.kafi_config_dict:
+            self.cache_max_bytes(1073741824)
+        else:
+            self.cache_max_bytes(int(self.kafi_config_dict["cache.max.bytes"]))
+        #
+        if "metadata.max.age.ms" not in self.kafi_config_dict:
+            # Local file systems validate the cached metadata (file modification times) on every access by default.
+            self.metadata_max_age_ms(0 if "local" in mandatory_section_str_list else 1000)
+        else:
+            self.metadata_max_age_ms(int(self.kafi_config_dict["metadata.max.age.ms"]))
+        #
+        if "lock.lease.ms" not in self.kafi_config_dict:
+            self.lock_lease_ms(60000)
+        else:
+            self.lock_lease_ms(int(self.kafi_config_dict["lock.lease.ms"]))
+        #
+        if "lock.timeout.ms" not in self.kafi_config_dict:
+            self.lock_timeout_ms(60000)
+        else:
+            self.lock_timeout_ms(int(self.kafi_config_dict["lock.timeout.ms"]))
+        #
+        if "partition.assignment.strategy" not in self.kafi_config_dict:
+            self.partition_assignment_strategy("none")
+        else:
+            self.partition_assignment_strategy(str(self.kafi_config_dict["partition.assignment.strategy"]))
+        #
+        if "session.timeout.ms" not in self.kafi_config_dict:
+            self.session_timeout_ms(45000)
+        else:
+            self.session_timeout_ms(int(self.kafi_config_dict["session.timeout.ms"]))
+        #
+        if "heartbeat.interval.ms" not in self.kafi_config_dict:
+            self.heartbeat_interval_ms(3000)
+        else:
+            self.heartbeat_interval_ms(int(self.kafi_config_dict["heartbeat.interval.ms"]))
+        #
         self.admin = self.get_admin()
 
+    #
+
+    def merge_segments(self, pattern, target_bytes=None, **kwargs):
+        return self.admin.merge_segments(pattern, target_bytes, **kwargs)
+
+    def cp(self, source_topic, target_storage, target_topic, map_function=None, n=ALL_MESSAGES, flatmap_function=None, **kwargs):
+        raw_bool = kwargs["raw"] if "raw" in kwargs else False
+        if not raw_bool:
+            return super().cp(source_topic, target_storage, target_topic, map_function=map_function if map_function is not None else lambda x: x, n=n, flatmap_function=flatmap_function, **kwargs)
+        # Raw copy - copy the partition files (and their indexes) as they are instead of consuming, deserializing, serializing and producing the individual messages. The offsets (and timestamps, headers etc.) are kept exactly.
+        if not isinstance(target_storage, FS):
+            raise Exception("Raw copies are only supported between file systems (local file systems, S3 and Azure Blob Storage).")
+        #
+        if map_function is not None or flatmap_function is not None or n != ALL_MESSAGES:
+            raise Exception("Raw copies always copy whole topics as they are (without \"map_function\", \"flatmap_function\" or \"n\").")
+        #
+        num_messages_int = self.admin.copy_topic(source_topic, target_storage.admin, target_topic)
+        #
+        return (num_messages_int, num_messages_int)
+
+    def topic_to_arrow(self, topic, n=ALL_MESSAGES, **kwargs):
+        import pyarrow as pa
+        #
+        (key_type_str, value_type_str) = self.get_key_value_type_tuple(**kwargs)
+        auto_offset_reset_str = kwargs["config"]["auto.offset.reset"] if "config" in kwargs and "auto.offset.reset" in kwargs["config"] else self.auto_offset_reset()
+        # Read the record batches of topics in the Arrow segment format directly (instead of consuming and converting the individual messages) if the keys and values do not need to be deserialized and the whole topic is read from the beginning (no start offsets or group).
+        if self.admin.get_format(topic) != SEGMENT_FORMAT_ARROW or key_type_str.lower() not in ["bytes", "str"] or value_type_str.lower() not in ["bytes", "str"]:
+            return super().topic_to_arrow(topic, n, **kwargs)
+        if ("offsets" in kwargs and kwargs["offsets"] is not None) or "group" in kwargs or auto_offset_reset_str.lower() != "earliest":
+            return super().topic_to_arrow(topic, n, **kwargs)
+        #
+        table = self.admin.read_arrow_table(topic, n)
+        #
+        for column_str, type_str in [("key", key_type_str), ("value", value_type_str)]:
+            if type_str.lower() == "str":
+                table = table.set_column(table.schema.get_field_index(column_str), column_str, table.column(column_str).cast(pa.string()))
+        #
+        return table
+
+    # kafi
+
+    def segment_format(self, new_value=None): # str
+        return self.get_set_config("segment.format", new_value)
+
+    def index_interval_bytes(self, new_value=None): # int
+        return self.get_set_config("index.interval.bytes", new_value)
+
+    def segment_bytes(self, new_value=None): # int
+        return self.get_set_config("segment.bytes", new_value)
+
+    def segment_messages(self, new_value=None): # int
+        return self.get_set_config("segment.messages", new_value)
+
+    def linger_ms(self, new_value=None): # int
+        return self.get_set_config("linger.ms", new_value)
+
+    def file_delete_delay_ms(self, new_value=None): # int
+        return self.get_set_config("file.delete.delay.ms", new_value)
+
+    def commit_interval_messages(self, new_value=None): # int
+        return self.get_set_config("commit.interval.messages", new_value)
+
+    def commit_interval_ms(self, new_value=None): # int
+        return self.get_set_config("commit.interval.ms", new_value)
+
+    def fetch_num_workers(self, new_value=None): # int
+        return self.get_set_config("fetch.num.workers", new_value)
+
+    def fetch_max_bytes(self, new_value=None): # int
+        return self.get_set_config("fetch.max.bytes", new_value)
+
+    def fetch_mmap(self, new_value=None): # bool
+        return self.get_set_config("fetch.mmap", new_value)
+
+    def fetch_max_wait_ms(self, new_value=None): # int
+        return self.get_set_config("fetch.max.wait.ms", new_value)
+
+    def cache_dir(self, new_value=None): # str
+        return self.get_set_config("cache.dir", new_value)
+
+    def cache_max_bytes(self, new_value=None): # int
+        return self.get_set_config("cache.max.bytes", new_value)
+
+    def metadata_max_age_ms(self, new_value=None): # int
+        return self.get_set_config("metadata.max.age.ms", new_value)
+
+    def lock_lease_ms(self, new_value=None): # int
+        return self.get_set_config("lock.lease.ms", new_value)
+
+    def lock_timeout_ms(self, new_value=None): # int
+        return self.get_set_config("lock.timeout.ms", new_value)
+
+    def partition_assignment_strategy(self, new_value=None): # str
+        return self.get_set_config("partition.assignment.strategy", new_value)
+
+    def session_timeout_ms(self, new_value=None): # int
+        return self.get_set_config("session.timeout.ms", new_value)
+
+    def heartbeat_interval_ms(self, new_value=None): # int
+        return self.get_set_config("heartbeat.interval.ms", new_value)
+
     # azure_blob
 
     def container_name(self, new_value=None): # str
         return self.get_set_config("container.name", new_value, dict=self.azure_blob_config_dict)
 
+    # azure_blob and s3
+
+    def part_size(self, new_value=None): # int
+        return self.get_set_config("part.size", new_value, dict=self.azure_blob_config_dict if self.azure_blob_config_dict is not None else self.s3_config_dict)
+
+    def max_concurrency(self, new_value=None): # int
+        return self.get_set_config("max.concurrency", new_value, dict=self.azure_blob_config_dict if self.azure_blob_config_dict is not None else self.s3_config_dict)
+
     # local
     
     def root_dir(self, new_value=None): # str
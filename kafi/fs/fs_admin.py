@@ -1,23 +1,46 @@
 import ast
+import bisect
+from concurrent.futures import ThreadPoolExecutor
+import copy
 from fnmatch import fnmatch
 import os
+import random
+import socket
+import threading
+import time
+import uuid
 
 from kafi.storage_admin import StorageAdmin
+from kafi.fs.fs_cache import SegmentCache
+from kafi.fs.fs_segment import COMPRESSION_TYPE_NONE, SEGMENT_FORMAT_ARROW, SEGMENT_FORMAT_BINARY, SEGMENT_FORMAT_TEXT, SEGMENT_HEADER_SIZE, decode_segment, encode_offset_index, encode_segment, encode_time_index, find_offset_by_timestamp, find_position_by_offset, find_position_by_timestamp, check_compression_package, get_arrow_compression_str, get_arrow_schema, get_compression_codec_int, get_segment_format_str, read_arrow_record_batches
 from kafi.helpers import get_millis, pattern_match
 
+# Constants
+
+LOCK_MIN_BACKOFF_MS = 5
+LOCK_MAX_BACKOFF_MS = 500
+MANIFEST_LOCK = "manifest"
+
+#
+
 class FSAdmin(StorageAdmin):
     def __init__(self, fs_obj, **kwargs):
         super().__init__(fs_obj, **kwargs)
         #
         self.default_state_str = "stable"
+        #
+        # Cache of the parsed metadata/manifest/group files: abs_path_file_str -> (file version (mtime/ETag), last validation, dict).
+        self.abs_path_file_str_version_millis_dict_tuple_dict = {}
+        #
+        # Local disk cache of the partition and index files (S3 and Azure Blob Storage only, see get_segment_cache()).
+        self.segmentCache = None
 
     #
 
     def list_topics(self, pattern=None):
         root_dir_str = self.storage_obj.root_dir()
-        rel_dir_str_list = self.list_dirs(os.path.join(root_dir_str, "topics"))
-        #
-        all_topic_str_list = [rel_dir_str for rel_dir_str in rel_dir_str_list if not rel_dir_str.endswith("partitions")]
+        # Only list the topic directories themselves (instead of all the partition files of all topics).
+        all_topic_str_list = self.list_child_dirs(os.path.join(root_dir_str, "topics"))
         #
         topic_or_file_str_list = pattern_match(all_topic_str_list, pattern)
         #
@@ -25,11 +48,7 @@ class FSAdmin(StorageAdmin):
 
     def list_groups(self, pattern=None):
         root_dir_str = self.storage_obj.root_dir()
-        rel_file_str_list = self.list_files(os.path.join(root_dir_str, "groups"))
-        #
-        all_group_str_list = [rel_file_str for rel_file_str in rel_file_str_list]
-        all_group_str_set = set(all_group_str_list)
-        all_group_str_list = list(all_group_str_set)
+        all_group_str_list = list(self.list_file_versions(os.path.join(root_dir_str, "groups")).keys())
         #
         group_str_list = pattern_match(all_group_str_list, pattern)
         #
@@ -44,6 +63,8 @@ class FSAdmin(StorageAdmin):
         #
         if config_dict is not None:
             for topic_str in topic_str_list:
+                check_compression_type(self.get_format(topic_str), config_dict)
+                #
                 metadata_dict = self.get_metadata(topic_str)
                 metadata_dict["config"] = config_dict
                 self.set_metadata(topic_str, metadata_dict)
@@ -62,9 +83,15 @@ class FSAdmin(StorageAdmin):
         #
         config_dict = config
         partitions_int = partitions
+        format_str = kwargs["format"] if "format" in kwargs else self.storage_obj.segment_format()
+        #
+        # Fail early (instead of with each flush of the producers) if the compression type is not supported for the segment format.
+        check_compression_type(format_str, config_dict)
         #
-        metadata_dict = {"topic": topic_str, "partitions": partitions_int, "config": config_dict}
+        metadata_dict = {"topic": topic_str, "partitions": partitions_int, "config": config_dict, "format": format_str}
         self.set_metadata(topic_str, metadata_dict)
+        #
+        self.set_manifest(topic_str, {"partitions": {}})
     
     #
 
@@ -74,7 +101,9 @@ class FSAdmin(StorageAdmin):
         for topic_str in topic_str_list:
             topic_abs_dir_str = self.get_topic_abs_path_str(topic_str)
             #
+            # Delete the metadata file first (such that the topic does not exist anymore for concurrent consumers/producers while its other files are deleted, see get_manifest()).
             rel_file_str_list = self.list_files(topic_abs_dir_str)
+            rel_file_str_list.sort(key=lambda rel_file_str: rel_file_str != "metadata")
             for rel_file_str in rel_file_str_list:
                 self.delete_file(os.path.join(topic_abs_dir_str, rel_file_str))
             #
@@ -83,6 +112,8 @@ class FSAdmin(StorageAdmin):
                 self.delete_dir(os.path.join(topic_abs_dir_str, rel_dir_str))
             #
             self.delete_dir(topic_abs_dir_str)
+            #
+            self.invalidate_cache(os.path.join(topic_abs_dir_str, ""))
         #
         return topic_str_list
     
@@ -102,20 +133,20 @@ class FSAdmin(StorageAdmin):
             #
             for partition_int in range(partitions_int):
                 rel_file_str = self.storage_obj.admin.find_partition_file_str_by_timestamp(topic_str, partition_int, partition_int_timestamp_int_dict[partition_int])
+                if rel_file_str is None:
+                    continue
                 #
-                messages_bytes = self.storage_obj.admin.read_bytes(os.path.join(abs_topic_dir_str, "partitions", rel_file_str))
+                start_pos_int = self.storage_obj.admin.find_partition_file_position_by_timestamp(topic_str, rel_file_str, partition_int_timestamp_int_dict[partition_int])
                 #
-                message_bytes_list = messages_bytes.split(b"\n")[:-1]
+                (chunk_bytes_iterator, start_pos_int) = self.storage_obj.admin.read_segment_stream(os.path.join(abs_topic_dir_str, "partitions", rel_file_str), start_pos_int)
+                offset_int = find_offset_by_timestamp(chunk_bytes_iterator, partition_int_timestamp_int_dict[partition_int], start_pos_int)
+                chunk_bytes_iterator.close()
                 #
-                for message_bytes in message_bytes_list:
-                    message_dict = ast.literal_eval(message_bytes.decode("utf-8"))
+                if offset_int is not None:
+                    if topic_str not in topic_str_partition_int_offsets_int_dict_dict:
+                        topic_str_partition_int_offsets_int_dict_dict[topic_str] = {}
                     #
-                    if message_dict["timestamp"][1] >= partition_int_timestamp_int_dict[partition_int]:
-                        if topic_str not in topic_str_partition_int_offsets_int_dict_dict:
-                            topic_str_partition_int_offsets_int_dict_dict[topic_str] = {}
-                        #
-                        topic_str_partition_int_offsets_int_dict_dict[topic_str][partition_int] = message_dict["offset"]
-                        break
+                    topic_str_partition_int_offsets_int_dict_dict[topic_str][partition_int] = offset_int
         #
         return topic_str_partition_int_offsets_int_dict_dict
 
@@ -147,28 +178,7 @@ class FSAdmin(StorageAdmin):
         topic_str_list = self.list_topics(pattern)
         filtered_topic_str_list = pattern_match(topic_str_list, pattern)
         #
-        def get_watermark_offsets(topic_str, partition_int):
-            topic_abs_dir_str = self.get_topic_abs_path_str(topic_str)
-            rel_file_str_list = self.list_files(os.path.join(topic_abs_dir_str, "partitions"))
-            partition_rel_file_str_list = [rel_file_str for rel_file_str in rel_file_str_list if int(rel_file_str.split(",")[0]) == partition_int]
-            partition_rel_file_str_list.sort()
-            low_offset_int = 0
-            high_offset_int = 0
-            if len(partition_rel_file_str_list) > 0:
-                first_partition_rel_file_str = partition_rel_file_str_list[0]
-                last_partition_rel_file_str = partition_rel_file_str_list[-1]
-                #
-                low_offset_int = int(first_partition_rel_file_str.split(",")[1])
-                high_offset_int = int(last_partition_rel_file_str.split(",")[2]) + 1
-            #
-            return (low_offset_int, high_offset_int)
-        #
-
-        topic_str_partition_int_offsets_tuple_dict_dict = {}
-        for topic_str in filtered_topic_str_list:
-            partitions_int = self.get_partitions(topic_str)
-            partition_int_offsets_tuple_dict = {partition_int: get_watermark_offsets(topic_str, partition_int) for partition_int in range(partitions_int)}
-            topic_str_partition_int_offsets_tuple_dict_dict[topic_str] = partition_int_offsets_tuple_dict
+        topic_str_partition_int_offsets_tuple_dict_dict = {topic_str: self.get_watermarks(topic_str) for topic_str in filtered_topic_str_list}
         #
         return topic_str_partition_int_offsets_tuple_dict_dict
 
@@ -193,39 +203,34 @@ class FSAdmin(StorageAdmin):
         #
         return file_abs_file_str
 
-    def find_partition_file_str_by_offset(self, topic_str, partition_int, to_find_offset_int):
-        # Get sorted list of all relative file names rel_file_str_list for the partition files for partition_int of topic_str.
+    def list_partition_files(self, topic_str):
         topic_abs_dir_str = self.get_topic_abs_path_str(topic_str)
-        rel_file_str_list1 = self.list_files(os.path.join(topic_abs_dir_str, "partitions"))
-        rel_file_str_list = [rel_file_str for rel_file_str in rel_file_str_list1 if int(rel_file_str.split(",")[0]) == partition_int]
-        if rel_file_str_list == []:
+        rel_file_str_list = self.list_files(os.path.join(topic_abs_dir_str, "partitions"))
+        # Filter out the index files (e.g. "<partition file>.index").
+        partition_rel_file_str_list = [rel_file_str for rel_file_str in rel_file_str_list if "." not in rel_file_str]
+        #
+        return partition_rel_file_str_list
+
+    def find_partition_file_str_by_offset(self, topic_str, partition_int, to_find_offset_int):
+        rel_file_str_list = self.get_partition_files(topic_str, partition_int)
+        # Binary search for the last file starting at or before to_find_offset_int (the file names are sorted by start offset).
+        start_offset_int_list = [int(rel_file_str.split(",")[1]) for rel_file_str in rel_file_str_list]
+        index_int = bisect.bisect_right(start_offset_int_list, to_find_offset_int) - 1
+        if index_int < 0:
+            return None
+        #
+        found_rel_file_str = rel_file_str_list[index_int]
+        if to_find_offset_int > int(found_rel_file_str.split(",")[2]):
             return None
-        rel_file_str_list.sort()
-        # Now find the first file in which the message with offset to_find_offset_int is contained :)
-        rel_file_str_start_offset_int_end_offset_int_tuple_dict = {rel_file_str: (int(rel_file_str.split(",")[1]), int(rel_file_str.split(",")[2])) for rel_file_str in rel_file_str_list}
-        found_rel_file_str = None
-        for rel_file_str, start_offset_int_end_offset_int_tuple in rel_file_str_start_offset_int_end_offset_int_tuple_dict.items():
-            (start_offset_int, end_offset_int) = start_offset_int_end_offset_int_tuple
-            #
-            if to_find_offset_int >= start_offset_int and to_find_offset_int <= end_offset_int:
-                found_rel_file_str = rel_file_str
-                break
         #
         return found_rel_file_str
 
     def find_partition_file_str_by_timestamp(self, topic_str, partition_int, to_find_timestamp_int):
-        # Get sorted list of all relative file names rel_file_str_list for the partition files for partition_int of topic_str.
-        topic_abs_dir_str = self.get_topic_abs_path_str(topic_str)
-        rel_file_str_list1 = self.list_files(os.path.join(topic_abs_dir_str, "partitions"))
-        rel_file_str_list = [rel_file_str for rel_file_str in rel_file_str_list1 if int(rel_file_str.split(",")[0]) == partition_int]
-        if rel_file_str_list == []:
-            return None
-        rel_file_str_list.sort()
-        # Now find the first file in which the message with timestamp to_find_timestamp_int is be contained :)
-        rel_file_str_start_timestamp_int_end_timestamp_int_tuple_dict = {rel_file_str: (int(rel_file_str.split(",")[3]), int(rel_file_str.split(",")[4])) for rel_file_str in rel_file_str_list}
+        rel_file_str_list = self.get_partition_files(topic_str, partition_int)
+        # Find the first file in which the message with timestamp to_find_timestamp_int is contained :)
         found_rel_file_str = None
-        for rel_file_str, start_timestamp_int_end_timestamp_int_tuple in rel_file_str_start_timestamp_int_end_timestamp_int_tuple_dict.items():
-            (start_timestamp_int, end_timestamp_int) = start_timestamp_int_end_timestamp_int_tuple
+        for rel_file_str in rel_file_str_list:
+            (start_timestamp_int, end_timestamp_int) = (int(rel_file_str.split(",")[3]), int(rel_file_str.split(",")[4]))
             #
             if to_find_timestamp_int >= start_timestamp_int and to_find_timestamp_int <= end_timestamp_int:
                 found_rel_file_str = rel_file_str
@@ -233,21 +238,381 @@ class FSAdmin(StorageAdmin):
         #
         return found_rel_file_str
 
-    def get_partition_files(self, topic_str):
-        topic_abs_dir_str = self.get_topic_abs_path_str(topic_str)
+    def get_partition_files(self, topic_str, partition_int=None):
+        manifest_dict = self.get_manifest(topic_str)
+        #
+        if partition_int is not None:
+            return manifest_dict["partitions"].get(partition_int, [])
         #
         partitions_int = self.get_partitions(topic_str)
         #
-        rel_file_str_list = self.list_files(os.path.join(topic_abs_dir_str, "partitions"))
+        partition_int_rel_file_str_list_dict = {partition_int: manifest_dict["partitions"].get(partition_int, []) for partition_int in range(partitions_int)}
+        #
+        return partition_int_rel_file_str_list_dict
+
+    def get_watermarks(self, topic_str):
+        partition_int_rel_file_str_list_dict = self.get_partition_files(topic_str)
         #
-        def sort(list):
-            list.sort()
-            return list
+        partition_int_offsets_tuple_dict = {}
+        for partition_int, rel_file_str_list in partition_int_rel_file_str_list_dict.items():
+            low_offset_int = 0
+            high_offset_int = 0
+            if len(rel_file_str_list) > 0:
+                low_offset_int = int(rel_file_str_list[0].split(",")[1])
+                high_offset_int = int(rel_file_str_list[-1].split(",")[2]) + 1
+            #
+            partition_int_offsets_tuple_dict[partition_int] = (low_offset_int, high_offset_int)
         #
+        return partition_int_offsets_tuple_dict
 
-        partition_int_rel_file_str_list_dict = {partition_int: sort([rel_file_str for rel_file_str in rel_file_str_list if int(rel_file_str.split(",")[0]) == partition_int]) for partition_int in range(partitions_int)}
+    # Manifest
+    #
+    # The manifest of a topic records the (sorted) partition files of each partition, e.g. {"partitions": {0: ["000000000,000000000000000000000,000000000000000000002,1700000000000,1700000000001"]}}. It is updated with each append such that watermarks and partition files can be looked up without listing the partition files.
+
+    def get_manifest_abs_path_str(self, topic_str):
+        manifest_abs_path_str = os.path.join(self.get_topic_abs_path_str(topic_str), "manifest")
         #
-        return partition_int_rel_file_str_list_dict
+        return manifest_abs_path_str
+
+    def get_manifest(self, topic_str, cached=True):
+        manifest_dict = self.read_dict_from_file(self.get_manifest_abs_path_str(topic_str), cached)
+        #
+        if manifest_dict == {}:
+            # Do not (re)create the manifest (and hence the topic directory) of a topic which does not exist (anymore).
+            if not self.exists_topic(topic_str):
+                raise Exception(f"Topic \"{topic_str}\" does not exist.")
+            # Topics created by older versions of kafi do not have a manifest yet - create it once from the partition files.
+            manifest_dict = self.create_manifest(topic_str)
+        #
+        return manifest_dict
+
+    def create_manifest(self, topic_str):
+        partition_int_rel_file_str_list_dict = {}
+        for rel_file_str in self.list_partition_files(topic_str):
+            partition_int = int(rel_file_str.split(",")[0])
+            #
+            if partition_int not in partition_int_rel_file_str_list_dict:
+                partition_int_rel_file_str_list_dict[partition_int] = []
+            partition_int_rel_file_str_list_dict[partition_int].append(rel_file_str)
+        #
+        for partition_int, rel_file_str_list in partition_int_rel_file_str_list_dict.items():
+            # Skip partition files whose offsets are already covered by a merged partition file (whose deletion has been deferred, see merge_segments()).
+            rel_file_str_list.sort(key=lambda rel_file_str: (int(rel_file_str.split(",")[1]), -int(rel_file_str.split(",")[2])))
+            #
+            covered_rel_file_str_list = []
+            for rel_file_str in rel_file_str_list:
+                if len(covered_rel_file_str_list) == 0 or int(rel_file_str.split(",")[1]) > int(covered_rel_file_str_list[-1].split(",")[2]):
+                    covered_rel_file_str_list.append(rel_file_str)
+            #
+            partition_int_rel_file_str_list_dict[partition_int] = covered_rel_file_str_list
+        #
+        manifest_dict = {"partitions": partition_int_rel_file_str_list_dict}
+        self.set_manifest(topic_str, manifest_dict)
+        #
+        return manifest_dict
+
+    def set_manifest(self, topic_str, manifest_dict):
+        self.write_dict_to_file(self.get_manifest_abs_path_str(topic_str), manifest_dict)
+
+    def add_partition_files(self, topic_str, partition_int_rel_file_str_dict):
+        # Serialize the read-modify-writes of the manifest (e.g. of producers appending to different partitions of the same topic).
+        lock_token_str = self.acquire_lock(topic_str, MANIFEST_LOCK)
+        try:
+            manifest_dict = self.get_manifest(topic_str, cached=False)
+            #
+            for partition_int, rel_file_str in partition_int_rel_file_str_dict.items():
+                if partition_int not in manifest_dict["partitions"]:
+                    manifest_dict["partitions"][partition_int] = []
+                manifest_dict["partitions"][partition_int].append(rel_file_str)
+            #
+            self.set_manifest(topic_str, manifest_dict)
+        finally:
+            self.release_lock(topic_str, MANIFEST_LOCK, lock_token_str)
+        #
+        return manifest_dict
+
+    def replace_partition_files(self, topic_str, partition_int, old_rel_file_str_list, new_rel_file_str):
+        lock_token_str = self.acquire_lock(topic_str, MANIFEST_LOCK)
+        try:
+            manifest_dict = self.get_manifest(topic_str, cached=False)
+            #
+            rel_file_str_list = manifest_dict["partitions"][partition_int]
+            index_int = rel_file_str_list.index(old_rel_file_str_list[0])
+            if rel_file_str_list[index_int:index_int + len(old_rel_file_str_list)] != old_rel_file_str_list:
+                raise Exception(f"Partition files of partition {partition_int} of topic \"{topic_str}\" changed during merge.")
+            #
+            manifest_dict["partitions"][partition_int] = rel_file_str_list[:index_int] + [new_rel_file_str] + rel_file_str_list[index_int + len(old_rel_file_str_list):]
+            # Do not delete the old partition files immediately - consumers might still read them based on the previous version of the manifest.
+            if "deleted" not in manifest_dict:
+                manifest_dict["deleted"] = []
+            manifest_dict["deleted"] += [(old_rel_file_str, get_millis()) for old_rel_file_str in old_rel_file_str_list]
+            #
+            self.set_manifest(topic_str, manifest_dict)
+        finally:
+            self.release_lock(topic_str, MANIFEST_LOCK, lock_token_str)
+        #
+        return manifest_dict
+
+    def delete_expired_partition_files(self, topic_str):
+        manifest_dict = self.get_manifest(topic_str, cached=False)
+        #
+        if "deleted" not in manifest_dict or len(manifest_dict["deleted"]) == 0:
+            return []
+        #
+        now_millis_int = get_millis()
+        expired_rel_file_str_list = [rel_file_str for rel_file_str, deleted_millis_int in manifest_dict["deleted"] if now_millis_int - deleted_millis_int >= self.storage_obj.file_delete_delay_ms()]
+        #
+        topic_abs_dir_str = self.get_topic_abs_path_str(topic_str)
+        for rel_file_str in expired_rel_file_str_list:
+            for abs_path_file_str in [os.path.join(topic_abs_dir_str, "partitions", rel_file_str), self.get_offset_index_abs_path_str(topic_str, rel_file_str), self.get_time_index_abs_path_str(topic_str, rel_file_str)]:
+                if self.exists_file(abs_path_file_str):
+                    self.delete_file(abs_path_file_str)
+        #
+        lock_token_str = self.acquire_lock(topic_str, MANIFEST_LOCK)
+        try:
+            manifest_dict = self.get_manifest(topic_str, cached=False)
+            manifest_dict["deleted"] = [(rel_file_str, deleted_millis_int) for rel_file_str, deleted_millis_int in manifest_dict["deleted"] if rel_file_str not in expired_rel_file_str_list]
+            self.set_manifest(topic_str, manifest_dict)
+        finally:
+            self.release_lock(topic_str, MANIFEST_LOCK, lock_token_str)
+        #
+        return expired_rel_file_str_list
+
+    # Merge segments
+
+    def merge_segments(self, pattern, target_bytes=None, **kwargs):
+        target_bytes_int = target_bytes if target_bytes is not None else self.storage_obj.segment_bytes()
+        #
+        topic_str_list = self.list_topics(pattern)
+        #
+        topic_str_partition_int_num_files_int_dict_dict = {}
+        for topic_str in topic_str_list:
+            self.delete_expired_partition_files(topic_str)
+            #
+            topic_abs_dir_str = self.get_topic_abs_path_str(topic_str)
+            format_str = self.get_format(topic_str)
+            #
+            # Get the sizes of the partition files from one listing (such that only the partition files which are actually merged are read).
+            rel_file_str_size_int_dict = self.list_file_sizes(os.path.join(topic_abs_dir_str, "partitions"))
+            #
+            partition_int_rel_file_str_list_dict = self.get_partition_files(topic_str)
+            for partition_int, rel_file_str_list in partition_int_rel_file_str_list_dict.items():
+                # Greedily group adjacent partition files until the group would exceed target_bytes (and merge each group as soon as it is complete to only keep one group in memory).
+                group_rel_file_str_list = []
+                group_bytes_int = 0
+                for rel_file_str in rel_file_str_list:
+                    size_int = rel_file_str_size_int_dict[rel_file_str]
+                    #
+                    if len(group_rel_file_str_list) > 0 and group_bytes_int + size_int > target_bytes_int:
+                        if len(group_rel_file_str_list) > 1:
+                            self.merge_partition_files(topic_str, partition_int, format_str, group_rel_file_str_list)
+                        #
+                        group_rel_file_str_list = []
+                        group_bytes_int = 0
+                    #
+                    group_rel_file_str_list.append(rel_file_str)
+                    group_bytes_int += size_int
+                #
+                if len(group_rel_file_str_list) > 1:
+                    self.merge_partition_files(topic_str, partition_int, format_str, group_rel_file_str_list)
+            #
+            topic_str_partition_int_num_files_int_dict_dict[topic_str] = {partition_int: len(rel_file_str_list) for partition_int, rel_file_str_list in self.get_partition_files(topic_str).items()}
+        #
+        return topic_str_partition_int_num_files_int_dict_dict
+
+    def merge_partition_files(self, topic_str, partition_int, format_str, old_rel_file_str_list):
+        topic_abs_dir_str = self.get_topic_abs_path_str(topic_str)
+        #
+        message_dict_list = []
+        for rel_file_str in old_rel_file_str_list:
+            message_dict_list += decode_segment(self.read_bytes(os.path.join(topic_abs_dir_str, "partitions", rel_file_str)), topic_str)
+        #
+        # Keep the offset and timestamp ranges encoded in the file names consistent with those of the merged files.
+        start_offset_int = int(old_rel_file_str_list[0].split(",")[1])
+        end_offset_int = int(old_rel_file_str_list[-1].split(",")[2])
+        start_timestamp_int = int(old_rel_file_str_list[0].split(",")[3])
+        end_timestamp_int = int(old_rel_file_str_list[-1].split(",")[4])
+        #
+        new_rel_file_str = f"{partition_int:09},{start_offset_int:021},{end_offset_int:021},{start_timestamp_int},{end_timestamp_int}"
+        #
+        # Use the current compression type of the topic (such that existing topics can be (re)compressed by merging their partition files).
+        (messages_bytes, index_tuple_list) = encode_segment(format_str, partition_int, message_dict_list, self.storage_obj.index_interval_bytes(), self.get_compression_type(topic_str))
+        #
+        self.write_bytes(os.path.join(self.get_topic_abs_path_str(topic_str), "partitions", new_rel_file_str), messages_bytes)
+        if len(index_tuple_list) > 0:
+            self.write_bytes(self.get_offset_index_abs_path_str(topic_str, new_rel_file_str), encode_offset_index(index_tuple_list))
+            self.write_bytes(self.get_time_index_abs_path_str(topic_str, new_rel_file_str), encode_time_index(index_tuple_list))
+        # Atomically switch to the merged partition file (by writing the new manifest) only once it has been written completely.
+        self.replace_partition_files(topic_str, partition_int, old_rel_file_str_list, new_rel_file_str)
+
+    def read_arrow_table(self, topic_str, n_int=-1):
+        import pyarrow as pa
+        #
+        if self.get_format(topic_str) != SEGMENT_FORMAT_ARROW:
+            raise Exception(f"Topic \"{topic_str}\" does not use the \"{SEGMENT_FORMAT_ARROW}\" segment format.")
+        #
+        topic_abs_dir_str = self.get_topic_abs_path_str(topic_str)
+        # Collect the record batches of all partition files as they are (the columns of the resulting table reference the read buffers without copying).
+        # Read the partition files round-robin like the consumers (such that the first n rows are the first n messages a consumer would read).
+        partition_int_rel_file_str_list_dict = self.get_partition_files(topic_str)
+        max_num_files_int = max([len(rel_file_str_list) for rel_file_str_list in partition_int_rel_file_str_list_dict.values()], default=0)
+        rel_file_str_list = [partition_int_rel_file_str_list_dict[partition_int][file_counter_int] for file_counter_int in range(max_num_files_int) for partition_int in sorted(partition_int_rel_file_str_list_dict.keys()) if len(partition_int_rel_file_str_list_dict[partition_int]) > file_counter_int]
+        #
+        recordBatch_list = []
+        num_rows_int = 0
+        for rel_file_str in rel_file_str_list:
+            if n_int != -1 and num_rows_int >= n_int:
+                break
+            #
+            for recordBatch in read_arrow_record_batches(pa.py_buffer(self.read_segment_bytes(os.path.join(topic_abs_dir_str, "partitions", rel_file_str)))):
+                recordBatch_list.append(recordBatch)
+                num_rows_int += recordBatch.num_rows
+        #
+        table = pa.Table.from_batches(recordBatch_list, schema=get_arrow_schema())
+        #
+        return table.slice(0, n_int) if n_int != -1 else table
+
+    # Raw copies
+
+    def copy_topic(self, topic_str, target_admin, target_topic_str):
+        if target_admin.list_topics(target_topic_str) != []:
+            raise Exception(f"Topic \"{target_topic_str}\" already exists (raw copies keep the offsets and hence cannot append to existing topics).")
+        #
+        target_admin.create(target_topic_str, partitions=self.get_partitions(topic_str), config=self.get_config(topic_str), format=self.get_format(topic_str))
+        #
+        # Copy the partition files listed by the manifest (a consistent snapshot, without the merged partition files whose deletion has been deferred) together with their indexes as they are.
+        manifest_dict = self.get_manifest(topic_str, cached=False)
+        partition_int_rel_file_str_list_dict = manifest_dict["partitions"]
+        #
+        topic_abs_dir_str = self.get_topic_abs_path_str(topic_str)
+        target_topic_abs_dir_str = target_admin.get_topic_abs_path_str(target_topic_str)
+        existing_rel_file_str_set = set(self.list_files(os.path.join(topic_abs_dir_str, "partitions")))
+        #
+        source_target_abs_path_file_str_tuple_list = []
+        for rel_file_str_list in partition_int_rel_file_str_list_dict.values():
+            for rel_file_str in rel_file_str_list:
+                for copied_rel_file_str in [rel_file_str, f"{rel_file_str}.index", f"{rel_file_str}.timeindex"]:
+                    if copied_rel_file_str in existing_rel_file_str_set:
+                        source_target_abs_path_file_str_tuple_list.append((os.path.join(topic_abs_dir_str, "partitions", copied_rel_file_str), os.path.join(target_topic_abs_dir_str, "partitions", copied_rel_file_str)))
+        #
+        num_workers_int = max(1, self.storage_obj.fetch_num_workers(), target_admin.storage_obj.fetch_num_workers())
+        with ThreadPoolExecutor(max_workers=num_workers_int) as threadPoolExecutor:
+            list(threadPoolExecutor.map(lambda source_target_abs_path_file_str_tuple: target_admin.copy_file(self, *source_target_abs_path_file_str_tuple), source_target_abs_path_file_str_tuple_list))
+        #
+        # Only make the copied partition files visible once they have all been copied.
+        target_admin.set_manifest(target_topic_str, {"partitions": partition_int_rel_file_str_list_dict})
+        #
+        num_messages_int = sum(int(rel_file_str.split(",")[2]) - int(rel_file_str.split(",")[1]) + 1 for rel_file_str_list in partition_int_rel_file_str_list_dict.values() for rel_file_str in rel_file_str_list)
+        #
+        return num_messages_int
+
+    def copy_file(self, source_admin, source_abs_path_file_str, target_abs_path_file_str):
+        # Copy between different storages through the client (the admins override this with server-side/in-kernel copies where possible).
+        self.write_bytes(target_abs_path_file_str, source_admin.read_bytes(source_abs_path_file_str))
+
+    # Indexes
+
+    def get_offset_index_abs_path_str(self, topic_str, rel_file_str):
+        offset_index_abs_path_str = os.path.join(self.get_topic_abs_path_str(topic_str), "partitions", f"{rel_file_str}.index")
+        #
+        return offset_index_abs_path_str
+
+    def get_time_index_abs_path_str(self, topic_str, rel_file_str):
+        time_index_abs_path_str = os.path.join(self.get_topic_abs_path_str(topic_str), "partitions", f"{rel_file_str}.timeindex")
+        #
+        return time_index_abs_path_str
+
+    def find_partition_file_position_by_offset(self, topic_str, rel_file_str, to_find_offset_int):
+        offset_index_abs_path_str = self.get_offset_index_abs_path_str(topic_str, rel_file_str)
+        # Partition files without an index (e.g. small ones or those written by older versions of kafi) are read from the beginning.
+        if not self.exists_file(offset_index_abs_path_str):
+            return 0
+        #
+        offset_index_bytes = self.read_segment_bytes(offset_index_abs_path_str)
+        pos_int = find_position_by_offset(offset_index_bytes, to_find_offset_int)
+        #
+        return pos_int
+
+    def find_partition_file_position_by_timestamp(self, topic_str, rel_file_str, to_find_timestamp_int):
+        time_index_abs_path_str = self.get_time_index_abs_path_str(topic_str, rel_file_str)
+        #
+        if not self.exists_file(time_index_abs_path_str):
+            return 0
+        #
+        time_index_bytes = self.read_segment_bytes(time_index_abs_path_str)
+        pos_int = find_position_by_timestamp(time_index_bytes, to_find_timestamp_int)
+        #
+        return pos_int
+
+    # Segment cache
+
+    def get_segment_cache(self):
+        cache_dir_str = self.storage_obj.cache_dir()
+        if cache_dir_str == "":
+            return None
+        #
+        if self.storage_obj.local_config_dict is not None:
+            raise Exception("\"cache.dir\" is only supported for S3 and Azure Blob Storage.")
+        #
+        if self.segmentCache is None or self.segmentCache.cache_dir_str != cache_dir_str:
+            self.segmentCache = SegmentCache(cache_dir_str, self.storage_obj.cache_max_bytes())
+        elif self.segmentCache.cache_max_bytes_int != self.storage_obj.cache_max_bytes():
+            # Shrink the cache right away if cache.max.bytes has been lowered.
+            self.segmentCache.cache_max_bytes_int = self.storage_obj.cache_max_bytes()
+            self.segmentCache.evict()
+        #
+        return self.segmentCache
+
+    def get_segment_cache_key_str(self, abs_path_file_str, version):
+        # Implemented by the object store admins (the key must identify the bucket/container as well).
+        raise Exception("\"cache.dir\" is only supported for S3 and Azure Blob Storage.")
+
+    def read_segment_bytes(self, abs_path_file_str):
+        segmentCache = self.get_segment_cache()
+        if segmentCache is None:
+            return self.read_bytes(abs_path_file_str)
+        # Partition and index files are never changed once written, but a deleted topic can be re-created with the same file names - hence, the cached files are keyed by name and version (ETag), i.e. a hit only costs a metadata request.
+        version = self.get_file_version(abs_path_file_str)
+        if version is None:
+            return self.read_bytes(abs_path_file_str)
+        #
+        key_str = self.get_segment_cache_key_str(abs_path_file_str, version)
+        data_bytes = segmentCache.read_bytes(key_str)
+        if data_bytes is None:
+            data_bytes = self.read_bytes(abs_path_file_str)
+            segmentCache.write_bytes(key_str, data_bytes)
+        #
+        return data_bytes
+
+    def read_segment_stream(self, abs_path_file_str, start_pos_int=0):
+        # Return the chunks of a partition file to be decoded from start_pos_int (e.g. a position from the offset/time index) and the start position to pass to the decoder (see decode_segment_stream()).
+        segmentCache = self.get_segment_cache()
+        if segmentCache is None:
+            return self.read_segment_range_stream(abs_path_file_str, start_pos_int)
+        #
+        version = self.get_file_version(abs_path_file_str)
+        if version is None:
+            return self.read_segment_range_stream(abs_path_file_str, start_pos_int)
+        #
+        key_str = self.get_segment_cache_key_str(abs_path_file_str, version)
+        chunk_bytes_generator = segmentCache.read_stream(key_str)
+        if chunk_bytes_generator is not None:
+            return (chunk_bytes_generator, start_pos_int)
+        # Only cache partition files which are read completely (and do not download the whole partition file just to cache it).
+        if start_pos_int > SEGMENT_HEADER_SIZE:
+            return self.read_segment_range_stream(abs_path_file_str, start_pos_int)
+        # Write the file to the cache while it is streamed to the caller.
+        return (segmentCache.write_stream(key_str, self.read_stream(abs_path_file_str)), start_pos_int)
+
+    def read_segment_range_stream(self, abs_path_file_str, start_pos_int):
+        if start_pos_int <= SEGMENT_HEADER_SIZE:
+            return (self.read_stream(abs_path_file_str), start_pos_int)
+        # Only read (i.e. on object stores: only transfer) the bytes from start_pos_int on. Binary segments are decoded from their header followed by the batches from start_pos_int on (hence, the header is read separately); text segments do not have a header.
+        header_bytes = self.read_bytes(abs_path_file_str, 0, SEGMENT_HEADER_SIZE)
+        if get_segment_format_str(header_bytes) == SEGMENT_FORMAT_BINARY:
+            return (prepend_chunk_bytes(header_bytes, self.read_stream(abs_path_file_str, start_pos_int)), SEGMENT_HEADER_SIZE)
+        else:
+            return (self.read_stream(abs_path_file_str, start_pos_int), 0)
 
     #
 
@@ -259,6 +624,12 @@ class FSAdmin(StorageAdmin):
             group_abs_path_file_str = os.path.join(root_dir_str, "groups", f"{group_str}")
             #
             self.delete_file(group_abs_path_file_str)
+            self.invalidate_cache(group_abs_path_file_str)
+            #
+            members_abs_path_file_str = self.get_members_abs_path_str(group_str)
+            if self.exists_file(members_abs_path_file_str):
+                self.delete_file(members_abs_path_file_str)
+                self.invalidate_cache(members_abs_path_file_str)
         #
         return group_str_list
 
@@ -271,54 +642,76 @@ class FSAdmin(StorageAdmin):
         return group_str_group_description_dict_dict
 
     def groups(self, pattern="*", state_pattern="*", state=False):
-        state_pattern_str_list = [state_pattern] if isinstance(state_pattern, str) else state_pattern
         state_bool = state
         #
-        group_str_list = self.list_groups(pattern)
-        #
-        group_str_state_str_tuple_list = [(group_str, self.get_group_state(group_str)) for group_str in group_str_list]
-        group_str_state_str_tuple_list = [(group_str, state_str) for group_str, state_str in group_str_state_str_tuple_list if any(fnmatch(state_str, state_pattern_str) for state_pattern_str in state_pattern_str_list)]
+        group_str_group_dict_dict = self.get_indexed_group_dicts(pattern, state_pattern)
         #
         if state_bool:
-            group_str_state_str_dict = {group_str: state_str for group_str, state_str in group_str_state_str_tuple_list}
+            group_str_state_str_dict = {group_str: group_dict["state"] for group_str, group_dict in group_str_group_dict_dict.items()}
             return group_str_state_str_dict
         else:
-            group_str_list = [group_str for group_str, _ in group_str_state_str_tuple_list]
+            group_str_list = list(group_str_group_dict_dict.keys())
             return group_str_list
 
     def group_offsets(self, pattern, group_offsets=None, state_pattern="*"):
         topic_str_offsets_dict_dict = group_offsets
         #
-        group_str_list = self.groups(pattern, state_pattern)
+        group_str_group_dict_dict = self.get_indexed_group_dicts(pattern, state_pattern)
         #
         if topic_str_offsets_dict_dict is not None:
-            for group_str in group_str_list:
+            for group_str in group_str_group_dict_dict:
                 new_group_dict = {"offsets": topic_str_offsets_dict_dict}
-                self.set_group_dict(group_str, new_group_dict)
+                group_str_group_dict_dict[group_str] = self.set_group_dict(group_str, new_group_dict)
         #
-        group_str_topic_str_offsets_dict_dict_dict = {group_str: self.get_group_dict(group_str)["offsets"] for group_str in group_str_list}
+        group_str_topic_str_offsets_dict_dict_dict = {group_str: group_dict["offsets"] for group_str, group_dict in group_str_group_dict_dict.items()}
         #
         return group_str_topic_str_offsets_dict_dict_dict
 
     # Metadata/Groups
 
-    def read_dict_from_file(self, abs_path_file_str):
-        if self.exists_file(abs_path_file_str):
-            data_str = self.read_str(abs_path_file_str)
-            #
-            if data_str is not None:
-                data_dict = ast.literal_eval(data_str)
-            else:
-                data_dict = {}
+    def read_dict_from_file(self, abs_path_file_str, cached=True):
+        now_millis_int = get_millis()
+        #
+        if cached and abs_path_file_str in self.abs_path_file_str_version_millis_dict_tuple_dict:
+            (version, validated_millis_int, data_dict) = self.abs_path_file_str_version_millis_dict_tuple_dict[abs_path_file_str]
+            # Within metadata.max.age.ms after the last validation, return the cached dict without any I/O.
+            if now_millis_int - validated_millis_int < self.storage_obj.metadata_max_age_ms():
+                return copy.deepcopy(data_dict)
+        else:
+            version = None
+        #
+        # Otherwise only read (and parse) the file again if its version has changed.
+        new_version = self.get_file_version(abs_path_file_str)
+        if new_version is None:
+            self.invalidate_cache(abs_path_file_str)
+            return {}
+        #
+        if version is not None and version == new_version:
+            self.abs_path_file_str_version_millis_dict_tuple_dict[abs_path_file_str] = (version, now_millis_int, data_dict)
+            return copy.deepcopy(data_dict)
+        #
+        data_str = self.read_str(abs_path_file_str)
+        #
+        if data_str is not None:
+            data_dict = ast.literal_eval(data_str)
         else:
             data_dict = {}
         #
-        return data_dict
+        self.abs_path_file_str_version_millis_dict_tuple_dict[abs_path_file_str] = (new_version, now_millis_int, data_dict)
+        #
+        return copy.deepcopy(data_dict)
 
     def write_dict_to_file(self, abs_path_file_str, data_dict):
         data_str = str(data_dict)
         #
         self.write_str(abs_path_file_str, data_str)
+        # Keep the written dict in the cache (without a version, such that it is read again after metadata.max.age.ms).
+        self.abs_path_file_str_version_millis_dict_tuple_dict[abs_path_file_str] = (None, get_millis(), copy.deepcopy(data_dict))
+
+    def invalidate_cache(self, abs_path_file_str_prefix):
+        for abs_path_file_str in list(self.abs_path_file_str_version_millis_dict_tuple_dict.keys()):
+            if abs_path_file_str.startswith(abs_path_file_str_prefix):
+                self.abs_path_file_str_version_millis_dict_tuple_dict.pop(abs_path_file_str, None)
 
     # Metadata
 
@@ -328,6 +721,10 @@ class FSAdmin(StorageAdmin):
         #
         return metadata_dict
 
+    def exists_topic(self, topic_str):
+        # A topic exists as long as its metadata file exists (it is written first by create() and deleted first by delete()).
+        return self.exists_file(os.path.join(self.get_topic_abs_path_str(topic_str), "metadata"))
+
     def get_partitions(self, topic_str):
         metadata_dict = self.get_metadata(topic_str)
         partitions_int = metadata_dict["partitions"]
@@ -340,6 +737,19 @@ class FSAdmin(StorageAdmin):
         #
         return config_dict
 
+    def get_format(self, topic_str):
+        metadata_dict = self.get_metadata(topic_str)
+        # Topics created before the binary segment format was introduced do not have a "format" entry.
+        format_str = metadata_dict["format"] if "format" in metadata_dict else SEGMENT_FORMAT_TEXT
+        #
+        return format_str
+
+    def get_compression_type(self, topic_str):
+        config_dict = self.get_config(topic_str)
+        compression_type_str = str(config_dict["compression.type"]) if "compression.type" in config_dict else COMPRESSION_TYPE_NONE
+        #
+        return compression_type_str
+
     def set_metadata(self, topic_str, metadata_dict):
         topic_dir_str = self.get_topic_abs_path_str(topic_str)
         self.write_dict_to_file(os.path.join(topic_dir_str, "metadata"), metadata_dict)
@@ -353,6 +763,51 @@ class FSAdmin(StorageAdmin):
         #
         return state_str
 
+    def get_group_index_abs_path_str(self):
+        group_index_abs_path_str = os.path.join(self.storage_obj.root_dir(), "indexes", "groups")
+        #
+        return group_index_abs_path_str
+
+    def get_indexed_group_dicts(self, pattern="*", state_pattern="*"):
+        state_pattern_str_list = [state_pattern] if isinstance(state_pattern, str) else state_pattern
+        # List the group files (including their versions) and filter them by the pattern before any per-group I/O.
+        root_dir_str = self.storage_obj.root_dir()
+        group_str_version_dict = self.list_file_versions(os.path.join(root_dir_str, "groups"))
+        group_str_list = pattern_match(list(group_str_version_dict.keys()), pattern)
+        # Get the group dicts from the group index (one read), and only read those group files which have been changed (or created) since they were last indexed.
+        group_index_dict = self.read_dict_from_file(self.get_group_index_abs_path_str())
+        #
+        changed_group_str_group_dict_dict = {}
+        for group_str in group_str_list:
+            if group_str not in group_index_dict or group_index_dict[group_str]["version"] != group_str_version_dict[group_str]:
+                group_dict = self.read_dict_from_file(os.path.join(root_dir_str, "groups", group_str), cached=False)
+                if group_dict == {}:
+                    continue
+                #
+                changed_group_str_group_dict_dict[group_str] = {"version": group_str_version_dict[group_str], **group_dict}
+        #
+        deleted_group_str_list = [group_str for group_str in group_index_dict if group_str not in group_str_version_dict]
+        #
+        if len(changed_group_str_group_dict_dict) > 0 or len(deleted_group_str_list) > 0:
+            group_index_dict = self.update_group_index(changed_group_str_group_dict_dict, group_str_version_dict)
+        #
+        group_str_group_dict_dict = {group_str: {key_str: value for key_str, value in group_index_dict[group_str].items() if key_str != "version"} for group_str in group_str_list if group_str in group_index_dict}
+        group_str_group_dict_dict = {group_str: group_dict for group_str, group_dict in group_str_group_dict_dict.items() if any(fnmatch(group_dict["state"], state_pattern_str) for state_pattern_str in state_pattern_str_list)}
+        #
+        return group_str_group_dict_dict
+
+    def update_group_index(self, changed_group_str_group_dict_dict, group_str_version_dict):
+        group_index_abs_path_str = self.get_group_index_abs_path_str()
+        # Do not use the cache for read-modify-write. Index entries lost to concurrent updates are simply re-indexed by the next reader (their versions do not match anymore).
+        group_index_dict = self.read_dict_from_file(group_index_abs_path_str, cached=False)
+        #
+        group_index_dict.update(changed_group_str_group_dict_dict)
+        group_index_dict = {group_str: group_dict for group_str, group_dict in group_index_dict.items() if group_str in group_str_version_dict}
+        #
+        self.write_dict_to_file(group_index_abs_path_str, group_index_dict)
+        #
+        return group_index_dict
+
     def get_group_dict(self, group_str):
         root_dir_str = self.storage_obj.root_dir()
         abs_path_file_str = os.path.join(root_dir_str, "groups", f"{group_str}")
@@ -364,27 +819,186 @@ class FSAdmin(StorageAdmin):
     def set_group_dict(self, group_str, new_group_dict):
         root_dir_str = self.storage_obj.root_dir()
         abs_path_file_str = os.path.join(root_dir_str, "groups", f"{group_str}")
+        # Serialize the read-modify-writes of the group file (e.g. of the members of a group committing offsets for different partitions).
+        lock_token_str = self.acquire_group_lock(group_str)
+        try:
+            # Do not use the cache for read-modify-write.
+            group_dict = self.read_dict_from_file(abs_path_file_str, cached=False)
+            #
+            if "offsets" in new_group_dict:
+                for topic_str, offsets_dict in new_group_dict["offsets"].items():
+                    if "offsets" not in group_dict:
+                        group_dict["offsets"] = {}
+                    if topic_str not in group_dict["offsets"]:
+                        group_dict["offsets"][topic_str] = {}
+                    #
+                    for partition_int, offset_int in offsets_dict.items():
+                        group_dict["offsets"][topic_str][partition_int] = offset_int
+            #
+            if "last_update" in new_group_dict:
+                group_dict["last_update"] = new_group_dict["last_update"]
+            else:
+                group_dict["last_update"] = get_millis()
+            #
+            if "state" in new_group_dict:
+                group_dict["state"] = new_group_dict["state"]
+            #
+            self.write_dict_to_file(abs_path_file_str, group_dict)
+        finally:
+            self.release_group_lock(group_str, lock_token_str)
         #
-        group_dict = self.read_dict_from_file(abs_path_file_str)
+        return group_dict
+
+    # Group members
+
+    def get_members_abs_path_str(self, group_str):
+        members_abs_path_str = os.path.join(self.storage_obj.root_dir(), "members", group_str)
         #
-        if "offsets" in new_group_dict:
-            for topic_str, offsets_dict in new_group_dict["offsets"].items():
-                if "offsets" not in group_dict:
-                    group_dict["offsets"] = {}
-                if topic_str not in group_dict["offsets"]:
-                    group_dict["offsets"][topic_str] = {}
-                #
-                for partition_int, offset_int in offsets_dict.items():
-                    group_dict["offsets"][topic_str][partition_int] = offset_int
+        return members_abs_path_str
+
+    def get_members(self, group_str):
+        members_dict = self.read_dict_from_file(self.get_members_abs_path_str(group_str), cached=False)
         #
-        if "last_update" in new_group_dict:
-            group_dict["last_update"] = new_group_dict["last_update"]
-        else:
-            group_dict["last_update"] = get_millis()
+        now_millis_int = get_millis()
+        members_dict = {member_id_str: member_dict for member_id_str, member_dict in members_dict.items() if member_dict["expires"] > now_millis_int}
         #
-        if "state" in new_group_dict:
-            group_dict["state"] = new_group_dict["state"]
+        return members_dict
+
+    def heartbeat(self, group_str, member_id_str, topic_str_list, session_timeout_ms_int, leave=False):
+        leave_bool = leave
         #
-        self.write_dict_to_file(abs_path_file_str, group_dict)
+        lock_token_str = self.acquire_group_lock(group_str)
+        try:
+            # Members which have not sent a heartbeat within their session timeout are removed from the group.
+            members_dict = self.get_members(group_str)
+            members_dict.pop(member_id_str, None)
+            #
+            if not leave_bool:
+                members_dict[member_id_str] = {"topics": topic_str_list, "expires": get_millis() + session_timeout_ms_int}
+            #
+            self.write_dict_to_file(self.get_members_abs_path_str(group_str), members_dict)
+        finally:
+            self.release_group_lock(group_str, lock_token_str)
         #
-        return group_dict
+        return members_dict
+
+    # Locks
+
+    def get_lock_abs_path_str(self, topic_str, lock_str):
+        lock_abs_path_str = os.path.join(self.get_topic_abs_path_str(topic_str), "locks", lock_str)
+        #
+        return lock_abs_path_str
+
+    def get_group_lock_abs_path_str(self, group_str):
+        group_lock_abs_path_str = os.path.join(self.storage_obj.root_dir(), "locks", "groups", group_str)
+        #
+        return group_lock_abs_path_str
+
+    def acquire_lock(self, topic_str, lock_str):
+        return self.acquire_lock_file(self.get_lock_abs_path_str(topic_str, lock_str))
+
+    def release_lock(self, topic_str, lock_str, lock_token_str):
+        self.release_lock_file(self.get_lock_abs_path_str(topic_str, lock_str), lock_token_str)
+
+    def acquire_group_lock(self, group_str):
+        return self.acquire_lock_file(self.get_group_lock_abs_path_str(group_str))
+
+    def release_group_lock(self, group_str, lock_token_str):
+        self.release_lock_file(self.get_group_lock_abs_path_str(group_str), lock_token_str)
+
+    def acquire_lock_file(self, abs_path_file_str):
+        lock_token_str = f"{socket.gethostname()},{os.getpid()},{threading.get_ident()},{uuid.uuid4().hex}"
+        #
+        start_millis_int = get_millis()
+        backoff_ms_int = LOCK_MIN_BACKOFF_MS
+        while True:
+            # Lock files are leases - if their owner crashed, they can be broken after lock.lease.ms.
+            lock_dict = {"owner": lock_token_str, "expires": get_millis() + self.storage_obj.lock_lease_ms()}
+            if self.create_file_exclusive(abs_path_file_str, str(lock_dict)):
+                return lock_token_str
+            # Remember the version of the lock file (before reading it) such that the lease is only broken if the lock file has not been broken and acquired again by another waiter in the meantime.
+            lock_version = self.get_lock_file_version(abs_path_file_str)
+            if lock_version is None:
+                # The lock file has been released (or broken) in the meantime.
+                continue
+            #
+            other_lock_dict = self.read_lock_dict(abs_path_file_str)
+            if other_lock_dict is not None:
+                expired_bool = get_millis() > other_lock_dict["expires"]
+            else:
+                # Lock files which cannot be read (e.g. left empty by an owner which crashed between creating and writing them) expire lock.lease.ms after their last modification.
+                mtime_millis_int = self.get_file_mtime_millis(abs_path_file_str)
+                expired_bool = mtime_millis_int is not None and get_millis() - mtime_millis_int > self.storage_obj.lock_lease_ms()
+            #
+            if expired_bool:
+                self.delete_file_if_version(abs_path_file_str, lock_version)
+                continue
+            #
+            if get_millis() - start_millis_int > self.storage_obj.lock_timeout_ms():
+                raise Exception(f"Could not acquire lock \"{abs_path_file_str}\" within {self.storage_obj.lock_timeout_ms()} ms.")
+            #
+            time.sleep(random.uniform(0.5, 1.0) * backoff_ms_int / 1000)
+            backoff_ms_int = min(backoff_ms_int * 2, LOCK_MAX_BACKOFF_MS)
+
+    def release_lock_file(self, abs_path_file_str, lock_token_str):
+        # Only delete the lock file if it has not been broken (and acquired by someone else) in the meantime.
+        lock_version = self.get_lock_file_version(abs_path_file_str)
+        lock_dict = self.read_lock_dict(abs_path_file_str)
+        if lock_version is not None and lock_dict is not None and lock_dict["owner"] == lock_token_str:
+            self.delete_file_if_version(abs_path_file_str, lock_version)
+
+    def read_lock_dict(self, abs_path_file_str):
+        try:
+            lock_dict = ast.literal_eval(self.read_str(abs_path_file_str))
+        except Exception:
+            # The lock file has been deleted in the meantime (or not been written completely yet).
+            lock_dict = None
+        #
+        return lock_dict if isinstance(lock_dict, dict) else None
+
+    def get_lock_file_version(self, abs_path_file_str):
+        # By default, the versions of lock files are those of get_file_version() (e.g. ETags on S3 and Azure Blob Storage, see delete_file_if_version()).
+        return self.get_file_version(abs_path_file_str)
+
+# Helpers
+
+def check_compression_type(format_str, config_dict):
+    compression_type_str = config_dict["compression.type"] if "compression.type" in config_dict else None
+    #
+    if format_str == SEGMENT_FORMAT_ARROW:
+        arrow_compression_str = get_arrow_compression_str(compression_type_str)
+        if arrow_compression_str is not None:
+            import pyarrow as pa
+            #
+            if not pa.Codec.is_available(arrow_compression_str):
+                raise Exception(f"Compression type \"{compression_type_str}\" is not supported by the installed pyarrow.")
+    else:
+        compression_codec_int = get_compression_codec_int(compression_type_str)
+        if compression_codec_int != 0 and format_str == SEGMENT_FORMAT_TEXT:
+            raise Exception(f"Compression is only supported for the \"{SEGMENT_FORMAT_BINARY}\" and \"{SEGMENT_FORMAT_ARROW}\" segment formats.")
+        #
+        check_compression_package(compression_codec_int)
+
+
+def get_range_assignment(members_dict, topic_str, partitions_int):
+    # Like Kafka's range assignor: the partitions are split into consecutive ranges (the first members get one more partition if the partitions cannot be split evenly).
+    member_id_str_list = sorted([member_id_str for member_id_str, member_dict in members_dict.items() if topic_str in member_dict["topics"]])
+    #
+    member_id_str_partition_int_list_dict = {}
+    if len(member_id_str_list) > 0:
+        (partitions_per_member_int, remaining_partitions_int) = divmod(partitions_int, len(member_id_str_list))
+        for index_int, member_id_str in enumerate(member_id_str_list):
+            start_partition_int = index_int * partitions_per_member_int + min(index_int, remaining_partitions_int)
+            num_partitions_int = partitions_per_member_int + (1 if index_int < remaining_partitions_int else 0)
+            member_id_str_partition_int_list_dict[member_id_str] = list(range(start_partition_int, start_partition_int + num_partitions_int))
+    #
+    return member_id_str_partition_int_list_dict
+
+
+def prepend_chunk_bytes(first_chunk_bytes, chunk_bytes_generator):
+    # Like itertools.chain(), but closing the returned generator also closes the underlying stream (e.g. returns the connection to the pool).
+    try:
+        yield first_chunk_bytes
+        yield from chunk_bytes_generator
+    finally:
+        chunk_bytes_generator.close()
@@ -0,0 +1,176 @@
+from collections import OrderedDict
+import hashlib
+import os
+import threading
+import uuid
+
+# Constants
+
+READ_STREAM_CHUNK_SIZE = 1048576
+TMP_FILE_SUFFIX = ".tmp"
+
+#
+
+# Size-bounded LRU cache of immutable files (partition and index files of S3/Azure Blob Storage topics) on the local disk. The cached files are named by the hash of their key (e.g. object name and ETag), written to temporary files first and then atomically renamed (such that several processes can share the same cache directory), and evicted by least recent use. The sizes and the order of use are kept in memory (seeded from one scan of the cache directory by modification time, which is updated on each hit), i.e. inserting a file does not scan the cache directory again - files added by other processes in the meantime are only accounted for by the next SegmentCache of the same directory.
+class SegmentCache:
+    def __init__(self, cache_dir_str, cache_max_bytes_int):
+        self.cache_dir_str = cache_dir_str
+        self.cache_max_bytes_int = cache_max_bytes_int
+        #
+        os.makedirs(self.cache_dir_str, exist_ok=True)
+        #
+        self.lock = threading.Lock()
+        #
+        # Least recently used first.
+        self.abs_path_str_size_int_ordereddict = OrderedDict()
+        self.total_size_int = 0
+        #
+        size_int_mtime_float_abs_path_str_tuple_list = []
+        for dirEntry in os.scandir(self.cache_dir_str):
+            if dirEntry.name.endswith(TMP_FILE_SUFFIX):
+                continue
+            #
+            try:
+                stat_result = dirEntry.stat()
+            except FileNotFoundError:
+                continue
+            size_int_mtime_float_abs_path_str_tuple_list.append((stat_result.st_size, stat_result.st_mtime, dirEntry.path))
+        #
+        for size_int, _, abs_path_str in sorted(size_int_mtime_float_abs_path_str_tuple_list, key=lambda x: x[1]):
+            self.abs_path_str_size_int_ordereddict[abs_path_str] = size_int
+            self.total_size_int += size_int
+        #
+        self.evict()
+
+    #
+
+    def get_cache_abs_path_str(self, key_str):
+        cache_abs_path_str = os.path.join(self.cache_dir_str, hashlib.sha256(key_str.encode("utf-8")).hexdigest())
+        #
+        return cache_abs_path_str
+
+    def open(self, key_str):
+        cache_abs_path_str = self.get_cache_abs_path_str(key_str)
+        # Cache miss (or evicted by another process in the meantime).
+        try:
+            bufferedReader = open(cache_abs_path_str, "rb")
+        except FileNotFoundError:
+            with self.lock:
+                self.forget(cache_abs_path_str)
+            return None
+        # Mark the file as recently used.
+        with self.lock:
+            if cache_abs_path_str in self.abs_path_str_size_int_ordereddict:
+                self.abs_path_str_size_int_ordereddict.move_to_end(cache_abs_path_str)
+        try:
+            os.utime(cache_abs_path_str)
+        except FileNotFoundError:
+            pass
+        #
+        return bufferedReader
+
+    #
+
+    def read_bytes(self, key_str):
+        bufferedReader = self.open(key_str)
+        if bufferedReader is None:
+            return None
+        #
+        with bufferedReader:
+            data_bytes = bufferedReader.read()
+        #
+        return data_bytes
+
+    def read_stream(self, key_str):
+        bufferedReader = self.open(key_str)
+        if bufferedReader is None:
+            return None
+        #
+        def chunk_bytes_generator():
+            with bufferedReader:
+                while True:
+                    chunk_bytes = bufferedReader.read(READ_STREAM_CHUNK_SIZE)
+                    if not chunk_bytes:
+                        break
+                    #
+                    yield chunk_bytes
+        #
+        return chunk_bytes_generator()
+
+    #
+
+    def write_bytes(self, key_str, data_bytes):
+        # Files larger than the whole cache are not cached.
+        if len(data_bytes) > self.cache_max_bytes_int:
+            return
+        #
+        tmp_abs_path_str = self.get_tmp_abs_path_str(key_str)
+        with open(tmp_abs_path_str, "wb") as bufferedWriter:
+            bufferedWriter.write(data_bytes)
+        #
+        self.commit(key_str, tmp_abs_path_str)
+
+    def write_stream(self, key_str, chunk_bytes_generator):
+        # Pass the chunks through to the caller while writing them to a temporary file. The file is only added to the cache if the stream has been read completely.
+        tmp_abs_path_str = self.get_tmp_abs_path_str(key_str)
+        bufferedWriter = open(tmp_abs_path_str, "wb")
+        size_int = 0
+        completed_bool = False
+        try:
+            for chunk_bytes in chunk_bytes_generator:
+                if bufferedWriter is not None:
+                    size_int += len(chunk_bytes)
+                    if size_int > self.cache_max_bytes_int:
+                        bufferedWriter.close()
+                        bufferedWriter = None
+                        os.remove(tmp_abs_path_str)
+                    else:
+                        bufferedWriter.write(chunk_bytes)
+                #
+                yield chunk_bytes
+            #
+            completed_bool = True
+        finally:
+            chunk_bytes_generator.close()
+            #
+            if bufferedWriter is not None:
+                bufferedWriter.close()
+                if completed_bool:
+                    self.commit(key_str, tmp_abs_path_str)
+                else:
+                    os.remove(tmp_abs_path_str)
+
+    def get_tmp_abs_path_str(self, key_str):
+        tmp_abs_path_str = f"{self.get_cache_abs_path_str(key_str)}.{uuid.uuid4().hex}{TMP_FILE_SUFFIX}"
+        #
+        return tmp_abs_path_str
+
+    def commit(self, key_str, tmp_abs_path_str):
+        cache_abs_path_str = self.get_cache_abs_path_str(key_str)
+        size_int = os.path.getsize(tmp_abs_path_str)
+        #
+        with self.lock:
+            os.replace(tmp_abs_path_str, cache_abs_path_str)
+            #
+            self.forget(cache_abs_path_str)
+            self.abs_path_str_size_int_ordereddict[cache_abs_path_str] = size_int
+            self.total_size_int += size_int
+        #
+        self.evict()
+
+    def forget(self, abs_path_str):
+        size_int = self.abs_path_str_size_int_ordereddict.pop(abs_path_str, None)
+        if size_int is not None:
+            self.total_size_int -= size_int
+
+    def evict(self):
+        with self.lock:
+            # Remove the least recently used files until the cache fits into cache.max.bytes again.
+            while self.total_size_int > self.cache_max_bytes_int and len(self.abs_path_str_size_int_ordereddict) > 0:
+                (abs_path_str, size_int) = self.abs_path_str_size_int_ordereddict.popitem(last=False)
+                self.total_size_int -= size_int
+                #
+                try:
+                    os.remove(abs_path_str)
+                except FileNotFoundError:
+                    pass
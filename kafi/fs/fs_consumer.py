@@ -1,21 +1,26 @@
-import ast
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import os
+import socket
+import time
+import uuid
 
-from kafi.storage_consumer import StorageConsumer
+from kafi.cursor_consumer import CursorConsumer
+from kafi.fs.fs_admin import get_range_assignment, prepend_chunk_bytes
+from kafi.fs.fs_segment import decode_segment_buffer, decode_segment_stream
+from kafi.helpers import get_millis
 
 # Constants
 
-ALL_MESSAGES = -1
-OFFSET_INVALID = -1001
+PARTITION_ASSIGNMENT_STRATEGY_NONE = "none"
+PARTITION_ASSIGNMENT_STRATEGY_RANGE = "range"
+FOLLOW_MIN_BACKOFF_MS = 10
 
 #
 
-class FSConsumer(StorageConsumer):
+class FSConsumer(CursorConsumer):
     def __init__(self, fs_obj, *topics, **kwargs):
         super().__init__(fs_obj, *topics, **kwargs)
-        #  required for commit() without offsets.
-        # Initialize self.next_topic_str_offsets_dict_dict
-        self.next_topic_str_offsets_dict_dict = {topic_str: {partition_int: OFFSET_INVALID for partition_int in range(self.storage_obj.admin.get_partitions(topic_str))} for topic_str in self.topic_str_list}
         # Initialize/update group dict file.
         group_dict = self.storage_obj.admin.get_group_dict(self.group_str)
         if group_dict == {}:
@@ -25,56 +30,119 @@ class FSConsumer(StorageConsumer):
                 # if there are no offsets for the topic yet, use the defaults.
                 group_dict["offsets"][topic_str] = self.next_topic_str_offsets_dict_dict[topic_str]
         self.storage_obj.admin.set_group_dict(self.group_str, group_dict)
-            
+        #
+        # Partition files are prefetched concurrently by fetch.num.workers threads (keeping at most about fetch.max.bytes of prefetched partition files in memory).
+        self.fetch_num_workers_int = int(self.consumer_config_dict["fetch.num.workers"]) if "fetch.num.workers" in self.consumer_config_dict else fs_obj.fetch_num_workers()
+        self.fetch_max_bytes_int = int(self.consumer_config_dict["fetch.max.bytes"]) if "fetch.max.bytes" in self.consumer_config_dict else fs_obj.fetch_max_bytes()
+        #
+        # Memory-map partition files instead of reading them (local file systems only).
+        self.fetch_mmap_bool = bool(self.consumer_config_dict["fetch.mmap"]) if "fetch.mmap" in self.consumer_config_dict else fs_obj.fetch_mmap()
+        if self.fetch_mmap_bool and fs_obj.local_config_dict is None:
+            raise Exception("\"fetch.mmap\" is only supported for local file systems.")
+        #
+        # In follow mode, wait at most this long between two checks for new partition files.
+        self.fetch_max_wait_ms_int = int(self.consumer_config_dict["fetch.max.wait.ms"]) if "fetch.max.wait.ms" in self.consumer_config_dict else fs_obj.fetch_max_wait_ms()
+        #
+        # Split the partitions between the members of the group (partition.assignment.strategy == range) or read all partitions (none).
+        self.partition_assignment_strategy_str = str(self.consumer_config_dict["partition.assignment.strategy"]) if "partition.assignment.strategy" in self.consumer_config_dict else fs_obj.partition_assignment_strategy()
+        if self.partition_assignment_strategy_str not in [PARTITION_ASSIGNMENT_STRATEGY_NONE, PARTITION_ASSIGNMENT_STRATEGY_RANGE]:
+            raise Exception(f"Only \"{PARTITION_ASSIGNMENT_STRATEGY_NONE}\" and \"{PARTITION_ASSIGNMENT_STRATEGY_RANGE}\" supported for \"partition.assignment.strategy\".")
+        #
+        self.session_timeout_ms_int = int(self.consumer_config_dict["session.timeout.ms"]) if "session.timeout.ms" in self.consumer_config_dict else fs_obj.session_timeout_ms()
+        self.heartbeat_interval_ms_int = int(self.consumer_config_dict["heartbeat.interval.ms"]) if "heartbeat.interval.ms" in self.consumer_config_dict else fs_obj.heartbeat_interval_ms()
+        #
+        self.member_id_str = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.topic_str_assigned_partition_int_list_dict = {topic_str: list(range(self.storage_obj.admin.get_partitions(topic_str))) for topic_str in self.topic_str_list}
+        self.last_heartbeat_millis_int = None
+        self.rebalanced_bool = False
+        #
+        if self.partition_assignment_strategy_str == PARTITION_ASSIGNMENT_STRATEGY_RANGE:
+            self.heartbeat()
+
     #
 
-    def close(self):
+    def leave_group(self):
+        if self.partition_assignment_strategy_str == PARTITION_ASSIGNMENT_STRATEGY_RANGE:
+            # The remaining members take over the partitions of this consumer with their next heartbeat.
+            members_dict = self.storage_obj.admin.heartbeat(self.group_str, self.member_id_str, self.topic_str_list, self.session_timeout_ms_int, leave=True)
+            if len(members_dict) > 0:
+                return
+        #
         new_group_dict = {"state": "empty"}
         self.storage_obj.admin.set_group_dict(self.group_str, new_group_dict)
-    
+
+    def heartbeat(self):
+        members_dict = self.storage_obj.admin.heartbeat(self.group_str, self.member_id_str, self.topic_str_list, self.session_timeout_ms_int)
+        self.last_heartbeat_millis_int = get_millis()
+        #
+        topic_str_assigned_partition_int_list_dict = {}
+        for topic_str in self.topic_str_list:
+            member_id_str_partition_int_list_dict = get_range_assignment(members_dict, topic_str, self.storage_obj.admin.get_partitions(topic_str))
+            topic_str_assigned_partition_int_list_dict[topic_str] = member_id_str_partition_int_list_dict[self.member_id_str]
+        #
+        if topic_str_assigned_partition_int_list_dict != self.topic_str_assigned_partition_int_list_dict:
+            # Rebalance - commit the offsets of the messages read/processed so far before giving up any partitions.
+            self.commit_pending()
+            self.topic_str_assigned_partition_int_list_dict = topic_str_assigned_partition_int_list_dict
+            self.rebalanced_bool = True
+        #
+        return self.topic_str_assigned_partition_int_list_dict
+
+    def heartbeat_if_due(self):
+        if self.partition_assignment_strategy_str == PARTITION_ASSIGNMENT_STRATEGY_RANGE and get_millis() - self.last_heartbeat_millis_int >= self.heartbeat_interval_ms_int:
+            self.heartbeat()
+
+    def assignment(self):
+        return self.topic_str_assigned_partition_int_list_dict
+
     #
-  
-    def foldl(self, foldl_function, initial_acc, n=ALL_MESSAGES, commit_after_processing=None, **kwargs):
-        n_int = n
+
+    def is_cursor_stale(self):
+        # Restart from the committed offsets of the (newly) assigned partitions after a rebalance.
+        return self.rebalanced_bool
+
+    def close_cursor(self):
+        super().close_cursor()
         #
-        commit_after_processing_bool = self.storage_obj.commit_after_processing() if commit_after_processing is None else commit_after_processing
+        self.rebalanced_bool = False
+
+    def topics_exist(self):
+        return all(self.storage_obj.admin.exists_topic(topic_str) for topic_str in self.topic_str_list)
+
+    def get_topic_versions(self):
+        topic_str_manifest_version_dict = self.get_manifest_versions()
+        # Refresh the cached manifests (within metadata.max.age.ms, the new cursor would otherwise not see the partition files added in the meantime).
+        for topic_str in self.topic_str_list:
+            self.storage_obj.admin.get_manifest(topic_str, cached=False)
         #
-        auto_offset_reset_str = self.consumer_config_dict["auto.offset.reset"]
+        return topic_str_manifest_version_dict
+
+    def get_manifest_versions(self):
+        topic_str_manifest_version_dict = {topic_str: self.storage_obj.admin.get_file_version(self.storage_obj.admin.get_manifest_abs_path_str(topic_str)) for topic_str in self.topic_str_list}
         #
-        message_counter_int = 0
-        acc = initial_acc
-        rel_file_str_list = []
+        return topic_str_manifest_version_dict
+
+    def wait_for_new_messages(self, topic_str_manifest_version_dict):
+        # Poll the versions of the manifests (a stat() on local file systems, a HEAD request on S3 and Azure Blob Storage) with exponential backoff up to fetch.max.wait.ms.
+        backoff_ms_int = FOLLOW_MIN_BACKOFF_MS
+        while self.get_manifest_versions() == topic_str_manifest_version_dict:
+            self.heartbeat_if_due()
+            if self.rebalanced_bool:
+                break
+            #
+            time.sleep(backoff_ms_int / 1000)
+            backoff_ms_int = min(backoff_ms_int * 2, self.fetch_max_wait_ms_int)
+
+    def read_messages(self, **kwargs):
         for topic_str in self.topic_str_list:
             partitions_int = self.storage_obj.admin.get_partitions(topic_str)
             #
-            # Get start offsets.
-            start_offsets_dict = self.topic_str_start_offsets_dict_dict[topic_str] if self.topic_str_start_offsets_dict_dict is not None and topic_str in self.topic_str_start_offsets_dict_dict else None
+            self.heartbeat_if_due()
             #
-            if start_offsets_dict is None:
-                # If we got no start offsets, try to get the start offsets from the group.
-                group_dict = self.storage_obj.admin.get_group_dict(self.group_str)
-                group_offsets_dict = group_dict["offsets"][topic_str]
-                #
-                if any(group_offsets_dict[partition_int] == OFFSET_INVALID for partition_int in range(partitions_int)):
-                    # If any of the partitions still does not have a committed offset yet...
-                    if auto_offset_reset_str.lower() == "latest":
-                        # If auto.offset.reset == latest, start offsets = last offsets.
-                        partition_int_offset_tuple_dict = self.watermarks(topic_str, **kwargs)[topic_str]
-                        auto_offset_reset_offsets_dict = {partition_int: offset_tuple[1] for partition_int, offset_tuple in partition_int_offset_tuple_dict.items()}
-                    elif auto_offset_reset_str.lower() == "earliest":
-                        # If auto.offset.reset == earliest, start offsets = 0
-                        auto_offset_reset_offsets_dict = {partition_int: 0 for partition_int in range(partitions_int)}
-                    else:
-                        raise Exception("Only \"earliest\" and \"latest\" supported for \"auto.offset.reset\".")
-                    # ...and for each partition still not having a committed offset yet, use the auto.offset.reset one.
-                    start_offsets_dict = {}
-                    for partition_int, offset_int in group_offsets_dict.items():
-                        if offset_int == OFFSET_INVALID:
-                            start_offsets_dict[partition_int] = auto_offset_reset_offsets_dict[partition_int]
-                        else:
-                            start_offsets_dict[partition_int] = group_offsets_dict[partition_int]
-                else:
-                    start_offsets_dict = group_offsets_dict
+            # Get start offsets (only for the partitions assigned to this consumer).
+            start_offsets_dict = {partition_int: offset_int for partition_int, offset_int in self.get_start_offsets(topic_str).items() if partition_int in self.topic_str_assigned_partition_int_list_dict[topic_str]}
+            # Keep the resolved start offsets as the positions (e.g. such that the next cursor does not resolve auto.offset.reset == latest again).
+            self.topic_str_position_dict_dict[topic_str] = dict(start_offsets_dict)
             #
             # Get partition files for all partitions.
             partition_int_rel_file_str_list_dict = self.storage_obj.admin.get_partition_files(topic_str)
@@ -89,8 +157,9 @@ class FSConsumer(StorageConsumer):
             partition_int_to_be_consume_rel_file_str_list_dict = {partition_int: [rel_file_str for rel_file_str in rel_file_str_list if partition_int in partition_int_first_partition_rel_file_str_dict and rel_file_str >= partition_int_first_partition_rel_file_str_dict[partition_int]] for partition_int, rel_file_str_list in partition_int_rel_file_str_list_dict.items()}
             #
             # Create list of partition files to read.
+            rel_file_str_list = []
             file_counter_int = 0
-            max_num_files_int = max([len(to_be_consume_rel_file_str_list) for to_be_consume_rel_file_str_list in partition_int_to_be_consume_rel_file_str_list_dict.values()])
+            max_num_files_int = max([len(to_be_consume_rel_file_str_list) for to_be_consume_rel_file_str_list in partition_int_to_be_consume_rel_file_str_list_dict.values()], default=0)
             #
             for file_counter_int in range(max_num_files_int):
                 for partition_int in range(partitions_int):
@@ -98,49 +167,108 @@ class FSConsumer(StorageConsumer):
                         if len(partition_int_to_be_consume_rel_file_str_list_dict[partition_int]) > file_counter_int:
                             rel_file_str_list.append(partition_int_to_be_consume_rel_file_str_list_dict[partition_int][file_counter_int])
             #
-            abs_topic_dir_str = self.storage_obj.admin.get_topic_abs_path_str(topic_str)
-            for rel_file_str in rel_file_str_list:
-                messages_bytes = self.storage_obj.admin.read_bytes(os.path.join(abs_topic_dir_str, "partitions", rel_file_str))
-                #
-                message_bytes_list = messages_bytes.split(b"\n")[:-1]
-                #
-                for message_bytes in message_bytes_list:
-                    message_dict = ast.literal_eval(message_bytes.decode("utf-8"))
-                    #
-                    message_dict["key"] = self.deserialize(message_dict["key"], self.topic_str_key_type_str_dict[message_dict["topic"]], topic_str=topic_str, key_bool=True)
-                    #
-                    message_dict["value"] = self.deserialize(message_dict["value"], self.topic_str_value_type_str_dict[message_dict["topic"]], topic_str=topic_str, key_bool=False)
-                    #
-                    partition_int = message_dict["partition"]
-                    self.next_topic_str_offsets_dict_dict[topic_str][partition_int] = message_dict["offset"] + 1
-                    if self.enable_auto_commit_bool:
-                        # Commit immediately after reading the message if enable.auto.commit == True
-                        self.commit()
-                    #
-                    if message_dict["offset"] >= start_offsets_dict[partition_int]:
-                        acc = foldl_function(acc, message_dict)
-                        #
-                        message_counter_int += 1
-                        #
-                        if not self.enable_auto_commit_bool and commit_after_processing_bool:
-                            # Only commit once the message has been processed if enable.auto.commit == False and commit.after.processing == True
-                            self.commit()
+            # The first partition file of each partition is read from the start offset on (see read_partition_files()).
+            rel_file_str_start_offset_int_dict = {first_partition_rel_file_str: start_offsets_dict[partition_int] for partition_int, first_partition_rel_file_str in partition_int_first_partition_rel_file_str_dict.items()}
+            #
+            rel_file_str_chunk_bytes_iterator_tuple_generator = self.read_partition_files(topic_str, rel_file_str_list, rel_file_str_start_offset_int_dict)
+            chunk_bytes_iterator_or_buffer = None
+            try:
+                for rel_file_str, chunk_bytes_iterator_or_buffer, start_pos_int in rel_file_str_chunk_bytes_iterator_tuple_generator:
+                    start_offset_int = rel_file_str_start_offset_int_dict[rel_file_str] if rel_file_str in rel_file_str_start_offset_int_dict else 0
                     #
-                    if n_int != ALL_MESSAGES:
-                        if message_counter_int >= n_int:
-                            return acc
-        #
-        return acc
-
-    #
+                    if self.fetch_mmap_bool:
+                        message_dict_list_generator = decode_segment_buffer(chunk_bytes_iterator_or_buffer, topic_str, start_pos_int, start_offset_int)
+                    else:
+                        message_dict_list_generator = decode_segment_stream(chunk_bytes_iterator_or_buffer, topic_str, start_pos_int, start_offset_int)
+                    # Decode the partition file incrementally while it is read (batch by batch/line by line).
+                    for message_dict_list in message_dict_list_generator:
+                        for message_dict in message_dict_list:
+                            partition_int = message_dict["partition"]
+                            #
+                            if message_dict["offset"] < start_offsets_dict[partition_int]:
+                                continue
+                            #
+                            self.heartbeat_if_due()
+                            if partition_int not in self.topic_str_assigned_partition_int_list_dict[topic_str]:
+                                # Skip the messages of partitions which have been assigned to another member of the group in the meantime.
+                                continue
+                            #
+                            if self.fetch_mmap_bool:
+                                # Only hand out the keys/values as memoryviews (slices of the memory-mapped partition file) if they are not deserialized.
+                                if isinstance(message_dict["key"], memoryview) and self.topic_str_key_type_str_dict[topic_str].lower() != "bytes":
+                                    message_dict["key"] = bytes(message_dict["key"])
+                                if isinstance(message_dict["value"], memoryview) and self.topic_str_value_type_str_dict[topic_str].lower() != "bytes":
+                                    message_dict["value"] = bytes(message_dict["value"])
+                            #
+                            message_dict["key"] = self.deserialize(message_dict["key"], self.topic_str_key_type_str_dict[message_dict["topic"]], topic_str=topic_str, key_bool=True)
+                            #
+                            message_dict["value"] = self.deserialize(message_dict["value"], self.topic_str_value_type_str_dict[message_dict["topic"]], topic_str=topic_str, key_bool=False)
+                            #
+                            self.topic_str_position_dict_dict[topic_str][partition_int] = message_dict["offset"] + 1
+                            #
+                            yield message_dict
+            finally:
+                # Also close the stream of the partition file currently being read (e.g. return the connection to the pool) if the cursor is closed before it has been read completely.
+                if chunk_bytes_iterator_or_buffer is not None and not self.fetch_mmap_bool:
+                    chunk_bytes_iterator_or_buffer.close()
+                rel_file_str_chunk_bytes_iterator_tuple_generator.close()
 
-    def consume(self, n=ALL_MESSAGES):
-        def foldl_function(message_dict_list, message_dict):
-            message_dict_list.append(message_dict)
+    def read_partition_files(self, topic_str, rel_file_str_list, rel_file_str_start_offset_int_dict):
+        abs_topic_dir_str = self.storage_obj.admin.get_topic_abs_path_str(topic_str)
+        #
+        def get_start_pos(rel_file_str):
+            # Use the sparse offset index to skip directly to (or close to) the start offset in the first partition file of each partition.
+            if rel_file_str not in rel_file_str_start_offset_int_dict:
+                return 0
+            #
+            return self.storage_obj.admin.find_partition_file_position_by_offset(topic_str, rel_file_str, rel_file_str_start_offset_int_dict[rel_file_str])
+        #
+        def open_partition_file(rel_file_str):
+            # On object stores, only the bytes from the start position on are transferred (ranged GETs).
+            return self.storage_obj.admin.read_segment_stream(os.path.join(abs_topic_dir_str, "partitions", rel_file_str), get_start_pos(rel_file_str))
+        #
+        if self.fetch_mmap_bool:
+            for rel_file_str in rel_file_str_list:
+                yield (rel_file_str, self.storage_obj.admin.read_mmap(os.path.join(abs_topic_dir_str, "partitions", rel_file_str)), get_start_pos(rel_file_str))
+            return
+        #
+        if self.fetch_num_workers_int <= 1 or len(rel_file_str_list) <= 1:
+            for rel_file_str in rel_file_str_list:
+                (chunk_bytes_iterator, start_pos_int) = open_partition_file(rel_file_str)
+                yield (rel_file_str, chunk_bytes_iterator, start_pos_int)
+            return
+        # Read ahead concurrently (the first chunk of each upcoming partition file - which for most partition files is the whole file), but yield the partition files in the original (round-robin) order.
+        def prefetch_partition_file(rel_file_str):
+            (chunk_bytes_generator, start_pos_int) = open_partition_file(rel_file_str)
+            first_chunk_bytes = next(chunk_bytes_generator, b"")
             #
-            return message_dict_list
+            return (first_chunk_bytes, chunk_bytes_generator, start_pos_int)
         #
-        return self.foldl(foldl_function, [], n)
+        threadPoolExecutor = ThreadPoolExecutor(max_workers=self.fetch_num_workers_int)
+        rel_file_str_future_tuple_deque = deque()
+        try:
+            next_index_int = 0
+            while next_index_int < len(rel_file_str_list) or len(rel_file_str_future_tuple_deque) > 0:
+                while next_index_int < len(rel_file_str_list) and len(rel_file_str_future_tuple_deque) < 2 * self.fetch_num_workers_int:
+                    prefetched_bytes_int = sum(len(future.result()[0]) for _, future in rel_file_str_future_tuple_deque if future.done() and future.exception() is None)
+                    if len(rel_file_str_future_tuple_deque) > 0 and prefetched_bytes_int >= self.fetch_max_bytes_int:
+                        break
+                    #
+                    rel_file_str = rel_file_str_list[next_index_int]
+                    rel_file_str_future_tuple_deque.append((rel_file_str, threadPoolExecutor.submit(prefetch_partition_file, rel_file_str)))
+                    next_index_int += 1
+                #
+                (rel_file_str, future) = rel_file_str_future_tuple_deque.popleft()
+                (first_chunk_bytes, chunk_bytes_generator, start_pos_int) = future.result()
+                yield (rel_file_str, prepend_chunk_bytes(first_chunk_bytes, chunk_bytes_generator), start_pos_int)
+        finally:
+            threadPoolExecutor.shutdown(wait=False, cancel_futures=True)
+            # Close the (already opened) streams of the prefetched partition files which have not been consumed.
+            for _, future in rel_file_str_future_tuple_deque:
+                if future.done() and not future.cancelled() and future.exception() is None:
+                    future.result()[1].close()
+
+    #
 
     def offsets(self):
         group_str_topic_str_offsets_dict_dict_dict = self.storage_obj.admin.group_offsets(self.group_str)
@@ -152,20 +280,17 @@ class FSConsumer(StorageConsumer):
         #
         return topic_str_offsets_dict_dict
 
-    def commit(self, offsets=None):
-        if offsets is None:
-            new_group_dict = {"offsets": self.next_topic_str_offsets_dict_dict}
-            #
-            topic_str_offsets_dict_dict = {topic_str: self.next_topic_str_offsets_dict_dict[topic_str] for topic_str in self.topic_str_list}
-        else:
-            str_or_int = list(offsets.keys())[0]
-            if isinstance(str_or_int, str):
-                topic_str_offsets_dict_dict = offsets
-            elif isinstance(str_or_int, int):
-                topic_str_offsets_dict_dict = {topic_str: offsets for topic_str in self.topic_str_list}
-            #
-            new_group_dict = {"offsets": topic_str_offsets_dict_dict}
+    def get_committed_offsets(self, topic_str):
+        group_dict = self.storage_obj.admin.get_group_dict(self.group_str)
         #
+        return group_dict["offsets"][topic_str]
+
+    def commit_offsets(self, topic_str_offsets_dict_dict):
+        new_group_dict = {"offsets": topic_str_offsets_dict_dict}
         self.storage_obj.admin.set_group_dict(self.group_str, new_group_dict)
+
+    def get_next_offsets(self):
+        # Only commit the offsets of the assigned partitions (i.e. do not overwrite the offsets committed by the other members of the group).
+        topic_str_offsets_dict_dict = {topic_str: {partition_int: offset_int for partition_int, offset_int in self.next_topic_str_offsets_dict_dict[topic_str].items() if partition_int in self.topic_str_assigned_partition_int_list_dict[topic_str]} for topic_str in self.topic_str_list}
         #
         return topic_str_offsets_dict_dict
@@ -1,6 +1,7 @@
 import os
 
 from kafi.storage_producer import StorageProducer
+from kafi.fs.fs_segment import encode_offset_index, encode_segment, encode_time_index
 from kafi.helpers import get_millis
 
 # Constants
@@ -17,18 +18,90 @@ class FSProducer(StorageProducer):
         #
         if not fs_obj.exists(self.topic_str):
             fs_obj.create(self.topic_str)
+        #
+        # Producer config
+        #
+        producer_config_dict = {"segment.bytes": fs_obj.segment_bytes(), "segment.messages": fs_obj.segment_messages(), "linger.ms": fs_obj.linger_ms()}
+        #
+        if "config" in kwargs:
+            for key_str, value in kwargs["config"].items():
+                producer_config_dict[key_str] = value
+        #
+        self.segment_bytes_int = int(producer_config_dict["segment.bytes"])
+        self.segment_messages_int = int(producer_config_dict["segment.messages"])
+        self.linger_ms_int = int(producer_config_dict["linger.ms"])
+        #
+        self.format_str = self.storage_obj.admin.get_format(self.topic_str)
+        self.compression_type_str = self.storage_obj.admin.get_compression_type(self.topic_str)
+        self.partitions_int = self.storage_obj.admin.get_partitions(self.topic_str)
+        #
+        # Buffered (already serialized) messages per partition. Offsets are only assigned once the messages are written to a new partition file.
+        self.partition_int_message_dict_list_dict = {partition_int: [] for partition_int in range(self.partitions_int)}
+        self.partition_int_buffered_bytes_int_dict = {partition_int: 0 for partition_int in range(self.partitions_int)}
+        self.first_buffered_millis_int = None
 
     #
 
-    def produce(self, value, **kwargs):
-        partition_int_offsets_tuple_dict = self.storage_obj.watermarks(self.topic_str)[self.topic_str]
-        last_offsets_dict = {partition_int: offsets_tuple[1] for partition_int, offsets_tuple in partition_int_offsets_tuple_dict.items()}
+    def close(self):
+        self.flush()
+        return self.topic_str
+
+    #
+
+    def flush(self, partitions=None):
+        partition_int_list = partitions if partitions is not None else list(range(self.partitions_int))
+        partition_int_list = [partition_int for partition_int in partition_int_list if len(self.partition_int_message_dict_list_dict[partition_int]) > 0]
         #
+        topic_abs_dir_str = self.storage_obj.admin.get_topic_abs_path_str(self.topic_str)
+        for partition_int in partition_int_list:
+            # Hold the append lock of the partition from assigning the offsets until the new partition file has been added to the manifest (such that concurrent producers never assign overlapping offsets). The lease of the lock is not renewed, i.e. this must finish within lock.lease.ms.
+            lock_token_str = self.storage_obj.admin.acquire_lock(self.topic_str, f"partition-{partition_int}")
+            try:
+                # Get the watermarks from the topic manifest (instead of listing all the partition files of all topics) - bypassing the metadata cache.
+                self.storage_obj.admin.invalidate_cache(self.storage_obj.admin.get_manifest_abs_path_str(self.topic_str))
+                partition_int_offsets_tuple_dict = self.storage_obj.admin.get_watermarks(self.topic_str)
+                #
+                message_dict_list = self.partition_int_message_dict_list_dict[partition_int]
+                #
+                start_offset_int = partition_int_offsets_tuple_dict[partition_int][1] if partition_int in partition_int_offsets_tuple_dict else 0
+                end_offset_int = start_offset_int + len(message_dict_list) - 1
+                for offset_int, message_dict in enumerate(message_dict_list, start_offset_int):
+                    message_dict["offset"] = offset_int
+                #
+                start_timestamp_int = message_dict_list[0]["timestamp"][1]
+                end_timestamp_int = message_dict_list[-1]["timestamp"][1]
+                #
+                rel_file_str = f"{partition_int:09},{start_offset_int:021},{end_offset_int:021},{start_timestamp_int},{end_timestamp_int}"
+                abs_path_file_str = os.path.join(topic_abs_dir_str, "partitions", rel_file_str)
+                #
+                (messages_bytes, index_tuple_list) = encode_segment(self.format_str, partition_int, message_dict_list, self.storage_obj.index_interval_bytes(), self.compression_type_str)
+                #
+                self.storage_obj.admin.write_bytes(abs_path_file_str, messages_bytes)
+                # Only write the sparse offset and time indexes after the partition file (such that the indexes never point to a missing file) and only if they are not empty.
+                if len(index_tuple_list) > 0:
+                    self.storage_obj.admin.write_bytes(self.storage_obj.admin.get_offset_index_abs_path_str(self.topic_str, rel_file_str), encode_offset_index(index_tuple_list))
+                    self.storage_obj.admin.write_bytes(self.storage_obj.admin.get_time_index_abs_path_str(self.topic_str, rel_file_str), encode_time_index(index_tuple_list))
+                # Only add the new partition file to the manifest once it (and its indexes) have been written.
+                self.storage_obj.admin.add_partition_files(self.topic_str, {partition_int: rel_file_str})
+            finally:
+                self.storage_obj.admin.release_lock(self.topic_str, f"partition-{partition_int}", lock_token_str)
+            #
+            self.partition_int_message_dict_list_dict[partition_int] = []
+            self.partition_int_buffered_bytes_int_dict[partition_int] = 0
+        #
+        if all(len(message_dict_list) == 0 for message_dict_list in self.partition_int_message_dict_list_dict.values()):
+            self.first_buffered_millis_int = None
+        #
+        return self.topic_str
+
+    def produce(self, value, **kwargs):
         key = kwargs["key"] if "key" in kwargs else None
         partition = kwargs["partition"] if "partition" in kwargs else RD_KAFKA_PARTITION_UA
         timestamp = kwargs["timestamp"] if "timestamp" in kwargs else CURRENT_TIME
         headers = kwargs["headers"] if "headers" in kwargs else None
         #
+        flush_bool = kwargs["flush"] if "flush" in kwargs else False
+        #
         value_list = value if isinstance(value, list) else [value]
         #
         key_list = key if isinstance(key, list) else [key for _ in value_list]
@@ -40,49 +113,53 @@ class FSProducer(StorageProducer):
         headers_list = headers if isinstance(headers, list) and all(self.storage_obj.is_headers(headers1) for headers1 in headers) and len(headers) == len(value_list) else [headers for _ in value_list]
         headers_str_bytes_tuple_list_list = [self.storage_obj.headers_to_headers_str_bytes_tuple_list(headers) for headers in headers_list]
         #
-        partitions_int = self.storage_obj.admin.get_partitions(self.topic_str)
-        partition_int_message_dict_list_dict = {partition_int: [] for partition_int in range(partitions_int)}
         round_robin_counter_int = 0
-        partition_int_offset_counter_int_dict = {partition_int: last_offset_int if last_offset_int > 0 else 0 for partition_int, last_offset_int in last_offsets_dict.items()}
         #
         for value, key, timestamp, headers_str_bytes_tuple_list, partition_int in zip(value_list, key_list, timestamp_list, headers_str_bytes_tuple_list_list, partition_int_list):
             if partition_int is RD_KAFKA_PARTITION_UA:
                 if key is None:
                     partition_int = round_robin_counter_int
-                    if round_robin_counter_int == partitions_int - 1:
+                    if round_robin_counter_int == self.partitions_int - 1:
                         round_robin_counter_int = 0
                     else:
                         round_robin_counter_int += 1
                 else:
-                    partition_int = hash(str(key)) % partitions_int
+                    partition_int = hash(str(key)) % self.partitions_int
             #
             if timestamp == CURRENT_TIME:
                 timestamp = (TIMESTAMP_CREATE_TIME, get_millis())
             #
-            message_dict = {"topic": self.topic_str, "value": value, "key": key, "timestamp": timestamp, "headers": headers_str_bytes_tuple_list, "partition": partition_int, "offset": partition_int_offset_counter_int_dict[partition_int]}
+            key_str_or_bytes = self.serialize(key, True)
+            value_str_or_bytes = self.serialize(value, False)
+            #
+            message_dict = {"topic": self.topic_str, "value": value_str_or_bytes, "key": key_str_or_bytes, "timestamp": timestamp, "headers": headers_str_bytes_tuple_list, "partition": partition_int, "offset": None}
+            #
+            if self.first_buffered_millis_int is None:
+                self.first_buffered_millis_int = get_millis()
             #
-            partition_int_message_dict_list_dict[partition_int].append(message_dict)
+            self.partition_int_message_dict_list_dict[partition_int].append(message_dict)
+            self.partition_int_buffered_bytes_int_dict[partition_int] += get_message_size(message_dict)
             #
-            partition_int_offset_counter_int_dict[partition_int] += 1
+            self.written_counter_int += 1
+            # Roll a new partition file as soon as the buffer of the partition reaches segment.bytes or segment.messages.
+            if self.partition_int_buffered_bytes_int_dict[partition_int] >= self.segment_bytes_int or len(self.partition_int_message_dict_list_dict[partition_int]) >= self.segment_messages_int:
+                self.flush([partition_int])
+        # linger.ms is only checked here (there is no background thread) - buffered messages are not written before the next produce(), flush() or close().
+        if flush_bool or (self.first_buffered_millis_int is not None and get_millis() - self.first_buffered_millis_int >= self.linger_ms_int):
+            self.flush()
         #
-        topic_abs_dir_str = self.storage_obj.admin.get_topic_abs_path_str(self.topic_str)
-        for partition_int, message_dict_list in partition_int_message_dict_list_dict.items():
-            if len(message_dict_list) > 0:
-                start_timestamp_int = message_dict_list[0]["timestamp"][1]
-                end_timestamp_int = message_dict_list[-1]["timestamp"][1]
-                #
-                messages_bytes = b""
-                for message_dict in message_dict_list:
-                    message_dict["key"] = self.serialize(message_dict["key"], True)
-                    message_dict["value"] = self.serialize(message_dict["value"], False)
-                    #
-                    start_offset_int = last_offsets_dict[partition_int]
-                    end_offset_int = start_offset_int + len(message_dict_list) - 1
-                    #
-                    abs_path_file_str = os.path.join(topic_abs_dir_str, "partitions", f"{partition_int:09},{start_offset_int:021},{end_offset_int:021},{start_timestamp_int},{end_timestamp_int}")
-                    #
-                    message_bytes = str(message_dict).encode("utf-8") + b"\n"
-                    #
-                    messages_bytes += message_bytes
-                #
-                self.storage_obj.admin.write_bytes(abs_path_file_str, messages_bytes)
+        return self.written_counter_int
+
+# Helpers
+
+def get_message_size(message_dict):
+    size_int = 16
+    #
+    for key_or_value_str_or_bytes in [message_dict["key"], message_dict["value"]]:
+        if key_or_value_str_or_bytes is not None:
+            size_int += len(key_or_value_str_or_bytes)
+    #
+    if message_dict["headers"] is not None:
+        size_int += sum(len(header_key_str) + (len(header_value_bytes) if header_value_bytes is not None else 0) for header_key_str, header_value_bytes in message_dict["headers"])
+    #
+    return size_int
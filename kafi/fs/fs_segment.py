@@ -0,0 +1,740 @@
+import ast
+import bz2
+import importlib.util
+import lzma
+import struct
+import zlib
+
+# Constants
+
+SEGMENT_FORMAT_TEXT = "text"
+SEGMENT_FORMAT_BINARY = "binary"
+SEGMENT_FORMAT_ARROW = "arrow"
+
+SEGMENT_MAGIC_BYTES = b"KAFS"
+SEGMENT_VERSION = 1
+# magic, version, attributes, partition
+SEGMENT_HEADER_STRUCT = struct.Struct(">4sBBi")
+SEGMENT_HEADER_SIZE = SEGMENT_HEADER_STRUCT.size
+# base offset, base timestamp, max timestamp, number of records, attributes, length of the records
+BATCH_HEADER_STRUCT = struct.Struct(">qqqiBi")
+BATCH_HEADER_SIZE = BATCH_HEADER_STRUCT.size
+# Batches are kept small enough for the offset deltas to fit into a single varint byte.
+BATCH_MAX_RECORDS = 128
+BATCH_MAX_BYTES = 16384
+# offset, position
+OFFSET_INDEX_ENTRY_STRUCT = struct.Struct(">qq")
+OFFSET_INDEX_ENTRY_SIZE = OFFSET_INDEX_ENTRY_STRUCT.size
+# maximum timestamp of all records before the position, offset, position
+TIME_INDEX_ENTRY_STRUCT = struct.Struct(">qqq")
+TIME_INDEX_ENTRY_SIZE = TIME_INDEX_ENTRY_STRUCT.size
+
+# Arrow IPC streams start with the continuation marker of their first (schema) message.
+ARROW_CONTINUATION_BYTES = b"\xff\xff\xff\xff"
+ARROW_BATCH_MAX_RECORDS = 4096
+# Arrow IPC only supports the zstd and lz4 (frame) buffer compression codecs.
+ARROW_COMPRESSION_TYPE_STR_LIST = ["none", "uncompressed", "zstd", "lz4"]
+
+TIMESTAMP_CREATE_TIME = 1
+
+# Compression codecs (stored in the lowest three bits of the batch attributes). zstd and lz4 require the optional zstandard and lz4 packages.
+COMPRESSION_TYPE_NONE = "none"
+COMPRESSION_TYPE_STR_CODEC_INT_DICT = {"none": 0, "uncompressed": 0, "zlib": 1, "lzma": 2, "bz2": 3, "zstd": 4, "lz4": 5}
+COMPRESSION_CODEC_MASK = 0x07
+COMPRESSION_CODEC_INT_PACKAGE_STR_DICT = {4: "zstandard", 5: "lz4"}
+
+#
+
+def get_segment_format_str(segment_bytes):
+    if segment_bytes[:len(SEGMENT_MAGIC_BYTES)] == SEGMENT_MAGIC_BYTES:
+        return SEGMENT_FORMAT_BINARY
+    elif segment_bytes[:len(ARROW_CONTINUATION_BYTES)] == ARROW_CONTINUATION_BYTES:
+        return SEGMENT_FORMAT_ARROW
+    else:
+        return SEGMENT_FORMAT_TEXT
+
+
+def encode_segment(format_str, partition_int, message_dict_list, index_interval_bytes_int, compression_type_str=COMPRESSION_TYPE_NONE):
+    if format_str == SEGMENT_FORMAT_BINARY:
+        return encode_binary_segment(partition_int, message_dict_list, index_interval_bytes_int, compression_type_str)
+    elif format_str == SEGMENT_FORMAT_TEXT:
+        if get_compression_codec_int(compression_type_str) != 0:
+            raise Exception(f"Compression is only supported for the \"{SEGMENT_FORMAT_BINARY}\" and \"{SEGMENT_FORMAT_ARROW}\" segment formats.")
+        #
+        return encode_text_segment(message_dict_list, index_interval_bytes_int)
+    elif format_str == SEGMENT_FORMAT_ARROW:
+        return encode_arrow_segment(partition_int, message_dict_list, compression_type_str)
+    else:
+        raise Exception(f"Only \"{SEGMENT_FORMAT_BINARY}\", \"{SEGMENT_FORMAT_TEXT}\" and \"{SEGMENT_FORMAT_ARROW}\" segment formats supported.")
+
+
+def decode_segment(segment_bytes, topic_str, start_pos_int=0, start_offset_int=0):
+    format_str = get_segment_format_str(segment_bytes)
+    if format_str == SEGMENT_FORMAT_BINARY:
+        return decode_binary_segment(segment_bytes, topic_str, start_pos_int, start_offset_int)
+    elif format_str == SEGMENT_FORMAT_ARROW:
+        return [message_dict for message_dict_list in decode_arrow_segment_buffer(segment_bytes, topic_str, start_offset_int) for message_dict in message_dict_list]
+    else:
+        return decode_text_segment(segment_bytes, topic_str, start_pos_int)
+
+# Text segments (one str(message_dict) per line)
+
+def encode_text_segment(message_dict_list, index_interval_bytes_int):
+    index_tuple_list = []
+    #
+    bytes_list = []
+    pos_int = 0
+    last_indexed_pos_int = 0
+    max_timestamp_int = None
+    for message_dict in message_dict_list:
+        # Only index positions after the first message (the start of the segment does not need an index entry, and its time index entry would not have a max. timestamp yet - e.g. with index.interval.bytes == 0).
+        if max_timestamp_int is not None and pos_int - last_indexed_pos_int >= index_interval_bytes_int:
+            index_tuple_list.append((message_dict["offset"], pos_int, max_timestamp_int))
+            last_indexed_pos_int = pos_int
+        #
+        message_bytes = str(message_dict).encode("utf-8") + b"\n"
+        bytes_list.append(message_bytes)
+        pos_int += len(message_bytes)
+        #
+        timestamp_int = get_timestamp_tuple(message_dict["timestamp"])[1]
+        if max_timestamp_int is None or timestamp_int > max_timestamp_int:
+            max_timestamp_int = timestamp_int
+    #
+    return (b"".join(bytes_list), index_tuple_list)
+
+
+def decode_text_segment(segment_bytes, topic_str, start_pos_int=0):
+    if start_pos_int > 0:
+        segment_bytes = segment_bytes[start_pos_int:]
+    #
+    return [decode_text_message(message_bytes, topic_str) for message_bytes in segment_bytes.split(b"\n")[:-1]]
+
+
+def decode_text_message(message_bytes, topic_str):
+    message_dict = ast.literal_eval(message_bytes.decode("utf-8"))
+    # Each line also stores the topic it was produced to - use the topic the partition file belongs to instead (e.g. after a raw copy of the partition files to another topic).
+    message_dict["topic"] = topic_str
+    #
+    return message_dict
+
+# Binary segments
+#
+# A binary segment starts with a fixed-size header followed by record batches. Each batch has a fixed-size header (see BATCH_HEADER_STRUCT) followed by length-prefixed records whose offsets and timestamps are stored as deltas to the base offset/timestamp of the batch. Each record consists of:
+#
+# * timestamp type (1 byte)
+# * offset delta (unsigned varint)
+# * timestamp delta (zigzag varint)
+# * key, value (unsigned varint length + 1, 0 = None, raw bytes)
+# * headers (unsigned varint count + 1, 0 = None, each header: unsigned varint name length, UTF-8 name, unsigned varint value length + 1, raw bytes)
+
+def encode_binary_segment(partition_int, message_dict_list, index_interval_bytes_int, compression_type_str=COMPRESSION_TYPE_NONE):
+    compression_codec_int = get_compression_codec_int(compression_type_str)
+    #
+    index_tuple_list = []
+    #
+    bytes_list = [SEGMENT_HEADER_STRUCT.pack(SEGMENT_MAGIC_BYTES, SEGMENT_VERSION, 0, partition_int)]
+    pos_int = SEGMENT_HEADER_SIZE
+    last_indexed_pos_int = SEGMENT_HEADER_SIZE
+    max_timestamp_int = None
+    #
+    def append_batch(batch_message_dict_list):
+        nonlocal pos_int, last_indexed_pos_int, max_timestamp_int
+        #
+        # Only index positions after the first batch (see encode_text_segment()).
+        if max_timestamp_int is not None and pos_int - last_indexed_pos_int >= index_interval_bytes_int:
+            index_tuple_list.append((batch_message_dict_list[0]["offset"], pos_int, max_timestamp_int))
+            last_indexed_pos_int = pos_int
+        #
+        (batch_bytes, batch_max_timestamp_int) = encode_batch(batch_message_dict_list, compression_codec_int)
+        bytes_list.append(batch_bytes)
+        pos_int += len(batch_bytes)
+        #
+        if max_timestamp_int is None or batch_max_timestamp_int > max_timestamp_int:
+            max_timestamp_int = batch_max_timestamp_int
+    #
+
+    batch_message_dict_list = []
+    batch_size_int = 0
+    for message_dict in message_dict_list:
+        batch_message_dict_list.append(message_dict)
+        batch_size_int += len(message_dict["value"] or b"") + len(message_dict["key"] or b"")
+        #
+        if len(batch_message_dict_list) == BATCH_MAX_RECORDS or batch_size_int >= BATCH_MAX_BYTES:
+            append_batch(batch_message_dict_list)
+            #
+            batch_message_dict_list = []
+            batch_size_int = 0
+    #
+    if len(batch_message_dict_list) > 0:
+        append_batch(batch_message_dict_list)
+    #
+    return (b"".join(bytes_list), index_tuple_list)
+
+
+def encode_batch(message_dict_list, compression_codec_int=0):
+    base_offset_int = message_dict_list[0]["offset"]
+    base_timestamp_int = get_timestamp_tuple(message_dict_list[0]["timestamp"])[1]
+    max_timestamp_int = max(get_timestamp_tuple(message_dict["timestamp"])[1] for message_dict in message_dict_list)
+    #
+    bytes_list = []
+    for message_dict in message_dict_list:
+        record_bytes = encode_record(message_dict, base_offset_int, base_timestamp_int)
+        #
+        bytes_list.append(encode_uvarint(len(record_bytes)))
+        bytes_list.append(record_bytes)
+    records_bytes = b"".join(bytes_list)
+    #
+    if compression_codec_int != 0:
+        records_bytes = compress(compression_codec_int, records_bytes)
+    #
+    return (BATCH_HEADER_STRUCT.pack(base_offset_int, base_timestamp_int, max_timestamp_int, len(message_dict_list), compression_codec_int, len(records_bytes)) + records_bytes, max_timestamp_int)
+
+
+def encode_record(message_dict, base_offset_int, base_timestamp_int):
+    (timestamp_type_int, timestamp_int) = get_timestamp_tuple(message_dict["timestamp"])
+    #
+    bytes_list = [bytes((timestamp_type_int,)), encode_uvarint(message_dict["offset"] - base_offset_int), encode_uvarint(zigzag_encode(timestamp_int - base_timestamp_int))]
+    #
+    for payload_bytes in (message_dict["key"], message_dict["value"]):
+        if payload_bytes is None:
+            bytes_list.append(b"\x00")
+        else:
+            bytes_list.append(encode_uvarint(len(payload_bytes) + 1))
+            bytes_list.append(payload_bytes)
+    #
+    headers_str_bytes_tuple_list = message_dict["headers"]
+    if headers_str_bytes_tuple_list is None:
+        bytes_list.append(b"\x00")
+    else:
+        bytes_list.append(encode_uvarint(len(headers_str_bytes_tuple_list) + 1))
+        for header_key_str, header_value_bytes in headers_str_bytes_tuple_list:
+            header_key_bytes = header_key_str.encode("utf-8")
+            bytes_list.append(encode_uvarint(len(header_key_bytes)))
+            bytes_list.append(header_key_bytes)
+            #
+            if header_value_bytes is None:
+                bytes_list.append(b"\x00")
+            else:
+                bytes_list.append(encode_uvarint(len(header_value_bytes) + 1))
+                bytes_list.append(header_value_bytes)
+    #
+    return b"".join(bytes_list)
+
+
+def decode_binary_segment(segment_bytes, topic_str, start_pos_int=0, start_offset_int=0):
+    (_, version_int, _, partition_int) = SEGMENT_HEADER_STRUCT.unpack_from(segment_bytes, 0)
+    if version_int > SEGMENT_VERSION:
+        raise Exception(f"Unsupported segment version {version_int} (only versions up to {SEGMENT_VERSION} supported).")
+    #
+    message_dict_list = []
+    pos_int = max(start_pos_int, SEGMENT_HEADER_SIZE)
+    segment_size_int = len(segment_bytes)
+    while pos_int < segment_size_int:
+        (base_offset_int, base_timestamp_int, _, num_records_int, attributes_int, records_size_int) = BATCH_HEADER_STRUCT.unpack_from(segment_bytes, pos_int)
+        pos_int += BATCH_HEADER_SIZE
+        # Skip whole batches below the start offset without decoding (and decompressing) their records.
+        if base_offset_int + num_records_int > start_offset_int:
+            compression_codec_int = attributes_int & COMPRESSION_CODEC_MASK
+            if compression_codec_int == 0:
+                decode_records(segment_bytes, pos_int, pos_int + records_size_int, topic_str, partition_int, base_offset_int, base_timestamp_int, message_dict_list)
+            else:
+                records_bytes = decompress(compression_codec_int, segment_bytes[pos_int:pos_int + records_size_int])
+                decode_records(records_bytes, 0, len(records_bytes), topic_str, partition_int, base_offset_int, base_timestamp_int, message_dict_list)
+        pos_int += records_size_int
+    #
+    return message_dict_list
+
+
+def decode_records(buffer, pos_int, end_pos_int, topic_str, partition_int, base_offset_int, base_timestamp_int, message_dict_list):
+    # The varint decoding is inlined (single-byte fast path) since this loop dominates consumption time.
+    append = message_dict_list.append
+    while pos_int < end_pos_int:
+        # Record length.
+        b = buffer[pos_int]
+        if b < 0x80:
+            record_length_int = b
+            pos_int += 1
+        else:
+            (record_length_int, pos_int) = decode_uvarint(buffer, pos_int)
+        record_end_pos_int = pos_int + record_length_int
+        # Timestamp type.
+        timestamp_type_int = buffer[pos_int]
+        pos_int += 1
+        # Offset delta.
+        b = buffer[pos_int]
+        if b < 0x80:
+            offset_delta_int = b
+            pos_int += 1
+        else:
+            (offset_delta_int, pos_int) = decode_uvarint(buffer, pos_int)
+        # Timestamp delta.
+        b = buffer[pos_int]
+        if b < 0x80:
+            zigzag_int = b
+            pos_int += 1
+        else:
+            (zigzag_int, pos_int) = decode_uvarint(buffer, pos_int)
+        timestamp_delta_int = (zigzag_int >> 1) ^ -(zigzag_int & 1)
+        # Key.
+        b = buffer[pos_int]
+        if b < 0x80:
+            length_int = b
+            pos_int += 1
+        else:
+            (length_int, pos_int) = decode_uvarint(buffer, pos_int)
+        if length_int == 0:
+            key_bytes = None
+        else:
+            key_bytes = buffer[pos_int:pos_int + length_int - 1]
+            pos_int += length_int - 1
+        # Value.
+        b = buffer[pos_int]
+        if b < 0x80:
+            length_int = b
+            pos_int += 1
+        else:
+            (length_int, pos_int) = decode_uvarint(buffer, pos_int)
+        if length_int == 0:
+            value_bytes = None
+        else:
+            value_bytes = buffer[pos_int:pos_int + length_int - 1]
+            pos_int += length_int - 1
+        # Headers.
+        if buffer[pos_int] == 0:
+            headers_str_bytes_tuple_list = None
+        else:
+            (headers_str_bytes_tuple_list, pos_int) = decode_headers(buffer, pos_int)
+        #
+        pos_int = record_end_pos_int
+        #
+        append({"topic": topic_str, "value": value_bytes, "key": key_bytes, "timestamp": (timestamp_type_int, base_timestamp_int + timestamp_delta_int), "headers": headers_str_bytes_tuple_list, "partition": partition_int, "offset": base_offset_int + offset_delta_int})
+    #
+    return message_dict_list
+
+
+def decode_headers(buffer, pos_int):
+    (num_headers_int, pos_int) = decode_uvarint(buffer, pos_int)
+    #
+    headers_str_bytes_tuple_list = []
+    for _ in range(num_headers_int - 1):
+        (length_int, pos_int) = decode_uvarint(buffer, pos_int)
+        header_key_str = str(buffer[pos_int:pos_int + length_int], "utf-8")
+        pos_int += length_int
+        #
+        (length_int, pos_int) = decode_uvarint(buffer, pos_int)
+        if length_int == 0:
+            header_value_bytes = None
+        else:
+            header_value_bytes = bytes(buffer[pos_int:pos_int + length_int - 1])
+            pos_int += length_int - 1
+        #
+        headers_str_bytes_tuple_list.append((header_key_str, header_value_bytes))
+    #
+    return (headers_str_bytes_tuple_list, pos_int)
+
+# Arrow segments
+#
+# An Arrow segment is an Arrow IPC stream (see get_arrow_schema()) of record batches with up to ARROW_BATCH_MAX_RECORDS messages each, such that analytics tools can read the partition files directly (e.g. using pyarrow.ipc.open_stream()) and topic_to_arrow() can read them without decoding the individual messages. Arrow segments have no sparse indexes: consumers skip whole record batches below their start offset instead (by looking at the last value of their offset column).
+
+def get_arrow_schema():
+    import pyarrow as pa
+    #
+    return pa.schema([("partition", pa.int32()), ("offset", pa.int64()), ("timestamp_type", pa.int8()), ("timestamp", pa.int64()), ("key", pa.binary()), ("value", pa.binary()), ("headers", pa.list_(pa.struct([("key", pa.string()), ("value", pa.binary())])))])
+
+
+def get_arrow_compression_str(compression_type_str):
+    if compression_type_str is None or compression_type_str.lower() in ["none", "uncompressed"]:
+        return None
+    #
+    if compression_type_str.lower() not in ARROW_COMPRESSION_TYPE_STR_LIST:
+        raise Exception(f"Unsupported compression type \"{compression_type_str}\" for the \"{SEGMENT_FORMAT_ARROW}\" segment format (supported: {', '.join(ARROW_COMPRESSION_TYPE_STR_LIST)}).")
+    #
+    return compression_type_str.lower()
+
+
+def encode_arrow_segment(partition_int, message_dict_list, compression_type_str=COMPRESSION_TYPE_NONE):
+    import pyarrow as pa
+    #
+    schema = get_arrow_schema()
+    ipcWriteOptions = pa.ipc.IpcWriteOptions(compression=get_arrow_compression_str(compression_type_str))
+    #
+    bufferOutputStream = pa.BufferOutputStream()
+    with pa.ipc.new_stream(bufferOutputStream, schema, options=ipcWriteOptions) as recordBatchStreamWriter:
+        for start_int in range(0, len(message_dict_list), ARROW_BATCH_MAX_RECORDS):
+            batch_message_dict_list = message_dict_list[start_int:start_int + ARROW_BATCH_MAX_RECORDS]
+            timestamp_tuple_list = [get_timestamp_tuple(message_dict["timestamp"]) for message_dict in batch_message_dict_list]
+            #
+            array_list = [[partition_int] * len(batch_message_dict_list),
+                          [message_dict["offset"] for message_dict in batch_message_dict_list],
+                          [timestamp_type_int for timestamp_type_int, _ in timestamp_tuple_list],
+                          [timestamp_int for _, timestamp_int in timestamp_tuple_list],
+                          [message_dict["key"] for message_dict in batch_message_dict_list],
+                          [message_dict["value"] for message_dict in batch_message_dict_list],
+                          [[{"key": header_key_str, "value": header_value_bytes} for header_key_str, header_value_bytes in message_dict["headers"]] if message_dict["headers"] is not None else None for message_dict in batch_message_dict_list]]
+            #
+            recordBatchStreamWriter.write_batch(pa.record_batch(array_list, schema=schema))
+    #
+    return (bufferOutputStream.getvalue().to_pybytes(), [])
+
+
+def decode_arrow_record_batch(recordBatch, topic_str):
+    (partition_int_list, offset_int_list, timestamp_type_int_list, timestamp_int_list, key_bytes_list, value_bytes_list, headers_dict_list_list) = (recordBatch.column(name_str).to_pylist() for name_str in recordBatch.schema.names)
+    #
+    return [{"topic": topic_str, "value": value_bytes, "key": key_bytes, "timestamp": (timestamp_type_int, timestamp_int), "headers": [(header_dict["key"], header_dict["value"]) for header_dict in headers_dict_list] if headers_dict_list is not None else None, "partition": partition_int, "offset": offset_int} for partition_int, offset_int, timestamp_type_int, timestamp_int, key_bytes, value_bytes, headers_dict_list in zip(partition_int_list, offset_int_list, timestamp_type_int_list, timestamp_int_list, key_bytes_list, value_bytes_list, headers_dict_list_list)]
+
+
+def read_arrow_record_batches(source, start_offset_int=0):
+    # Yield the record batches of an Arrow segment (from a buffer or a pyarrow.PythonFile) which contain messages with offsets >= start_offset_int.
+    import pyarrow as pa
+    #
+    for recordBatch in pa.ipc.open_stream(source):
+        # Skip whole record batches below the start offset without converting their messages.
+        if recordBatch.num_rows == 0 or recordBatch.column("offset")[-1].as_py() < start_offset_int:
+            continue
+        #
+        yield recordBatch
+
+
+def decode_arrow_segment_buffer(segment_buffer, topic_str, start_offset_int=0):
+    import pyarrow as pa
+    #
+    for recordBatch in read_arrow_record_batches(pa.py_buffer(segment_buffer), start_offset_int):
+        yield decode_arrow_record_batch(recordBatch, topic_str)
+
+
+class ArrowSegmentStream:
+    # File-like view of a SegmentStream (for pyarrow.PythonFile).
+    def __init__(self, segment_stream):
+        self.segment_stream = segment_stream
+        self.closed = False
+
+    def read(self, size_int=-1):
+        return self.segment_stream.read_up_to(size_int)
+
+# Indexes
+#
+# The sparse offset and time indexes have one entry for the first batch (binary segments) or line (text segments) written after at least index.interval.bytes since the last entry. An offset index entry maps the offset of the batch/line to its byte position in the segment. A time index entry additionally contains the maximum timestamp of all records before this position (like Kafka's .timeindex, these timestamps are monotonically increasing even if the timestamps of the records are not).
+
+def encode_offset_index(index_tuple_list):
+    return b"".join(OFFSET_INDEX_ENTRY_STRUCT.pack(offset_int, pos_int) for offset_int, pos_int, _ in index_tuple_list)
+
+
+def encode_time_index(index_tuple_list):
+    return b"".join(TIME_INDEX_ENTRY_STRUCT.pack(max_timestamp_int, offset_int, pos_int) for offset_int, pos_int, max_timestamp_int in index_tuple_list)
+
+
+def find_position_by_offset(offset_index_bytes, to_find_offset_int):
+    # Binary search for the last index entry with an offset <= to_find_offset_int.
+    low_int = 0
+    high_int = len(offset_index_bytes) // OFFSET_INDEX_ENTRY_SIZE
+    found_pos_int = 0
+    while low_int < high_int:
+        middle_int = (low_int + high_int) // 2
+        (offset_int, pos_int) = OFFSET_INDEX_ENTRY_STRUCT.unpack_from(offset_index_bytes, middle_int * OFFSET_INDEX_ENTRY_SIZE)
+        if offset_int <= to_find_offset_int:
+            found_pos_int = pos_int
+            low_int = middle_int + 1
+        else:
+            high_int = middle_int
+    #
+    return found_pos_int
+
+
+def find_position_by_timestamp(time_index_bytes, to_find_timestamp_int):
+    # Binary search for the last index entry with all records before it having timestamps < to_find_timestamp_int.
+    low_int = 0
+    high_int = len(time_index_bytes) // TIME_INDEX_ENTRY_SIZE
+    found_pos_int = 0
+    while low_int < high_int:
+        middle_int = (low_int + high_int) // 2
+        (max_timestamp_int, _, pos_int) = TIME_INDEX_ENTRY_STRUCT.unpack_from(time_index_bytes, middle_int * TIME_INDEX_ENTRY_SIZE)
+        if max_timestamp_int < to_find_timestamp_int:
+            found_pos_int = pos_int
+            low_int = middle_int + 1
+        else:
+            high_int = middle_int
+    #
+    return found_pos_int
+
+
+# Memory-mapped segments
+
+def decode_segment_buffer(segment_buffer, topic_str, start_pos_int=0, start_offset_int=0):
+    # Like decode_segment_stream(), but decodes the segment from a buffer (e.g. a memoryview of a memory-mapped partition file). The keys and values of uncompressed batches are returned as slices of the buffer (without copying).
+    format_str = get_segment_format_str(bytes(segment_buffer[:len(SEGMENT_MAGIC_BYTES)]))
+    if format_str == SEGMENT_FORMAT_BINARY:
+        (_, version_int, _, partition_int) = SEGMENT_HEADER_STRUCT.unpack_from(segment_buffer, 0)
+        if version_int > SEGMENT_VERSION:
+            raise Exception(f"Unsupported segment version {version_int} (only versions up to {SEGMENT_VERSION} supported).")
+        #
+        pos_int = max(start_pos_int, SEGMENT_HEADER_SIZE)
+        segment_size_int = len(segment_buffer)
+        while pos_int < segment_size_int:
+            (base_offset_int, base_timestamp_int, _, num_records_int, attributes_int, records_size_int) = BATCH_HEADER_STRUCT.unpack_from(segment_buffer, pos_int)
+            pos_int += BATCH_HEADER_SIZE
+            # Skip whole batches below the start offset without decoding (and decompressing) their records.
+            if base_offset_int + num_records_int > start_offset_int:
+                compression_codec_int = attributes_int & COMPRESSION_CODEC_MASK
+                if compression_codec_int == 0:
+                    yield decode_records(segment_buffer, pos_int, pos_int + records_size_int, topic_str, partition_int, base_offset_int, base_timestamp_int, [])
+                else:
+                    records_bytes = decompress(compression_codec_int, segment_buffer[pos_int:pos_int + records_size_int])
+                    yield decode_records(records_bytes, 0, len(records_bytes), topic_str, partition_int, base_offset_int, base_timestamp_int, [])
+            pos_int += records_size_int
+    elif format_str == SEGMENT_FORMAT_ARROW:
+        yield from decode_arrow_segment_buffer(segment_buffer, topic_str, start_offset_int)
+    else:
+        yield decode_text_segment(bytes(segment_buffer), topic_str, start_pos_int)
+
+# Streaming
+#
+# Segments can also be decoded incrementally from an iterator of chunks (see read_stream() of the admins) such that only the current chunk and batch (binary segments) or line (text segments) have to be kept in memory.
+
+class SegmentStream:
+    def __init__(self, chunk_bytes_iterator):
+        self.chunk_bytes_iterator = iter(chunk_bytes_iterator)
+        self.buffer_bytearray = bytearray()
+        self.pos_int = 0
+
+    def fill(self, size_int):
+        # Make sure that at least size_int bytes are available (return False at the end of the stream).
+        while len(self.buffer_bytearray) - self.pos_int < size_int:
+            chunk_bytes = next(self.chunk_bytes_iterator, None)
+            if chunk_bytes is None:
+                return False
+            # Drop the bytes which have already been read before appending the next chunk.
+            if self.pos_int > 0:
+                del self.buffer_bytearray[:self.pos_int]
+                self.pos_int = 0
+            self.buffer_bytearray += chunk_bytes
+        #
+        return True
+
+    def peek(self, size_int):
+        self.fill(size_int)
+        #
+        return bytes(self.buffer_bytearray[self.pos_int:self.pos_int + size_int])
+
+    def read(self, size_int):
+        if not self.fill(size_int):
+            raise Exception("Unexpected end of segment.")
+        #
+        data_bytes = bytes(self.buffer_bytearray[self.pos_int:self.pos_int + size_int])
+        self.pos_int += size_int
+        #
+        return data_bytes
+
+    def read_up_to(self, size_int):
+        # Like read(), but return fewer bytes at the end of the stream (and all remaining bytes if size_int < 0).
+        if size_int < 0:
+            while self.fill(len(self.buffer_bytearray) - self.pos_int + 1):
+                pass
+            size_int = len(self.buffer_bytearray) - self.pos_int
+        else:
+            self.fill(size_int)
+        #
+        data_bytes = bytes(self.buffer_bytearray[self.pos_int:self.pos_int + size_int])
+        self.pos_int += len(data_bytes)
+        #
+        return data_bytes
+
+    def skip(self, size_int):
+        while size_int > 0:
+            if not self.fill(1):
+                return
+            skip_size_int = min(size_int, len(self.buffer_bytearray) - self.pos_int)
+            self.pos_int += skip_size_int
+            size_int -= skip_size_int
+
+    def read_line(self):
+        # Return the next line (without the trailing newline) or None at the end of the stream.
+        while True:
+            newline_pos_int = self.buffer_bytearray.find(b"\n", self.pos_int)
+            if newline_pos_int != -1:
+                line_bytes = bytes(self.buffer_bytearray[self.pos_int:newline_pos_int])
+                self.pos_int = newline_pos_int + 1
+                return line_bytes
+            #
+            if not self.fill(len(self.buffer_bytearray) - self.pos_int + 1):
+                if len(self.buffer_bytearray) > self.pos_int:
+                    line_bytes = bytes(self.buffer_bytearray[self.pos_int:])
+                    self.pos_int = len(self.buffer_bytearray)
+                    return line_bytes
+                return None
+
+
+def read_segment_batches(segment_stream, start_pos_int=0):
+    # Yield (partition, base offset, base timestamp, max timestamp, number of records, attributes, records) for each batch of a binary segment.
+    (_, version_int, _, partition_int) = SEGMENT_HEADER_STRUCT.unpack(segment_stream.read(SEGMENT_HEADER_SIZE))
+    if version_int > SEGMENT_VERSION:
+        raise Exception(f"Unsupported segment version {version_int} (only versions up to {SEGMENT_VERSION} supported).")
+    #
+    segment_stream.skip(max(start_pos_int, SEGMENT_HEADER_SIZE) - SEGMENT_HEADER_SIZE)
+    #
+    while segment_stream.fill(BATCH_HEADER_SIZE):
+        (base_offset_int, base_timestamp_int, max_timestamp_int, num_records_int, attributes_int, records_size_int) = BATCH_HEADER_STRUCT.unpack(segment_stream.read(BATCH_HEADER_SIZE))
+        records_bytes = segment_stream.read(records_size_int)
+        #
+        yield (partition_int, base_offset_int, base_timestamp_int, max_timestamp_int, num_records_int, attributes_int, records_bytes)
+
+
+def decode_segment_stream(chunk_bytes_iterator, topic_str, start_pos_int=0, start_offset_int=0):
+    # Yield the messages of a segment batch by batch (binary and Arrow segments) or line by line (text segments).
+    segment_stream = SegmentStream(chunk_bytes_iterator)
+    #
+    format_str = get_segment_format_str(segment_stream.peek(len(SEGMENT_MAGIC_BYTES)))
+    if format_str == SEGMENT_FORMAT_BINARY:
+        for (partition_int, base_offset_int, base_timestamp_int, _, num_records_int, attributes_int, records_bytes) in read_segment_batches(segment_stream, start_pos_int):
+            # Skip whole batches below the start offset without decoding (and decompressing) their records.
+            if base_offset_int + num_records_int > start_offset_int:
+                compression_codec_int = attributes_int & COMPRESSION_CODEC_MASK
+                if compression_codec_int != 0:
+                    records_bytes = decompress(compression_codec_int, records_bytes)
+                #
+                yield decode_records(records_bytes, 0, len(records_bytes), topic_str, partition_int, base_offset_int, base_timestamp_int, [])
+    elif format_str == SEGMENT_FORMAT_ARROW:
+        import pyarrow as pa
+        #
+        for recordBatch in read_arrow_record_batches(pa.PythonFile(ArrowSegmentStream(segment_stream), mode="r"), start_offset_int):
+            yield decode_arrow_record_batch(recordBatch, topic_str)
+    else:
+        segment_stream.skip(start_pos_int)
+        #
+        while True:
+            line_bytes = segment_stream.read_line()
+            if line_bytes is None:
+                break
+            #
+            yield [decode_text_message(line_bytes, topic_str)]
+
+
+def find_offset_by_timestamp(chunk_bytes_iterator, to_find_timestamp_int, start_pos_int=0):
+    # Return the offset of the first message with a timestamp >= to_find_timestamp_int (or None if there is no such message). Only reads the segment up to the first matching message.
+    segment_stream = SegmentStream(chunk_bytes_iterator)
+    #
+    format_str = get_segment_format_str(segment_stream.peek(len(SEGMENT_MAGIC_BYTES)))
+    if format_str == SEGMENT_FORMAT_BINARY:
+        for (partition_int, base_offset_int, base_timestamp_int, max_timestamp_int, _, attributes_int, records_bytes) in read_segment_batches(segment_stream, start_pos_int):
+            # Only decode the records of batches which contain a matching message.
+            if max_timestamp_int >= to_find_timestamp_int:
+                compression_codec_int = attributes_int & COMPRESSION_CODEC_MASK
+                if compression_codec_int != 0:
+                    records_bytes = decompress(compression_codec_int, records_bytes)
+                #
+                for message_dict in decode_records(records_bytes, 0, len(records_bytes), None, partition_int, base_offset_int, base_timestamp_int, []):
+                    if message_dict["timestamp"][1] >= to_find_timestamp_int:
+                        return message_dict["offset"]
+    elif format_str == SEGMENT_FORMAT_ARROW:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        #
+        for recordBatch in read_arrow_record_batches(pa.PythonFile(ArrowSegmentStream(segment_stream), mode="r")):
+            # Only look at the individual timestamps of record batches which contain a matching message.
+            if recordBatch.num_rows > 0 and pc.max(recordBatch.column("timestamp")).as_py() >= to_find_timestamp_int:
+                for offset_int, timestamp_int in zip(recordBatch.column("offset").to_pylist(), recordBatch.column("timestamp").to_pylist()):
+                    if timestamp_int >= to_find_timestamp_int:
+                        return offset_int
+    else:
+        segment_stream.skip(start_pos_int)
+        #
+        while True:
+            line_bytes = segment_stream.read_line()
+            if line_bytes is None:
+                break
+            #
+            message_dict = ast.literal_eval(line_bytes.decode("utf-8"))
+            if get_timestamp_tuple(message_dict["timestamp"])[1] >= to_find_timestamp_int:
+                return message_dict["offset"]
+    #
+    return None
+
+# Compression
+
+def get_compression_codec_int(compression_type_str):
+    if compression_type_str is None:
+        return 0
+    #
+    if compression_type_str.lower() not in COMPRESSION_TYPE_STR_CODEC_INT_DICT:
+        raise Exception(f"Unsupported compression type \"{compression_type_str}\" (supported: {', '.join(COMPRESSION_TYPE_STR_CODEC_INT_DICT.keys())}).")
+    #
+    return COMPRESSION_TYPE_STR_CODEC_INT_DICT[compression_type_str.lower()]
+
+
+def check_compression_package(compression_codec_int):
+    # Fail early (e.g. when creating/configuring a topic) instead of with each flush of the producers if the optional package of the compression codec is not installed.
+    if compression_codec_int in COMPRESSION_CODEC_INT_PACKAGE_STR_DICT:
+        package_str = COMPRESSION_CODEC_INT_PACKAGE_STR_DICT[compression_codec_int]
+        if importlib.util.find_spec(package_str) is None:
+            raise Exception(f"Compression codec {compression_codec_int} requires the optional \"{package_str}\" package (pip install {package_str}).")
+
+
+def compress(compression_codec_int, data_bytes):
+    if compression_codec_int == 1:
+        return zlib.compress(data_bytes)
+    elif compression_codec_int == 2:
+        return lzma.compress(data_bytes)
+    elif compression_codec_int == 3:
+        return bz2.compress(data_bytes)
+    elif compression_codec_int == 4:
+        import zstandard
+        #
+        return zstandard.ZstdCompressor().compress(data_bytes)
+    elif compression_codec_int == 5:
+        import lz4.frame
+        #
+        return lz4.frame.compress(data_bytes)
+    else:
+        raise Exception(f"Unsupported compression codec {compression_codec_int}.")
+
+
+def decompress(compression_codec_int, data_bytes):
+    if compression_codec_int == 1:
+        return zlib.decompress(data_bytes)
+    elif compression_codec_int == 2:
+        return lzma.decompress(data_bytes)
+    elif compression_codec_int == 3:
+        return bz2.decompress(data_bytes)
+    elif compression_codec_int == 4:
+        import zstandard
+        #
+        return zstandard.ZstdDecompressor().decompress(data_bytes)
+    elif compression_codec_int == 5:
+        import lz4.frame
+        #
+        return lz4.frame.decompress(data_bytes)
+    else:
+        raise Exception(f"Unsupported compression codec {compression_codec_int}.")
+
+# Helpers
+
+def get_timestamp_tuple(timestamp):
+    return timestamp if isinstance(timestamp, tuple) else (TIMESTAMP_CREATE_TIME, timestamp)
+
+
+def encode_uvarint(int):
+    if int < 0x80:
+        return bytes((int,))
+    #
+    byte_list = []
+    while int >= 0x80:
+        byte_list.append((int & 0x7f) | 0x80)
+        int >>= 7
+    byte_list.append(int)
+    #
+    return bytes(byte_list)
+
+
+def decode_uvarint(buffer, pos_int):
+    int = 0
+    shift_int = 0
+    while True:
+        b = buffer[pos_int]
+        pos_int += 1
+        int |= (b & 0x7f) << shift_int
+        if b < 0x80:
+            return (int, pos_int)
+        shift_int += 7
+
+
+def zigzag_encode(int):
+    return (int << 1) if int >= 0 else ((-int) << 1) - 1
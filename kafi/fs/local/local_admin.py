@@ -1,7 +1,15 @@
+import mmap
 import os
+import shutil
+import uuid
 
 from kafi.fs.fs_admin import FSAdmin
 
+# Constants
+
+READ_STREAM_CHUNK_SIZE = 1048576
+TMP_FILE_SUFFIX = ".tmp"
+
 #
 
 class LocalAdmin(FSAdmin):
@@ -21,6 +29,17 @@ class LocalAdmin(FSAdmin):
         #
         return collected_rel_dir_str_list
 
+    def list_child_dirs(self, abs_path_dir_str):
+        if not os.path.isdir(abs_path_dir_str):
+            return []
+        #
+        with os.scandir(abs_path_dir_str) as dirEntry_iterator:
+            rel_dir_str_list = [dirEntry.name for dirEntry in dirEntry_iterator if dirEntry.is_dir() and not dirEntry.name.endswith(TMP_FILE_SUFFIX)]
+        #
+        rel_dir_str_list.sort()
+        #
+        return rel_dir_str_list
+
     def list_files(self, abs_path_dir_str):
         collected_rel_file_str_list = []
         for abs_root_dir_str, _, rel_file_str_list in os.walk(abs_path_dir_str):
@@ -32,6 +51,24 @@ class LocalAdmin(FSAdmin):
         #
         return collected_rel_file_str_list
 
+    def list_file_versions(self, abs_path_dir_str):
+        if not os.path.isdir(abs_path_dir_str):
+            return {}
+        # Get the versions (see get_file_version()) of all the files directly below abs_path_dir_str from the directory listing itself (without the temporary files of write_str()).
+        with os.scandir(abs_path_dir_str) as dirEntry_iterator:
+            rel_file_str_version_dict = {dirEntry.name: (stat_result.st_ino, stat_result.st_mtime_ns, stat_result.st_size) for dirEntry in dirEntry_iterator if dirEntry.is_file() and not dirEntry.name.endswith(TMP_FILE_SUFFIX) for stat_result in [dirEntry.stat()]}
+        #
+        return rel_file_str_version_dict
+
+    def list_file_sizes(self, abs_path_dir_str):
+        if not os.path.isdir(abs_path_dir_str):
+            return {}
+        # Get the sizes of all the files directly below abs_path_dir_str from the directory listing itself (without reading them).
+        with os.scandir(abs_path_dir_str) as dirEntry_iterator:
+            rel_file_str_size_int_dict = {dirEntry.name: dirEntry.stat().st_size for dirEntry in dirEntry_iterator if dirEntry.is_file() and not dirEntry.name.endswith(TMP_FILE_SUFFIX)}
+        #
+        return rel_file_str_size_int_dict
+
     def delete_file(self, abs_path_file_str):
         os.remove(abs_path_file_str)
 
@@ -41,6 +78,23 @@ class LocalAdmin(FSAdmin):
     def exists_file(self, abs_path_file_str):
         return os.path.exists(abs_path_file_str)
 
+    def get_file_version(self, abs_path_file_str):
+        try:
+            stat_result = os.stat(abs_path_file_str)
+        except FileNotFoundError:
+            return None
+        #
+        # Metadata files are replaced atomically (see write_str()), i.e. each write also changes the inode.
+        return (stat_result.st_ino, stat_result.st_mtime_ns, stat_result.st_size)
+
+    def get_file_mtime_millis(self, abs_path_file_str):
+        try:
+            stat_result = os.stat(abs_path_file_str)
+        except FileNotFoundError:
+            return None
+        #
+        return stat_result.st_mtime_ns // 1000000
+
     # Metadata
     
     def read_str(self, abs_path_file_str):
@@ -54,20 +108,80 @@ class LocalAdmin(FSAdmin):
 
     def write_str(self, abs_path_file_str, data_str):
         os.makedirs(os.path.dirname(abs_path_file_str), exist_ok=True)
+        # Write to a temporary file first and then atomically replace the original file such that concurrent readers never see a partially written metadata/manifest/group file. The name of the temporary file is unique per call (not only per process) such that concurrent writers (e.g. a producer and a consumer thread) do not share it.
+        tmp_abs_path_file_str = f"{abs_path_file_str}.{uuid.uuid4().hex}{TMP_FILE_SUFFIX}"
+        with open(tmp_abs_path_file_str, "w") as bufferedWriter:
+            bufferedWriter.write(data_str)
+        #
+        os.replace(tmp_abs_path_file_str, abs_path_file_str)
+
+    def create_file_exclusive(self, abs_path_file_str, data_str):
+        os.makedirs(os.path.dirname(abs_path_file_str), exist_ok=True)
+        # Atomically create the file only if it does not exist yet (e.g. for lock files).
+        try:
+            fd_int = os.open(abs_path_file_str, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
         #
-        with open(abs_path_file_str, "w") as bufferedWriter:
+        with os.fdopen(fd_int, "w") as bufferedWriter:
             bufferedWriter.write(data_str)
+        #
+        return True
+
+    def get_lock_file_version(self, abs_path_file_str):
+        # Lock files are created anew for each owner and can be created again within the same (coarse) modification time and with the same inode - hence, use their contents (i.e. the unique owner tokens) as their versions.
+        return self.read_str(abs_path_file_str)
+
+    def delete_file_if_version(self, abs_path_file_str, version):
+        # Local file systems do not support conditional deletes - re-read and compare right before deleting (the remaining window is much shorter than the one between reading and breaking an expired lease).
+        if self.get_lock_file_version(abs_path_file_str) != version:
+            return False
+        #
+        try:
+            os.remove(abs_path_file_str)
+        except FileNotFoundError:
+            return False
+        #
+        return True
 
     #
 
-    def read_bytes(self, abs_path_file_str):
+    def read_bytes(self, abs_path_file_str, start_pos_int=0, size_int=-1):
         with open(abs_path_file_str, "rb") as bufferedReader:
-            bytes = bufferedReader.read()
+            bufferedReader.seek(start_pos_int)
+            bytes = bufferedReader.read(size_int)
         #
         return bytes
 
+    def read_stream(self, abs_path_file_str, start_pos_int=0):
+        with open(abs_path_file_str, "rb") as bufferedReader:
+            bufferedReader.seek(start_pos_int)
+            while True:
+                chunk_bytes = bufferedReader.read(READ_STREAM_CHUNK_SIZE)
+                if not chunk_bytes:
+                    break
+                #
+                yield chunk_bytes
+
+    def read_mmap(self, abs_path_file_str):
+        with open(abs_path_file_str, "rb") as bufferedReader:
+            if os.fstat(bufferedReader.fileno()).st_size == 0:
+                return memoryview(b"")
+            # The memory map stays open (and valid after closing the file) as long as there are references to it (or to slices of the returned memoryview).
+            mmap_obj = mmap.mmap(bufferedReader.fileno(), 0, access=mmap.ACCESS_READ)
+        #
+        return memoryview(mmap_obj)
+
     def write_bytes(self, abs_path_file_str, data_bytes):
         os.makedirs(os.path.dirname(abs_path_file_str), exist_ok=True)
         #
         with open(abs_path_file_str, "wb") as bufferedWriter:
             bufferedWriter.write(data_bytes)
+
+    def copy_file(self, source_admin, source_abs_path_file_str, target_abs_path_file_str):
+        if not isinstance(source_admin, LocalAdmin):
+            return super().copy_file(source_admin, source_abs_path_file_str, target_abs_path_file_str)
+        #
+        os.makedirs(os.path.dirname(target_abs_path_file_str), exist_ok=True)
+        # Copy within the kernel (shutil.copyfile() uses os.sendfile() on Linux) instead of reading the file into memory.
+        shutil.copyfile(source_abs_path_file_str, target_abs_path_file_str)
@@ -8,11 +8,16 @@ from kafi.fs.fs_admin import FSAdmin
 class S3Admin(FSAdmin):
     def __init__(self, s3_obj):
         from minio import Minio
+        import urllib3
         #
 
         super().__init__(s3_obj)
         #
-        self.minio = Minio(s3_obj.s3_config_dict["endpoint"], access_key=s3_obj.s3_config_dict["access.key"], secret_key=s3_obj.s3_config_dict["secret.key"], secure=False)
+        # One long-lived client per storage object, with a connection pool large enough for the prefetching consumers and the parallel multipart uploads.
+        maxsize_int = max(10, s3_obj.fetch_num_workers(), s3_obj.max_concurrency())
+        poolManager = urllib3.PoolManager(timeout=urllib3.Timeout(connect=300, read=300), maxsize=maxsize_int, retries=urllib3.Retry(total=5, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504]))
+        #
+        self.minio = Minio(s3_obj.s3_config_dict["endpoint"], access_key=s3_obj.s3_config_dict["access.key"], secret_key=s3_obj.s3_config_dict["secret.key"], secure=False, http_client=poolManager)
 
     # Topics/Files
 
@@ -25,6 +30,15 @@ class S3Admin(FSAdmin):
         #
         return rel_dir_str_list
 
+    def list_child_dirs(self, abs_path_dir_str):
+        # Non-recursive listing, i.e. only the common prefixes directly below abs_path_dir_str are returned.
+        object_generator = self.minio.list_objects(self.storage_obj.bucket_name(), prefix=os.path.join(abs_path_dir_str, ""), recursive=False)
+        rel_dir_str_list = [os.path.basename(os.path.dirname(object.object_name)) for object in object_generator if object.is_dir]
+        #
+        rel_dir_str_list.sort()
+        #
+        return rel_dir_str_list
+
     def list_files(self, abs_path_dir_str):
         object_generator = self.minio.list_objects(self.storage_obj.bucket_name(), prefix=abs_path_dir_str, recursive=True)
         rel_file_str_set = set([os.path.relpath(object.object_name, abs_path_dir_str) for object in object_generator])
@@ -34,6 +48,20 @@ class S3Admin(FSAdmin):
         #
         return rel_file_str_list
 
+    def list_file_versions(self, abs_path_dir_str):
+        # Get the versions (ETags, see get_file_version()) of all the objects directly below abs_path_dir_str from the listing itself.
+        object_generator = self.minio.list_objects(self.storage_obj.bucket_name(), prefix=os.path.join(abs_path_dir_str, ""), recursive=False)
+        rel_file_str_version_dict = {os.path.basename(object.object_name): object.etag for object in object_generator if not object.is_dir}
+        #
+        return rel_file_str_version_dict
+
+    def list_file_sizes(self, abs_path_dir_str):
+        # Get the sizes of all the objects directly below abs_path_dir_str from the listing itself (without downloading them).
+        object_generator = self.minio.list_objects(self.storage_obj.bucket_name(), prefix=os.path.join(abs_path_dir_str, ""), recursive=False)
+        rel_file_str_size_int_dict = {os.path.basename(object.object_name): object.size for object in object_generator if not object.is_dir}
+        #
+        return rel_file_str_size_int_dict
+
     def delete_file(self, abs_path_file_str):
         self.minio.remove_object(self.storage_obj.bucket_name(), abs_path_file_str)
 
@@ -50,11 +78,33 @@ class S3Admin(FSAdmin):
         except MinioException:
             return False
 
+    def get_file_version(self, abs_path_file_str):
+        from minio.error import MinioException
+        #
+
+        try:
+            object = self.minio.stat_object(self.storage_obj.bucket_name(), abs_path_file_str)
+            return object.etag
+        except MinioException:
+            return None
+
+    def get_file_mtime_millis(self, abs_path_file_str):
+        from minio.error import MinioException
+        #
+
+        try:
+            object = self.minio.stat_object(self.storage_obj.bucket_name(), abs_path_file_str)
+            return int(object.last_modified.timestamp() * 1000)
+        except MinioException:
+            return None
+
+    def get_segment_cache_key_str(self, abs_path_file_str, version):
+        return f"s3://{self.storage_obj.s3_config_dict['endpoint']}/{self.storage_obj.bucket_name()}/{abs_path_file_str}#{version}"
+
     # Metadata
     
     def read_str(self, abs_path_file_str):
-        response = self.minio.get_object(self.storage_obj.bucket_name(), abs_path_file_str)
-        object_bytes = response.data
+        object_bytes = self.read_bytes(abs_path_file_str)
         #
         object_str = object_bytes.decode("utf-8")
         #
@@ -63,25 +113,74 @@ class S3Admin(FSAdmin):
     def write_str(self, abs_path_file_str, data_str):
         data_bytes = data_str.encode("utf-8")
         #
-        self.minio.put_object(self.storage_obj.bucket_name(), abs_path_file_str, io.BytesIO(data_bytes), length=len(data_bytes))
+        self.write_bytes(abs_path_file_str, data_bytes)
 
-    #
-
-    def read_bytes(self, abs_path_file_str):
-        from minio import Minio
+    def create_file_exclusive(self, abs_path_file_str, data_str):
+        from minio.error import S3Error
         #
 
-        self.minio = Minio(self.storage_obj.s3_config_dict["endpoint"], access_key=self.storage_obj.s3_config_dict["access.key"], secret_key=self.storage_obj.s3_config_dict["secret.key"], secure=False)
+        # Conditional write (only create the object if it does not exist yet, e.g. for lock files).
+        try:
+            self.execute_conditional("PUT", abs_path_file_str, {"If-None-Match": "*"}, data_str.encode("utf-8"))
+            return True
+        except S3Error as e:
+            if e.code in ["PreconditionFailed", "ConditionalRequestConflict"]:
+                return False
+            raise
+
+    def delete_file_if_version(self, abs_path_file_str, version):
+        from minio.error import S3Error
         #
-        response = self.minio.get_object(self.storage_obj.bucket_name(), abs_path_file_str)
-        object_bytes = response.data
+
+        # Conditional delete (only delete the object if its ETag has not changed, e.g. for breaking expired lock files).
+        try:
+            self.execute_conditional("DELETE", abs_path_file_str, {"If-Match": f"\"{version}\""})
+            return True
+        except S3Error as e:
+            if e.code in ["PreconditionFailed", "ConditionalRequestConflict", "NoSuchKey"]:
+                return False
+            raise
+
+    def execute_conditional(self, method_str, abs_path_file_str, headers_str_str_dict, data_bytes=None):
+        # The public API of minio (up to at least 7.2) does not support conditional requests (put_object() sends all non-standard headers as user metadata, remove_object() does not take any headers) - hence, this is the only place which uses its private _execute().
+        response = self.minio._execute(method_str, self.storage_obj.bucket_name(), abs_path_file_str, body=data_bytes, headers=headers_str_str_dict, no_body_trace=True)
+        response.close()
+
+    #
+
+    def read_bytes(self, abs_path_file_str, start_pos_int=0, size_int=-1):
+        # Ranged GET if only a part of the object is needed (length 0 = up to the end of the object).
+        response = self.minio.get_object(self.storage_obj.bucket_name(), abs_path_file_str, offset=start_pos_int, length=max(size_int, 0))
+        try:
+            # Download in chunks (instead of buffering the whole response in urllib3) and return the connection to the pool afterwards.
+            bytesIO = io.BytesIO()
+            for chunk_bytes in response.stream(self.storage_obj.part_size()):
+                bytesIO.write(chunk_bytes)
+            object_bytes = bytesIO.getvalue()
+        finally:
+            response.close()
+            response.release_conn()
         #
         return object_bytes
 
+    def read_stream(self, abs_path_file_str, start_pos_int=0):
+        response = self.minio.get_object(self.storage_obj.bucket_name(), abs_path_file_str, offset=start_pos_int)
+        try:
+            for chunk_bytes in response.stream(self.storage_obj.part_size()):
+                yield chunk_bytes
+        finally:
+            response.close()
+            response.release_conn()
+
     def write_bytes(self, abs_path_file_str, data_bytes):
-        from minio import Minio
-        #
+        # Objects larger than part.size are uploaded as multipart uploads with max.concurrency parallel part uploads.
+        self.minio.put_object(self.storage_obj.bucket_name(), abs_path_file_str, io.BytesIO(data_bytes), length=len(data_bytes), part_size=self.storage_obj.part_size(), num_parallel_uploads=self.storage_obj.max_concurrency())
 
-        self.minio = Minio(self.storage_obj.s3_config_dict["endpoint"], access_key=self.storage_obj.s3_config_dict["access.key"], secret_key=self.storage_obj.s3_config_dict["secret.key"], secure=False)
+    def copy_file(self, source_admin, source_abs_path_file_str, target_abs_path_file_str):
+        from minio.commonconfig import ComposeSource
         #
-        self.minio.put_object(self.storage_obj.bucket_name(), abs_path_file_str, io.BytesIO(data_bytes), length=len(data_bytes))
+        # Server-side copies are only possible on the same endpoint (and with the same credentials), also between buckets.
+        if not isinstance(source_admin, S3Admin) or any(source_admin.storage_obj.s3_config_dict[key_str] != self.storage_obj.s3_config_dict[key_str] for key_str in ["endpoint", "access.key"]):
+            return super().copy_file(source_admin, source_abs_path_file_str, target_abs_path_file_str)
+        # compose_object() copies objects larger than 5 GiB part by part (copy_object() only supports up to 5 GiB).
+        self.minio.compose_object(self.storage_obj.bucket_name(), target_abs_path_file_str, [ComposeSource(source_admin.storage_obj.bucket_name(), source_abs_path_file_str)])
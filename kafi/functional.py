@@ -97,11 +97,27 @@ class Functional:
         #
         produce_batch_size_int = kwargs["produce_batch_size"] if "produce_batch_size" in kwargs else target_storage.produce_batch_size()
         #
+        def idle_function(acc_consume_message_counter_int_produce_batch_size_int_produce_batch_message_dict_list_produce_message_counter_int_tuple):
+            (acc, consume_message_counter_int, produce_batch_size_int, produce_batch_message_dict_list, produce_message_counter_int) = acc_consume_message_counter_int_produce_batch_size_int_produce_batch_message_dict_list_produce_message_counter_int_tuple
+            # In follow mode, write the (incomplete) batch as soon as there are no new messages (instead of waiting for the batch to fill up).
+            if len(produce_batch_message_dict_list) > 0:
+                target_producer.produce_list(produce_batch_message_dict_list, **target_kwargs)
+                produce_message_counter_int += len(produce_batch_message_dict_list)
+            target_producer.flush()
+            #
+            return (acc, consume_message_counter_int, produce_batch_size_int, [], produce_message_counter_int)
+        #
         consumer = self.consumer(topic, **source_kwargs)
         #
         target_producer = target_storage.producer(target_topic, **target_kwargs)
         #
-        (acc, consume_message_counter_int, _, produce_batch_message_dict_list, produce_message_counter_int) = consumer.foldl(foldl_to_function1, (initial_acc, 0, produce_batch_size_int, [], 0), n, **kwargs)
+        try:
+            (acc, consume_message_counter_int, _, produce_batch_message_dict_list, produce_message_counter_int) = consumer.foldl(foldl_to_function1, (initial_acc, 0, produce_batch_size_int, [], 0), n, idle_function=idle_function, **kwargs)
+        except Exception:
+            # Write the messages produced before the error (producers do not flush on garbage collection).
+            consumer.close()
+            target_producer.close()
+            raise
         #
         consumer.close()
         #
@@ -3,5 +3,7 @@ from kafi.kafka.restproxy.restproxy import *
 from kafi.fs.azureblob.azureblob import *
 from kafi.fs.local.local import *
 from kafi.fs.s3.s3 import *
+from kafi.sqlite.sqlite import *
+from kafi.memory.memory import *
 from kafi.helpers import *
 
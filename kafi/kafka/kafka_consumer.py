@@ -26,6 +26,9 @@ class KafkaConsumer(StorageConsumer):
         #
         break_function = kwargs["break_function"] if "break_function" in kwargs else lambda _, _1: False
         #
+        follow_bool = kwargs["follow"] if "follow" in kwargs else False
+        idle_function = kwargs["idle_function"] if "idle_function" in kwargs else None
+        #
         message_counter_int = 0
         #
         acc = initial_acc
@@ -33,7 +36,12 @@ class KafkaConsumer(StorageConsumer):
         while True:
             message_dict_list = self.consume_impl(n=consume_batch_size_int, **kwargs)
             if not message_dict_list:
-                break
+                if not follow_bool:
+                    break
+                # Follow mode - consume_impl() already blocks (long-polls) for up to consume.timeout (cluster) or consumer.request.timeout.ms (REST Proxy) - let the caller flush (e.g. its producer) and poll again.
+                if idle_function is not None:
+                    acc = idle_function(acc)
+                continue
             #
             topic_str_offsets_dict_dict = {}
             for message_dict in message_dict_list:
@@ -0,0 +1,66 @@
+from kafi.storage import Storage
+from kafi.memory.memory_admin import MemoryAdmin
+from kafi.memory.memory_consumer import MemoryConsumer
+from kafi.memory.memory_producer import MemoryProducer
+
+#
+
+class Memory(Storage):
+    def __init__(self, config_str):
+        super().__init__("memories", config_str, ["memory"], ["schema_registry"])
+        #
+        self.memory_config_dict = self.config_dict["memory"]
+        #
+        if "name" not in self.memory_config_dict:
+            self.name("default")
+        else:
+            self.name(str(self.memory_config_dict["name"]))
+        #
+        # kafi section
+        #
+        # Committing is just a dictionary update, hence commit after each message by default.
+        if "commit.interval.messages" not in self.kafi_config_dict:
+            self.commit_interval_messages(1)
+        else:
+            self.commit_interval_messages(int(self.kafi_config_dict["commit.interval.messages"]))
+        #
+        if "commit.interval.ms" not in self.kafi_config_dict:
+            self.commit_interval_ms(0)
+        else:
+            self.commit_interval_ms(int(self.kafi_config_dict["commit.interval.ms"]))
+        #
+        self.admin = self.get_admin()
+
+    # kafi
+
+    def commit_interval_messages(self, new_value=None): # int
+        return self.get_set_config("commit.interval.messages", new_value)
+
+    def commit_interval_ms(self, new_value=None): # int
+        return self.get_set_config("commit.interval.ms", new_value)
+
+    # memory
+
+    def name(self, new_value=None): # str
+        return self.get_set_config("name", new_value, dict=self.memory_config_dict)
+
+    #
+
+    def get_admin(self):
+        admin = MemoryAdmin(self)
+        #
+        return admin
+
+    #
+
+    def get_consumer(self, topic, **kwargs):
+        consumer = MemoryConsumer(self, topic, **kwargs)
+        #
+        return consumer
+
+    #
+
+    def get_producer(self, topic, **kwargs):
+        producer = MemoryProducer(self, topic, **kwargs)
+        #
+        return producer
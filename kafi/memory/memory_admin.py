@@ -0,0 +1,309 @@
+from fnmatch import fnmatch
+import threading
+
+from kafi.storage_admin import StorageAdmin
+from kafi.helpers import get_millis, pattern_match
+
+# Constants
+
+OFFSET_INVALID = -1001
+
+# All Memory storage objects with the same name share the same topics and consumer groups (within the current process).
+NAME_STR_STORE_DICT_DICT = {}
+NAME_STR_STORE_DICT_DICT_LOCK = threading.Lock()
+
+#
+
+class MemoryAdmin(StorageAdmin):
+    def __init__(self, memory_obj, **kwargs):
+        super().__init__(memory_obj, **kwargs)
+
+    #
+
+    def get_store(self):
+        # The store is looked up by name on each call (the name can be changed using name()).
+        name_str = self.storage_obj.name()
+        #
+        with NAME_STR_STORE_DICT_DICT_LOCK:
+            if name_str not in NAME_STR_STORE_DICT_DICT:
+                # Each partition is an in-memory log (a list of (timestamp_type, timestamp, key, value, headers) tuples) plus its low watermark - the offset of a message is the low watermark plus its index in the list. The condition guards all topics and groups of the store and is notified whenever messages are appended (for consumers in follow mode).
+                NAME_STR_STORE_DICT_DICT[name_str] = {"condition": threading.Condition(), "topics": {}, "groups": {}}
+            #
+            return NAME_STR_STORE_DICT_DICT[name_str]
+
+    def get_condition(self):
+        return self.get_store()["condition"]
+
+    def get_topic_dict(self, topic_str):
+        topic_str_topic_dict_dict = self.get_store()["topics"]
+        #
+        if topic_str not in topic_str_topic_dict_dict:
+            raise Exception(f"Topic \"{topic_str}\" does not exist.")
+        #
+        return topic_str_topic_dict_dict[topic_str]
+
+    #
+
+    def list_topics(self, pattern=None):
+        with self.get_condition():
+            all_topic_str_list = list(self.get_store()["topics"].keys())
+        #
+        topic_str_list = pattern_match(all_topic_str_list, pattern)
+        #
+        return topic_str_list
+
+    def list_groups(self, pattern=None):
+        with self.get_condition():
+            all_group_str_list = list(self.get_store()["groups"].keys())
+        #
+        group_str_list = pattern_match(all_group_str_list, pattern)
+        #
+        return group_str_list
+
+    #
+
+    def config(self, pattern, config=None, **kwargs):
+        config_dict = config
+        #
+        topic_str_list = self.list_topics(pattern)
+        #
+        if config_dict is not None:
+            with self.get_condition():
+                for topic_str in topic_str_list:
+                    self.get_topic_dict(topic_str)["config"] = dict(config_dict)
+        #
+        topic_str_config_dict_dict = {topic_str: self.get_config(topic_str) for topic_str in topic_str_list}
+        #
+        return topic_str_config_dict_dict
+
+    #
+
+    def create(self, topic, partitions=1, config={}, **kwargs):
+        topic_str = topic
+        config_dict = config
+        partitions_int = partitions
+        #
+        with self.get_condition():
+            topic_str_topic_dict_dict = self.get_store()["topics"]
+            if topic_str in topic_str_topic_dict_dict:
+                raise Exception(f"Topic \"{topic_str}\" already exists.")
+            #
+            topic_str_topic_dict_dict[topic_str] = {"partitions": partitions_int, "config": dict(config_dict), "logs": {partition_int: [] for partition_int in range(partitions_int)}, "low_offsets": {partition_int: 0 for partition_int in range(partitions_int)}}
+
+    #
+
+    def delete(self, pattern, **kwargs):
+        topic_str_list = self.list_topics(pattern)
+        #
+        with self.get_condition():
+            for topic_str in topic_str_list:
+                self.get_store()["topics"].pop(topic_str, None)
+        #
+        return topic_str_list
+
+    def delete_records(self, pattern_or_offsets, **kwargs):
+        # Either delete all messages of the topics matching the pattern or those before the given offsets, e.g. {"topic": {0: 2}}.
+        if isinstance(pattern_or_offsets, dict):
+            topic_str_offsets_dict_dict = pattern_or_offsets
+        else:
+            topic_str_offsets_dict_dict = {topic_str: {partition_int: offsets_tuple[1] for partition_int, offsets_tuple in partition_int_offsets_tuple_dict.items()} for topic_str, partition_int_offsets_tuple_dict in self.watermarks(pattern_or_offsets).items()}
+        #
+        with self.get_condition():
+            for topic_str, offsets_dict in topic_str_offsets_dict_dict.items():
+                topic_dict = self.get_topic_dict(topic_str)
+                for partition_int, offset_int in offsets_dict.items():
+                    log_list = topic_dict["logs"][partition_int]
+                    low_offset_int = topic_dict["low_offsets"][partition_int]
+                    # Drop the head of the log (and move the low watermark) - never beyond the high watermark.
+                    n_int = max(0, min(offset_int - low_offset_int, len(log_list)))
+                    del log_list[:n_int]
+                    topic_dict["low_offsets"][partition_int] = low_offset_int + n_int
+        #
+        return topic_str_offsets_dict_dict
+
+    #
+
+    def offsets_for_times(self, pattern, partitions_timestamps, **kwargs):
+        partition_int_timestamp_int_dict = partitions_timestamps
+        #
+        topic_str_list = self.list_topics(pattern)
+        #
+        topic_str_partition_int_offsets_int_dict_dict = {}
+        with self.get_condition():
+            for topic_str in topic_str_list:
+                topic_dict = self.get_topic_dict(topic_str)
+                for partition_int, timestamp_int in partition_int_timestamp_int_dict.items():
+                    low_offset_int = topic_dict["low_offsets"][partition_int]
+                    # Timestamps are not necessarily increasing, hence scan the log for the first message with a timestamp >= the given one.
+                    offset_int = next((low_offset_int + index_int for index_int, message_tuple in enumerate(topic_dict["logs"][partition_int]) if message_tuple[1] >= timestamp_int), None)
+                    if offset_int is not None:
+                        if topic_str not in topic_str_partition_int_offsets_int_dict_dict:
+                            topic_str_partition_int_offsets_int_dict_dict[topic_str] = {}
+                        #
+                        topic_str_partition_int_offsets_int_dict_dict[topic_str][partition_int] = offset_int
+        #
+        return topic_str_partition_int_offsets_int_dict_dict
+
+    #
+
+    def partitions(self, pattern=None, partitions=None, verbose=False, **kwargs):
+        partitions_int = partitions
+        #
+        topic_str_list = self.list_topics(pattern)
+        #
+        if partitions_int is not None:
+            with self.get_condition():
+                for topic_str in topic_str_list:
+                    topic_dict = self.get_topic_dict(topic_str)
+                    topic_dict["partitions"] = partitions_int
+                    for partition_int in range(partitions_int):
+                        if partition_int not in topic_dict["logs"]:
+                            topic_dict["logs"][partition_int] = []
+                            topic_dict["low_offsets"][partition_int] = 0
+        #
+        topic_str_partitions_int_dict = {topic_str: self.get_partitions(topic_str) for topic_str in topic_str_list}
+        #
+        return topic_str_partitions_int_dict
+
+    #
+
+    def watermarks(self, pattern, **kwargs):
+        topic_str_list = self.list_topics(pattern)
+        #
+        topic_str_partition_int_offsets_tuple_dict_dict = {topic_str: self.get_watermarks(topic_str) for topic_str in topic_str_list}
+        #
+        return topic_str_partition_int_offsets_tuple_dict_dict
+
+    #
+
+    def delete_groups(self, pattern, state_pattern="*"):
+        group_str_list = self.groups(pattern, state_pattern)
+        #
+        with self.get_condition():
+            for group_str in group_str_list:
+                self.get_store()["groups"].pop(group_str, None)
+        #
+        return group_str_list
+
+    def describe_groups(self, pattern="*", state_pattern="*"):
+        group_str_state_str_dict = self.groups(pattern, state_pattern, state=True)
+        #
+        group_str_group_description_dict_dict = {group_str: {"group_id": group_str, "is_simple_consumer_group": False, "partition_assignor": "range", "state": state_str} for group_str, state_str in group_str_state_str_dict.items()}
+        #
+        return group_str_group_description_dict_dict
+
+    def groups(self, pattern="*", state_pattern="*", state=False):
+        state_bool = state
+        #
+        state_pattern_str_list = [state_pattern] if isinstance(state_pattern, str) else state_pattern
+        #
+        with self.get_condition():
+            group_str_state_str_dict = {group_str: group_dict["state"] for group_str, group_dict in self.get_store()["groups"].items()}
+        group_str_list = pattern_match(list(group_str_state_str_dict.keys()), pattern)
+        group_str_state_str_dict = {group_str: group_str_state_str_dict[group_str] for group_str in group_str_list if any(fnmatch(group_str_state_str_dict[group_str], state_pattern_str) for state_pattern_str in state_pattern_str_list)}
+        #
+        if state_bool:
+            return group_str_state_str_dict
+        else:
+            return list(group_str_state_str_dict.keys())
+
+    def group_offsets(self, pattern, group_offsets=None, state_pattern="*"):
+        topic_str_offsets_dict_dict = group_offsets
+        #
+        group_str_list = self.groups(pattern, state_pattern)
+        #
+        if topic_str_offsets_dict_dict is not None:
+            for group_str in group_str_list:
+                self.commit_offsets(group_str, topic_str_offsets_dict_dict)
+        #
+        group_str_topic_str_offsets_dict_dict_dict = {group_str: self.get_group_offsets(group_str) for group_str in group_str_list}
+        #
+        return group_str_topic_str_offsets_dict_dict_dict
+
+    # Topics/Partitions
+
+    def get_partitions(self, topic_str):
+        with self.get_condition():
+            return self.get_topic_dict(topic_str)["partitions"]
+
+    def get_config(self, topic_str):
+        with self.get_condition():
+            return dict(self.get_topic_dict(topic_str)["config"])
+
+    def get_watermarks(self, topic_str):
+        with self.get_condition():
+            topic_dict = self.get_topic_dict(topic_str)
+            #
+            partition_int_offsets_tuple_dict = {partition_int: (topic_dict["low_offsets"][partition_int], topic_dict["low_offsets"][partition_int] + len(topic_dict["logs"][partition_int])) for partition_int in range(topic_dict["partitions"])}
+        #
+        return partition_int_offsets_tuple_dict
+
+    # Messages
+
+    def append_messages(self, topic_str, partition_int_message_dict_list_dict):
+        condition = self.get_condition()
+        with condition:
+            topic_dict = self.get_topic_dict(topic_str)
+            for partition_int, message_dict_list in partition_int_message_dict_list_dict.items():
+                topic_dict["logs"][partition_int].extend((message_dict["timestamp"][0], message_dict["timestamp"][1], message_dict["key"], message_dict["value"], message_dict["headers"]) for message_dict in message_dict_list)
+            # Wake up the consumers waiting for new messages.
+            condition.notify_all()
+
+    def read_messages(self, topic_str, partition_int, start_offset_int, n_int):
+        with self.get_condition():
+            topic_dict = self.get_topic_dict(topic_str)
+            low_offset_int = topic_dict["low_offsets"][partition_int]
+            # Messages before the low watermark have been deleted.
+            start_offset_int = max(start_offset_int, low_offset_int)
+            start_index_int = start_offset_int - low_offset_int
+            message_tuple_list = topic_dict["logs"][partition_int][start_index_int:start_index_int + n_int]
+        #
+        message_dict_list = [{"topic": topic_str, "value": value_bytes, "key": key_bytes, "timestamp": (timestamp_type_int, timestamp_int), "headers": list(headers_str_bytes_tuple_list) if headers_str_bytes_tuple_list is not None else None, "partition": partition_int, "offset": offset_int} for offset_int, (timestamp_type_int, timestamp_int, key_bytes, value_bytes, headers_str_bytes_tuple_list) in enumerate(message_tuple_list, start_offset_int)]
+        #
+        return message_dict_list
+
+    def wait_for_new_messages(self, topic_str_high_offsets_dict_dict, timeout_float=None):
+        # Block until messages have been appended to one of the topics (or the timeout has expired).
+        def get_high_offsets():
+            return {topic_str: {partition_int: offsets_tuple[1] for partition_int, offsets_tuple in self.get_watermarks(topic_str).items()} for topic_str in topic_str_high_offsets_dict_dict}
+        #
+        condition = self.get_condition()
+        with condition:
+            return condition.wait_for(lambda: get_high_offsets() != topic_str_high_offsets_dict_dict, timeout_float)
+
+    # Groups
+
+    def init_group(self, group_str, topic_str_list):
+        # Create the group (if it does not exist yet) and set the offsets of all partitions without committed offsets to OFFSET_INVALID.
+        with self.get_condition():
+            group_str_group_dict_dict = self.get_store()["groups"]
+            if group_str not in group_str_group_dict_dict:
+                group_str_group_dict_dict[group_str] = {"state": "stable", "last_update": get_millis(), "offsets": {}}
+            #
+            group_dict = group_str_group_dict_dict[group_str]
+            group_dict["state"] = "stable"
+            group_dict["last_update"] = get_millis()
+            #
+            for topic_str in topic_str_list:
+                offsets_dict = group_dict["offsets"].setdefault(topic_str, {})
+                for partition_int in range(self.get_topic_dict(topic_str)["partitions"]):
+                    offsets_dict.setdefault(partition_int, OFFSET_INVALID)
+
+    def get_group_offsets(self, group_str):
+        with self.get_condition():
+            topic_str_offsets_dict_dict = {topic_str: dict(sorted(offsets_dict.items())) for topic_str, offsets_dict in sorted(self.get_store()["groups"][group_str]["offsets"].items())}
+        #
+        return topic_str_offsets_dict_dict
+
+    def commit_offsets(self, group_str, topic_str_offsets_dict_dict):
+        with self.get_condition():
+            group_dict = self.get_store()["groups"][group_str]
+            for topic_str, offsets_dict in topic_str_offsets_dict_dict.items():
+                group_dict["offsets"].setdefault(topic_str, {}).update(offsets_dict)
+            group_dict["last_update"] = get_millis()
+
+    def set_group_state(self, group_str, state_str):
+        with self.get_condition():
+            group_dict = self.get_store()["groups"][group_str]
+            group_dict["state"] = state_str
+            group_dict["last_update"] = get_millis()
@@ -0,0 +1,35 @@
+from kafi.cursor_consumer import CursorConsumer
+
+#
+
+class MemoryConsumer(CursorConsumer):
+    def __init__(self, memory_obj, *topics, **kwargs):
+        super().__init__(memory_obj, *topics, **kwargs)
+        # Create the group (or set it to stable again) and initialize the offsets of the partitions without committed offsets.
+        self.storage_obj.admin.init_group(self.group_str, self.topic_str_list)
+
+    #
+
+    def leave_group(self):
+        self.storage_obj.admin.set_group_state(self.group_str, "empty")
+
+    #
+
+    def wait_for_new_messages(self, topic_str_high_offsets_dict_dict):
+        # Wait until a producer appends new messages (no polling).
+        self.storage_obj.admin.wait_for_new_messages(topic_str_high_offsets_dict_dict)
+
+    #
+
+    def offsets(self):
+        topic_str_offsets_dict_dict = self.storage_obj.admin.get_group_offsets(self.group_str)
+        #
+        topic_str_offsets_dict_dict = {topic_str: topic_str_offsets_dict_dict[topic_str] if topic_str in topic_str_offsets_dict_dict else {} for topic_str in self.topic_str_list}
+        #
+        return topic_str_offsets_dict_dict
+
+    def get_committed_offsets(self, topic_str):
+        return self.storage_obj.admin.get_group_offsets(self.group_str)[topic_str]
+
+    def commit_offsets(self, topic_str_offsets_dict_dict):
+        self.storage_obj.admin.commit_offsets(self.group_str, topic_str_offsets_dict_dict)
@@ -0,0 +1,79 @@
+from kafi.storage_producer import StorageProducer
+from kafi.helpers import get_millis
+
+# Constants
+
+CURRENT_TIME = 0
+RD_KAFKA_PARTITION_UA = -1
+TIMESTAMP_CREATE_TIME = 1
+
+#
+
+class MemoryProducer(StorageProducer):
+    def __init__(self, memory_obj, topic, **kwargs):
+        super().__init__(memory_obj, topic, **kwargs)
+        #
+        if not memory_obj.exists(self.topic_str):
+            memory_obj.create(self.topic_str)
+        #
+        self.partitions_int = self.storage_obj.admin.get_partitions(self.topic_str)
+
+    #
+
+    def close(self):
+        return self.topic_str
+
+    #
+
+    def produce(self, value, **kwargs):
+        key = kwargs["key"] if "key" in kwargs else None
+        partition = kwargs["partition"] if "partition" in kwargs else RD_KAFKA_PARTITION_UA
+        timestamp = kwargs["timestamp"] if "timestamp" in kwargs else CURRENT_TIME
+        headers = kwargs["headers"] if "headers" in kwargs else None
+        #
+        value_list = value if isinstance(value, list) else [value]
+        #
+        key_list = key if isinstance(key, list) else [key for _ in value_list]
+        #
+        partition_int_list = partition if isinstance(partition, list) else [partition for _ in value_list]
+        #
+        timestamp_list = timestamp if isinstance(timestamp, list) else [timestamp for _ in value_list]
+        #
+        headers_list = headers if isinstance(headers, list) and all(self.storage_obj.is_headers(headers1) for headers1 in headers) and len(headers) == len(value_list) else [headers for _ in value_list]
+        headers_str_bytes_tuple_list_list = [self.storage_obj.headers_to_headers_str_bytes_tuple_list(headers) for headers in headers_list]
+        #
+        round_robin_counter_int = 0
+        #
+        partition_int_message_dict_list_dict = {}
+        for value, key, timestamp, headers_str_bytes_tuple_list, partition_int in zip(value_list, key_list, timestamp_list, headers_str_bytes_tuple_list_list, partition_int_list):
+            if partition_int is RD_KAFKA_PARTITION_UA:
+                if key is None:
+                    partition_int = round_robin_counter_int
+                    if round_robin_counter_int == self.partitions_int - 1:
+                        round_robin_counter_int = 0
+                    else:
+                        round_robin_counter_int += 1
+                else:
+                    partition_int = hash(str(key)) % self.partitions_int
+            #
+            if timestamp == CURRENT_TIME:
+                timestamp = (TIMESTAMP_CREATE_TIME, get_millis())
+            elif not isinstance(timestamp, tuple):
+                timestamp = (TIMESTAMP_CREATE_TIME, timestamp)
+            #
+            key_str_or_bytes = self.serialize(key, True)
+            value_str_or_bytes = self.serialize(value, False)
+            #
+            message_dict = {"value": value_str_or_bytes, "key": key_str_or_bytes, "timestamp": timestamp, "headers": headers_str_bytes_tuple_list}
+            #
+            if partition_int not in partition_int_message_dict_list_dict:
+                partition_int_message_dict_list_dict[partition_int] = []
+            partition_int_message_dict_list_dict[partition_int].append(message_dict)
+            #
+            self.written_counter_int += 1
+        #
+        # Append all messages of this call at once (taking the lock of the store only once).
+        if len(partition_int_message_dict_list_dict) > 0:
+            self.storage_obj.admin.append_messages(self.topic_str, partition_int_message_dict_list_dict)
+        #
+        return self.written_counter_int
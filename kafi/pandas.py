@@ -27,6 +27,18 @@ class Pandas(Functional):
         #
         return df
 
+    def topic_to_arrow(self, topic, n=ALL_MESSAGES, **kwargs):
+        import pyarrow as pa
+        #
+        def foldl_function(acc, message_dict):
+            acc.append({"partition": message_dict["partition"], "offset": message_dict["offset"], "timestamp_type": message_dict["timestamp"][0], "timestamp": message_dict["timestamp"][1], "key": message_dict["key"], "value": message_dict["value"], "headers": [{"key": header_key_str, "value": header_value_bytes} for header_key_str, header_value_bytes in message_dict["headers"]] if message_dict["headers"] is not None else None})
+            #
+            return acc
+        #
+        (row_dict_list, _) = self.foldl(topic, foldl_function, [], n, **kwargs)
+        #
+        return pa.Table.from_pylist(row_dict_list)
+
     def df_to_topic(self, df, topic, n=ALL_MESSAGES, **kwargs):
         n_int = n
         #
@@ -0,0 +1,81 @@
+from kafi.storage import Storage
+from kafi.sqlite.sqlite_admin import SQLiteAdmin
+from kafi.sqlite.sqlite_consumer import SQLiteConsumer
+from kafi.sqlite.sqlite_producer import SQLiteProducer
+
+#
+
+class SQLite(Storage):
+    def __init__(self, config_str):
+        super().__init__("sqlites", config_str, ["sqlite"], ["schema_registry"])
+        #
+        self.sqlite_config_dict = self.config_dict["sqlite"]
+        #
+        if "database" not in self.sqlite_config_dict:
+            self.database("kafi.db")
+        else:
+            self.database(str(self.sqlite_config_dict["database"]))
+        #
+        if "timeout.ms" not in self.sqlite_config_dict:
+            self.timeout_ms(60000)
+        else:
+            self.timeout_ms(int(self.sqlite_config_dict["timeout.ms"]))
+        #
+        # kafi section
+        #
+        if "commit.interval.messages" not in self.kafi_config_dict:
+            self.commit_interval_messages(1000)
+        else:
+            self.commit_interval_messages(int(self.kafi_config_dict["commit.interval.messages"]))
+        #
+        if "commit.interval.ms" not in self.kafi_config_dict:
+            self.commit_interval_ms(5000)
+        else:
+            self.commit_interval_ms(int(self.kafi_config_dict["commit.interval.ms"]))
+        #
+        if "fetch.max.wait.ms" not in self.kafi_config_dict:
+            self.fetch_max_wait_ms(500)
+        else:
+            self.fetch_max_wait_ms(int(self.kafi_config_dict["fetch.max.wait.ms"]))
+        #
+        self.admin = self.get_admin()
+
+    # kafi
+
+    def commit_interval_messages(self, new_value=None): # int
+        return self.get_set_config("commit.interval.messages", new_value)
+
+    def commit_interval_ms(self, new_value=None): # int
+        return self.get_set_config("commit.interval.ms", new_value)
+
+    def fetch_max_wait_ms(self, new_value=None): # int
+        return self.get_set_config("fetch.max.wait.ms", new_value)
+
+    # sqlite
+
+    def database(self, new_value=None): # str
+        return self.get_set_config("database", new_value, dict=self.sqlite_config_dict)
+
+    def timeout_ms(self, new_value=None): # int
+        return self.get_set_config("timeout.ms", new_value, dict=self.sqlite_config_dict)
+
+    #
+
+    def get_admin(self):
+        admin = SQLiteAdmin(self)
+        #
+        return admin
+
+    #
+
+    def get_consumer(self, topic, **kwargs):
+        consumer = SQLiteConsumer(self, topic, **kwargs)
+        #
+        return consumer
+
+    #
+
+    def get_producer(self, topic, **kwargs):
+        producer = SQLiteProducer(self, topic, **kwargs)
+        #
+        return producer
@@ -0,0 +1,320 @@
+import ast
+from fnmatch import fnmatch
+import os
+import sqlite3
+import threading
+
+from kafi.storage_admin import StorageAdmin
+from kafi.helpers import get_millis, pattern_match
+
+# Constants
+
+OFFSET_INVALID = -1001
+
+# All topics, messages and consumer groups are kept in a single SQLite database. The messages are stored by (topic, partition, offset) with a secondary index on (topic, partition, timestamp) such that consumers, offsets_for_times() and delete_records() only touch the rows they need. The watermarks of each partition are kept in the partitions table (and updated in the same transaction as the messages).
+SCHEMA_STR_LIST = [
+    "CREATE TABLE IF NOT EXISTS topics (topic TEXT PRIMARY KEY, partitions INTEGER NOT NULL, config TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS partitions (topic TEXT NOT NULL, partition INTEGER NOT NULL, low_offset INTEGER NOT NULL, high_offset INTEGER NOT NULL, PRIMARY KEY (topic, partition)) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS messages (topic TEXT NOT NULL, partition INTEGER NOT NULL, offset INTEGER NOT NULL, timestamp_type INTEGER NOT NULL, timestamp INTEGER NOT NULL, key BLOB, value BLOB, headers TEXT, PRIMARY KEY (topic, partition, offset)) WITHOUT ROWID",
+    "CREATE INDEX IF NOT EXISTS messages_timestamp ON messages (topic, partition, timestamp)",
+    "CREATE TABLE IF NOT EXISTS groups (group_id TEXT PRIMARY KEY, state TEXT NOT NULL, last_update INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS group_offsets (group_id TEXT NOT NULL, topic TEXT NOT NULL, partition INTEGER NOT NULL, offset INTEGER NOT NULL, PRIMARY KEY (group_id, topic, partition)) WITHOUT ROWID"
+]
+
+#
+
+class SQLiteAdmin(StorageAdmin):
+    def __init__(self, sqlite_obj, **kwargs):
+        super().__init__(sqlite_obj, **kwargs)
+        #
+        # One connection per thread and database (sqlite3 connections must not be shared between threads, and the database can be changed using database()).
+        self.thread_local = threading.local()
+
+    #
+
+    def get_connection(self):
+        if not hasattr(self.thread_local, "database_str_connection_dict"):
+            self.thread_local.database_str_connection_dict = {}
+        #
+        database_str = self.storage_obj.database()
+        if database_str not in self.thread_local.database_str_connection_dict:
+            if database_str != ":memory:" and os.path.dirname(database_str) != "":
+                os.makedirs(os.path.dirname(database_str), exist_ok=True)
+            #
+            # Autocommit mode - transactions are started explicitly (see transaction()).
+            connection = sqlite3.connect(database_str, timeout=self.storage_obj.timeout_ms() / 1000, isolation_level=None)
+            # Let readers (e.g. consumers in other processes) proceed while a producer is writing.
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            #
+            for schema_str in SCHEMA_STR_LIST:
+                connection.execute(schema_str)
+            #
+            self.thread_local.database_str_connection_dict[database_str] = connection
+        #
+        return self.thread_local.database_str_connection_dict[database_str]
+
+    def transaction(self, transaction_function):
+        connection = self.get_connection()
+        # Take the write lock at the beginning of the transaction (such that concurrent producers never assign overlapping offsets).
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            result = transaction_function(connection)
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        #
+        return result
+
+    def query(self, sql_str, parameters=()):
+        return self.get_connection().execute(sql_str, parameters).fetchall()
+
+    #
+
+    def list_topics(self, pattern=None):
+        all_topic_str_list = [topic_str for (topic_str,) in self.query("SELECT topic FROM topics")]
+        #
+        topic_str_list = pattern_match(all_topic_str_list, pattern)
+        #
+        return topic_str_list
+
+    def list_groups(self, pattern=None):
+        all_group_str_list = [group_str for (group_str,) in self.query("SELECT group_id FROM groups")]
+        #
+        group_str_list = pattern_match(all_group_str_list, pattern)
+        #
+        return group_str_list
+
+    #
+
+    def config(self, pattern, config=None, **kwargs):
+        config_dict = config
+        #
+        topic_str_list = self.list_topics(pattern)
+        #
+        if config_dict is not None:
+            def set_config(connection):
+                connection.executemany("UPDATE topics SET config = ? WHERE topic = ?", [(str(config_dict), topic_str) for topic_str in topic_str_list])
+            #
+            self.transaction(set_config)
+        #
+        topic_str_config_dict_dict = {topic_str: self.get_config(topic_str) for topic_str in topic_str_list}
+        #
+        return topic_str_config_dict_dict
+
+    #
+
+    def create(self, topic, partitions=1, config={}, **kwargs):
+        topic_str = topic
+        config_dict = config
+        partitions_int = partitions
+        #
+        def create_topic(connection):
+            if connection.execute("SELECT 1 FROM topics WHERE topic = ?", (topic_str,)).fetchone() is not None:
+                raise Exception(f"Topic \"{topic_str}\" already exists.")
+            #
+            connection.execute("INSERT INTO topics (topic, partitions, config) VALUES (?, ?, ?)", (topic_str, partitions_int, str(config_dict)))
+            connection.executemany("INSERT INTO partitions (topic, partition, low_offset, high_offset) VALUES (?, ?, 0, 0)", [(topic_str, partition_int) for partition_int in range(partitions_int)])
+        #
+        self.transaction(create_topic)
+
+    #
+
+    def delete(self, pattern, **kwargs):
+        topic_str_list = self.list_topics(pattern)
+        #
+        def delete_topics(connection):
+            for table_str in ["messages", "partitions", "topics"]:
+                connection.executemany(f"DELETE FROM {table_str} WHERE topic = ?", [(topic_str,) for topic_str in topic_str_list])
+        #
+        self.transaction(delete_topics)
+        #
+        return topic_str_list
+
+    def delete_records(self, pattern_or_offsets, **kwargs):
+        # Either delete all messages of the topics matching the pattern or those before the given offsets, e.g. {"topic": {0: 2}}.
+        if isinstance(pattern_or_offsets, dict):
+            topic_str_offsets_dict_dict = pattern_or_offsets
+        else:
+            topic_str_offsets_dict_dict = {topic_str: {partition_int: offsets_tuple[1] for partition_int, offsets_tuple in partition_int_offsets_tuple_dict.items()} for topic_str, partition_int_offsets_tuple_dict in self.watermarks(pattern_or_offsets).items()}
+        #
+        def delete_messages(connection):
+            for topic_str, offsets_dict in topic_str_offsets_dict_dict.items():
+                for partition_int, offset_int in offsets_dict.items():
+                    connection.execute("DELETE FROM messages WHERE topic = ? AND partition = ? AND offset < ?", (topic_str, partition_int, offset_int))
+                    connection.execute("UPDATE partitions SET low_offset = MAX(low_offset, MIN(?, high_offset)) WHERE topic = ? AND partition = ?", (offset_int, topic_str, partition_int))
+        #
+        self.transaction(delete_messages)
+        #
+        return topic_str_offsets_dict_dict
+
+    #
+
+    def offsets_for_times(self, pattern, partitions_timestamps, **kwargs):
+        partition_int_timestamp_int_dict = partitions_timestamps
+        #
+        topic_str_list = self.list_topics(pattern)
+        #
+        topic_str_partition_int_offsets_int_dict_dict = {}
+        for topic_str in topic_str_list:
+            for partition_int, timestamp_int in partition_int_timestamp_int_dict.items():
+                # Uses the (topic, partition, timestamp) index.
+                (offset_int,) = self.query("SELECT MIN(offset) FROM messages WHERE topic = ? AND partition = ? AND timestamp >= ?", (topic_str, partition_int, timestamp_int))[0]
+                if offset_int is not None:
+                    if topic_str not in topic_str_partition_int_offsets_int_dict_dict:
+                        topic_str_partition_int_offsets_int_dict_dict[topic_str] = {}
+                    #
+                    topic_str_partition_int_offsets_int_dict_dict[topic_str][partition_int] = offset_int
+        #
+        return topic_str_partition_int_offsets_int_dict_dict
+
+    #
+
+    def partitions(self, pattern=None, partitions=None, verbose=False, **kwargs):
+        partitions_int = partitions
+        #
+        topic_str_list = self.list_topics(pattern)
+        #
+        if partitions_int is not None:
+            def set_partitions(connection):
+                for topic_str in topic_str_list:
+                    connection.execute("UPDATE topics SET partitions = ? WHERE topic = ?", (partitions_int, topic_str))
+                    connection.executemany("INSERT OR IGNORE INTO partitions (topic, partition, low_offset, high_offset) VALUES (?, ?, 0, 0)", [(topic_str, partition_int) for partition_int in range(partitions_int)])
+            #
+            self.transaction(set_partitions)
+        #
+        topic_str_partitions_int_dict = {topic_str: self.get_partitions(topic_str) for topic_str in topic_str_list}
+        #
+        return topic_str_partitions_int_dict
+
+    #
+
+    def watermarks(self, pattern, **kwargs):
+        topic_str_list = self.list_topics(pattern)
+        #
+        topic_str_partition_int_offsets_tuple_dict_dict = {topic_str: self.get_watermarks(topic_str) for topic_str in topic_str_list}
+        #
+        return topic_str_partition_int_offsets_tuple_dict_dict
+
+    #
+
+    def delete_groups(self, pattern, state_pattern="*"):
+        group_str_list = self.groups(pattern, state_pattern)
+        #
+        def delete_groups1(connection):
+            for table_str in ["group_offsets", "groups"]:
+                connection.executemany(f"DELETE FROM {table_str} WHERE group_id = ?", [(group_str,) for group_str in group_str_list])
+        #
+        self.transaction(delete_groups1)
+        #
+        return group_str_list
+
+    def describe_groups(self, pattern="*", state_pattern="*"):
+        group_str_state_str_dict = self.groups(pattern, state_pattern, state=True)
+        #
+        group_str_group_description_dict_dict = {group_str: {"group_id": group_str, "is_simple_consumer_group": False, "partition_assignor": "range", "state": state_str} for group_str, state_str in group_str_state_str_dict.items()}
+        #
+        return group_str_group_description_dict_dict
+
+    def groups(self, pattern="*", state_pattern="*", state=False):
+        state_bool = state
+        #
+        state_pattern_str_list = [state_pattern] if isinstance(state_pattern, str) else state_pattern
+        #
+        group_str_state_str_dict = {group_str: state_str for group_str, state_str in self.query("SELECT group_id, state FROM groups")}
+        group_str_list = pattern_match(list(group_str_state_str_dict.keys()), pattern)
+        group_str_state_str_dict = {group_str: group_str_state_str_dict[group_str] for group_str in group_str_list if any(fnmatch(group_str_state_str_dict[group_str], state_pattern_str) for state_pattern_str in state_pattern_str_list)}
+        #
+        if state_bool:
+            return group_str_state_str_dict
+        else:
+            return list(group_str_state_str_dict.keys())
+
+    def group_offsets(self, pattern, group_offsets=None, state_pattern="*"):
+        topic_str_offsets_dict_dict = group_offsets
+        #
+        group_str_list = self.groups(pattern, state_pattern)
+        #
+        if topic_str_offsets_dict_dict is not None:
+            for group_str in group_str_list:
+                self.commit_offsets(group_str, topic_str_offsets_dict_dict)
+        #
+        group_str_topic_str_offsets_dict_dict_dict = {group_str: self.get_group_offsets(group_str) for group_str in group_str_list}
+        #
+        return group_str_topic_str_offsets_dict_dict_dict
+
+    # Topics/Partitions
+
+    def get_partitions(self, topic_str):
+        (partitions_int,) = self.query("SELECT partitions FROM topics WHERE topic = ?", (topic_str,))[0]
+        #
+        return partitions_int
+
+    def get_config(self, topic_str):
+        (config_str,) = self.query("SELECT config FROM topics WHERE topic = ?", (topic_str,))[0]
+        #
+        return ast.literal_eval(config_str)
+
+    def get_watermarks(self, topic_str):
+        partitions_int = self.get_partitions(topic_str)
+        #
+        partition_int_offsets_tuple_dict = {partition_int: (low_offset_int, high_offset_int) for partition_int, low_offset_int, high_offset_int in self.query("SELECT partition, low_offset, high_offset FROM partitions WHERE topic = ? AND partition < ?", (topic_str, partitions_int))}
+        #
+        return partition_int_offsets_tuple_dict
+
+    # Messages
+
+    def append_messages(self, topic_str, partition_int_message_dict_list_dict):
+        # Assign the offsets and insert the messages of all partitions in a single transaction.
+        def append(connection):
+            for partition_int, message_dict_list in partition_int_message_dict_list_dict.items():
+                (high_offset_int,) = connection.execute("SELECT high_offset FROM partitions WHERE topic = ? AND partition = ?", (topic_str, partition_int)).fetchone()
+                #
+                connection.executemany("INSERT INTO messages (topic, partition, offset, timestamp_type, timestamp, key, value, headers) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [(topic_str, partition_int, offset_int, message_dict["timestamp"][0], message_dict["timestamp"][1], message_dict["key"], message_dict["value"], str(message_dict["headers"]) if message_dict["headers"] is not None else None) for offset_int, message_dict in enumerate(message_dict_list, high_offset_int)])
+                #
+                connection.execute("UPDATE partitions SET high_offset = ? WHERE topic = ? AND partition = ?", (high_offset_int + len(message_dict_list), topic_str, partition_int))
+        #
+        self.transaction(append)
+
+    def read_messages(self, topic_str, partition_int, start_offset_int, n_int):
+        # Uses the (topic, partition, offset) primary key.
+        message_dict_list = [{"topic": topic_str, "value": value_bytes, "key": key_bytes, "timestamp": (timestamp_type_int, timestamp_int), "headers": ast.literal_eval(headers_str) if headers_str is not None else None, "partition": partition_int, "offset": offset_int} for offset_int, timestamp_type_int, timestamp_int, key_bytes, value_bytes, headers_str in self.query("SELECT offset, timestamp_type, timestamp, key, value, headers FROM messages WHERE topic = ? AND partition = ? AND offset >= ? ORDER BY offset LIMIT ?", (topic_str, partition_int, start_offset_int, n_int))]
+        #
+        return message_dict_list
+
+    # Groups
+
+    def init_group(self, group_str, topic_str_list):
+        # Create the group (if it does not exist yet) and set the offsets of all partitions without committed offsets to OFFSET_INVALID.
+        def init(connection):
+            connection.execute("INSERT INTO groups (group_id, state, last_update) VALUES (?, 'stable', ?) ON CONFLICT (group_id) DO UPDATE SET state = 'stable', last_update = excluded.last_update", (group_str, get_millis()))
+            #
+            for topic_str in topic_str_list:
+                (partitions_int,) = connection.execute("SELECT partitions FROM topics WHERE topic = ?", (topic_str,)).fetchone()
+                connection.executemany("INSERT OR IGNORE INTO group_offsets (group_id, topic, partition, offset) VALUES (?, ?, ?, ?)", [(group_str, topic_str, partition_int, OFFSET_INVALID) for partition_int in range(partitions_int)])
+        #
+        self.transaction(init)
+
+    def get_group_offsets(self, group_str):
+        topic_str_offsets_dict_dict = {}
+        for topic_str, partition_int, offset_int in self.query("SELECT topic, partition, offset FROM group_offsets WHERE group_id = ? ORDER BY topic, partition", (group_str,)):
+            if topic_str not in topic_str_offsets_dict_dict:
+                topic_str_offsets_dict_dict[topic_str] = {}
+            #
+            topic_str_offsets_dict_dict[topic_str][partition_int] = offset_int
+        #
+        return topic_str_offsets_dict_dict
+
+    def commit_offsets(self, group_str, topic_str_offsets_dict_dict):
+        def commit(connection):
+            connection.executemany("INSERT INTO group_offsets (group_id, topic, partition, offset) VALUES (?, ?, ?, ?) ON CONFLICT (group_id, topic, partition) DO UPDATE SET offset = excluded.offset", [(group_str, topic_str, partition_int, offset_int) for topic_str, offsets_dict in topic_str_offsets_dict_dict.items() for partition_int, offset_int in offsets_dict.items()])
+            connection.execute("UPDATE groups SET last_update = ? WHERE group_id = ?", (get_millis(), group_str))
+        #
+        self.transaction(commit)
+
+    def set_group_state(self, group_str, state_str):
+        def set_state(connection):
+            connection.execute("UPDATE groups SET state = ?, last_update = ? WHERE group_id = ?", (state_str, get_millis(), group_str))
+        #
+        self.transaction(set_state)
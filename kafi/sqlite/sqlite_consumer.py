@@ -0,0 +1,47 @@
+import time
+
+from kafi.cursor_consumer import CursorConsumer
+
+# Constants
+
+FOLLOW_MIN_BACKOFF_MS = 10
+
+#
+
+class SQLiteConsumer(CursorConsumer):
+    def __init__(self, sqlite_obj, *topics, **kwargs):
+        super().__init__(sqlite_obj, *topics, **kwargs)
+        # Create the group (or set it to stable again) and initialize the offsets of the partitions without committed offsets.
+        self.storage_obj.admin.init_group(self.group_str, self.topic_str_list)
+        #
+        # In follow mode, wait at most this long between two checks for new messages.
+        self.fetch_max_wait_ms_int = int(self.consumer_config_dict["fetch.max.wait.ms"]) if "fetch.max.wait.ms" in self.consumer_config_dict else sqlite_obj.fetch_max_wait_ms()
+
+    #
+
+    def leave_group(self):
+        self.storage_obj.admin.set_group_state(self.group_str, "empty")
+
+    #
+
+    def wait_for_new_messages(self, topic_str_high_offsets_dict_dict):
+        # Poll the high watermarks (one indexed query per topic) with exponential backoff up to fetch.max.wait.ms.
+        backoff_ms_int = FOLLOW_MIN_BACKOFF_MS
+        while self.get_topic_versions() == topic_str_high_offsets_dict_dict:
+            time.sleep(backoff_ms_int / 1000)
+            backoff_ms_int = min(backoff_ms_int * 2, self.fetch_max_wait_ms_int)
+
+    #
+
+    def offsets(self):
+        topic_str_offsets_dict_dict = self.storage_obj.admin.get_group_offsets(self.group_str)
+        #
+        topic_str_offsets_dict_dict = {topic_str: topic_str_offsets_dict_dict[topic_str] if topic_str in topic_str_offsets_dict_dict else {} for topic_str in self.topic_str_list}
+        #
+        return topic_str_offsets_dict_dict
+
+    def get_committed_offsets(self, topic_str):
+        return self.storage_obj.admin.get_group_offsets(self.group_str)[topic_str]
+
+    def commit_offsets(self, topic_str_offsets_dict_dict):
+        self.storage_obj.admin.commit_offsets(self.group_str, topic_str_offsets_dict_dict)
@@ -29,6 +29,11 @@ class StorageProducer(Serializer):
 
     #
 
+    def flush(self):
+        return self.topic_str
+
+    #
+
     def produce_list(self, message_dict_list, **kwargs):
         value_list = [message_dict["value"] for message_dict in message_dict_list]
         #
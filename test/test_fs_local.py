@@ -7,7 +7,10 @@ else:
     sys.path.insert(1, ".")
 
 from test.test_single_storage_base import TestSingleStorageBase
+from kafi.fs.fs_admin import FSAdmin
+from kafi.fs.fs_cache import SegmentCache
 from kafi.fs.local.local import Local
+from kafi.fs.fs_segment import decode_segment, decode_segment_stream, encode_segment, find_offset_by_timestamp
 
 #
 
@@ -41,3 +44,913 @@ class Test(TestSingleStorageBase):
 
     def test_compact(self):
         pass
+
+    #
+
+    def test_segment_formats(self):
+        s = self.get_storage()
+        #
+        value_bytes_list = [b"line 1\nline 2", b"\x00\xff\n", b""]
+        #
+        for format_str in ["text", "binary"]:
+            topic_str = self.create_test_topic_name()
+            s.create(topic_str, format=format_str)
+            self.assertEqual(s.admin.get_format(topic_str), format_str)
+            #
+            producer = s.producer(topic_str, type="bytes")
+            producer.produce(value_bytes_list, key=[b"k1", None, b"k3"], headers=[("h1", b"v1")])
+            producer.close()
+            #
+            group_str = self.create_test_group_name()
+            consumer = s.consumer(topic_str, group=group_str, type="bytes")
+            message_dict_list = consumer.consume(n=3)
+            consumer.close()
+            self.assertEqual([message_dict["value"] for message_dict in message_dict_list], value_bytes_list)
+            self.assertEqual([message_dict["key"] for message_dict in message_dict_list], [b"k1", None, b"k3"])
+            self.assertEqual([message_dict["offset"] for message_dict in message_dict_list], [0, 1, 2])
+            self.assertEqual(message_dict_list[0]["headers"], [("h1", b"v1")])
+
+    def test_offset_index(self):
+        s = self.get_storage()
+        s.index_interval_bytes(256)
+        #
+        for format_str in ["text", "binary"]:
+            topic_str = self.create_test_topic_name()
+            s.create(topic_str, format=format_str)
+            producer = s.producer(topic_str, type="str")
+            producer.produce([f"message {i}" for i in range(1000)])
+            producer.close()
+            #
+            rel_file_str = s.admin.get_partition_files(topic_str)[0][0]
+            self.assertTrue(s.admin.exists_file(s.admin.get_offset_index_abs_path_str(topic_str, rel_file_str)))
+            self.assertGreater(s.admin.find_partition_file_position_by_offset(topic_str, rel_file_str, 700), 0)
+            #
+            group_str = self.create_test_group_name()
+            consumer = s.consumer(topic_str, group=group_str, type="str", offsets={0: 700})
+            message_dict_list = consumer.consume(n=2)
+            consumer.close()
+            self.assertEqual([message_dict["value"] for message_dict in message_dict_list], ["message 700", "message 701"])
+        # Index each message/batch (but not the start of the partition file, which has no max. timestamp yet).
+        s.index_interval_bytes(0)
+        for format_str in ["text", "binary"]:
+            topic_str = self.create_test_topic_name()
+            s.create(topic_str, format=format_str)
+            producer = s.producer(topic_str, type="str")
+            producer.produce([f"message {i}" for i in range(1000)], timestamp=[(1, 1000 + i) for i in range(1000)])
+            producer.close()
+            #
+            rel_file_str = s.admin.get_partition_files(topic_str)[0][0]
+            self.assertGreater(s.admin.find_partition_file_position_by_offset(topic_str, rel_file_str, 700), 0)
+            self.assertEqual(s.offsets_for_times(topic_str, {0: 1700})[topic_str], {0: 700})
+            #
+            consumer = s.consumer(topic_str, type="str", offsets={0: 700})
+            self.assertEqual([message_dict["value"] for message_dict in consumer.consume(n=2)], ["message 700", "message 701"])
+            consumer.close()
+
+    def test_time_index(self):
+        s = self.get_storage()
+        s.index_interval_bytes(256)
+        #
+        for format_str in ["text", "binary"]:
+            topic_str = self.create_test_topic_name()
+            s.create(topic_str, format=format_str)
+            producer = s.producer(topic_str, type="str")
+            # Timestamps are not monotonic: message i has timestamp 1000 + 2 * i, except for message 500 (timestamp 0).
+            timestamp_tuple_list = [(1, 0 if i == 500 else 1000 + 2 * i) for i in range(1000)]
+            producer.produce([f"message {i}" for i in range(1000)], timestamp=timestamp_tuple_list)
+            producer.close()
+            #
+            rel_file_str = s.admin.get_partition_files(topic_str)[0][0]
+            self.assertTrue(s.admin.exists_file(s.admin.get_time_index_abs_path_str(topic_str, rel_file_str)))
+            self.assertGreater(s.admin.find_partition_file_position_by_timestamp(topic_str, rel_file_str, 1000 + 2 * 700), 0)
+            #
+            self.assertEqual(s.offsets_for_times(topic_str, {0: 1000 + 2 * 700})[topic_str][0], 700)
+            self.assertEqual(s.offsets_for_times(topic_str, {0: 1000 + 2 * 700 - 1})[topic_str][0], 700)
+            self.assertEqual(s.offsets_for_times(topic_str, {0: 1000})[topic_str][0], 0)
+            self.assertEqual(s.offsets_for_times(topic_str, {0: 2990})[topic_str][0], 995)
+
+    def test_ranged_reads(self):
+        s = self.get_storage()
+        s.index_interval_bytes(256)
+        #
+        for format_str in ["text", "binary"]:
+            topic_str = self.create_test_topic_name()
+            s.create(topic_str, format=format_str)
+            producer = s.producer(topic_str, type="str")
+            producer.produce([f"message {i}" for i in range(1000)], timestamp=[(1, 1000 + i) for i in range(1000)])
+            producer.close()
+            #
+            read_stream = s.admin.read_stream
+            start_pos_int_list = []
+            def read_stream1(abs_path_file_str, start_pos_int=0):
+                start_pos_int_list.append(start_pos_int)
+                return read_stream(abs_path_file_str, start_pos_int)
+            s.admin.read_stream = read_stream1
+            # Partition files are only read from the position found in the offset index on...
+            rel_file_str = s.admin.get_partition_files(topic_str)[0][0]
+            pos_int = s.admin.find_partition_file_position_by_offset(topic_str, rel_file_str, 700)
+            consumer = s.consumer(topic_str, type="str", offsets={0: 700})
+            self.assertEqual([message_dict["value"] for message_dict in consumer.consume(n=2)], ["message 700", "message 701"])
+            consumer.close()
+            self.assertEqual(start_pos_int_list, [pos_int])
+            # ...or the time index.
+            self.assertEqual(s.offsets_for_times(topic_str, {0: 1700})[topic_str][0], 700)
+            self.assertEqual(start_pos_int_list[1], s.admin.find_partition_file_position_by_timestamp(topic_str, rel_file_str, 1700))
+            self.assertGreater(start_pos_int_list[1], 0)
+            #
+            del s.admin.read_stream
+            self.assertEqual(len(s.cat(topic_str, type="str")), 1000)
+
+    def test_raw_copy(self):
+        s = self.get_storage()
+        s.index_interval_bytes(256)
+        #
+        topic_str1 = self.create_test_topic_name()
+        s.create(topic_str1, partitions=2, config={"compression.type": "zlib"})
+        producer = s.producer(topic_str1, type="str", config={"linger.ms": 0})
+        for i in range(3):
+            producer.produce([f"message {i}.{j}" for j in range(200)], key=[f"key {j}" for j in range(200)], partition=[j % 2 for j in range(200)], headers={"h": f"{i}"})
+        producer.close()
+        #
+        s1 = self.get_storage()
+        s1.root_dir(os.path.join(self.path_str, "raw_copy"))
+        topic_str2 = self.create_test_topic_name()
+        self.assertEqual(s.cp(topic_str1, s1, topic_str2, raw=True), (600, 600))
+        # The partition files are copied as they are (including their indexes), i.e. the offsets, timestamps and headers are kept.
+        self.assertEqual(s1.partitions(topic_str2)[topic_str2], 2)
+        self.assertEqual(s1.config(topic_str2)[topic_str2], {"compression.type": "zlib"})
+        self.assertEqual(s1.watermarks(topic_str2)[topic_str2], s.watermarks(topic_str1)[topic_str1])
+        self.assertEqual(s1.admin.list_files(os.path.join(s1.admin.get_topic_abs_path_str(topic_str2), "partitions")), s.admin.list_files(os.path.join(s.admin.get_topic_abs_path_str(topic_str1), "partitions")))
+        self.assertEqual(s1.cat(topic_str2, type="str"), [{**message_dict, "topic": topic_str2} for message_dict in s.cat(topic_str1, type="str")])
+        timestamp_int = s.cat(topic_str1, type="str")[300]["timestamp"][1]
+        self.assertEqual(s1.offsets_for_times(topic_str2, {0: timestamp_int, 1: timestamp_int}), {topic_str2: s.offsets_for_times(topic_str1, {0: timestamp_int, 1: timestamp_int})[topic_str1]})
+        #
+        # Copies between different storages (e.g. local disk and S3) go through the client.
+        s1.admin.copy_file = lambda source_admin, source_abs_path_file_str, target_abs_path_file_str: FSAdmin.copy_file(s1.admin, source_admin, source_abs_path_file_str, target_abs_path_file_str)
+        topic_str3 = self.create_test_topic_name()
+        self.assertEqual(s.cp(topic_str1, s1, topic_str3, raw=True), (600, 600))
+        self.assertEqual(s1.cat(topic_str3, type="str"), [{**message_dict, "topic": topic_str3} for message_dict in s.cat(topic_str1, type="str")])
+        self.assertEqual(s1.offsets_for_times(topic_str3, {0: timestamp_int, 1: timestamp_int})[topic_str3], s.offsets_for_times(topic_str1, {0: timestamp_int, 1: timestamp_int})[topic_str1])
+        #
+        with self.assertRaises(Exception):
+            s.cp(topic_str1, s1, topic_str2, raw=True)
+        with self.assertRaises(Exception):
+            s.cp(topic_str1, s1, self.create_test_topic_name(), n=10, raw=True)
+        # Text segments also store the topic of each message - the copied messages belong to the target topic.
+        del s1.admin.copy_file
+        topic_str4 = self.create_test_topic_name()
+        s.create(topic_str4, partitions=2, format="text")
+        producer = s.producer(topic_str4, type="str", config={"linger.ms": 0})
+        producer.produce([f"message {j}" for j in range(20)], partition=[j % 2 for j in range(20)])
+        producer.close()
+        topic_str5 = self.create_test_topic_name()
+        self.assertEqual(s.cp(topic_str4, s1, topic_str5, raw=True), (20, 20))
+        for fetch_mmap_bool in [False, True]:
+            consumer = s1.consumer(topic_str5, type="str", config={"fetch.mmap": fetch_mmap_bool})
+            message_dict_list = consumer.consume()
+            consumer.close()
+            self.assertEqual(sorted(message_dict["value"] for message_dict in message_dict_list), sorted(f"message {j}" for j in range(20)))
+            self.assertTrue(all(message_dict["topic"] == topic_str5 for message_dict in message_dict_list))
+
+    def test_manifest(self):
+        s = self.get_storage()
+        #
+        topic_str = self.create_test_topic_name()
+        s.create(topic_str, partitions=2)
+        self.assertEqual(s.admin.get_manifest(topic_str), {"partitions": {}})
+        #
+        producer = s.producer(topic_str, type="str", config={"linger.ms": 0})
+        producer.produce("message 1", partition=0)
+        producer.produce(["message 2", "message 3"], partition=1)
+        producer.produce("message 4", partition=0)
+        producer.close()
+        #
+        manifest_dict = s.admin.get_manifest(topic_str)
+        self.assertEqual(len(manifest_dict["partitions"][0]), 2)
+        self.assertEqual(len(manifest_dict["partitions"][1]), 1)
+        self.assertEqual(s.watermarks(topic_str)[topic_str], {0: (0, 2), 1: (0, 2)})
+        self.assertEqual(s.admin.find_partition_file_str_by_offset(topic_str, 0, 1), manifest_dict["partitions"][0][1])
+        self.assertIsNone(s.admin.find_partition_file_str_by_offset(topic_str, 0, 2))
+        # Topics without a manifest (e.g. created by older versions of kafi) get their manifest recreated from the partition files.
+        s.admin.delete_file(s.admin.get_manifest_abs_path_str(topic_str))
+        self.assertEqual(s.admin.get_manifest(topic_str), manifest_dict)
+        self.assertTrue(s.admin.exists_file(s.admin.get_manifest_abs_path_str(topic_str)))
+        #
+        consumer = s.consumer(topic_str, type="str")
+        message_dict_list = consumer.consume()
+        consumer.close()
+        self.assertEqual(sorted(message_dict["value"] for message_dict in message_dict_list), ["message 1", "message 2", "message 3", "message 4"])
+
+    def test_buffered_producer(self):
+        s = self.get_storage()
+        #
+        topic_str = self.create_test_topic_name()
+        s.create(topic_str, partitions=2)
+        # Messages are buffered until a segment threshold is reached, linger.ms has passed, or the producer is flushed/closed.
+        producer = s.producer(topic_str, type="str", config={"segment.messages": 100, "linger.ms": 3600000})
+        for i in range(450):
+            producer.produce(f"message {i}", partition=i % 2)
+        self.assertEqual(s.watermarks(topic_str)[topic_str], {0: (0, 200), 1: (0, 200)})
+        self.assertEqual([len(rel_file_str_list) for rel_file_str_list in s.admin.get_partition_files(topic_str).values()], [2, 2])
+        #
+        producer.flush()
+        self.assertEqual(s.watermarks(topic_str)[topic_str], {0: (0, 225), 1: (0, 225)})
+        #
+        producer.produce("message 450", partition=0)
+        producer.close()
+        self.assertEqual(s.watermarks(topic_str)[topic_str], {0: (0, 226), 1: (0, 225)})
+        self.assertEqual([len(rel_file_str_list) for rel_file_str_list in s.admin.get_partition_files(topic_str).values()], [4, 3])
+        # segment.bytes
+        producer = s.producer(topic_str, type="str", config={"segment.bytes": 1024, "linger.ms": 3600000})
+        producer.produce([f"message {i}" for i in range(100)], partition=0)
+        producer.close()
+        self.assertGreater(len(s.admin.get_partition_files(topic_str, 0)), 5)
+        #
+        consumer = s.consumer(topic_str, type="str")
+        message_dict_list = consumer.consume()
+        consumer.close()
+        self.assertEqual(len(message_dict_list), 551)
+        self.assertEqual(sorted(message_dict["offset"] for message_dict in message_dict_list if message_dict["partition"] == 0), list(range(326)))
+
+    def test_merge_segments(self):
+        s = self.get_storage()
+        s.file_delete_delay_ms(0)
+        #
+        topic_str = self.create_test_topic_name()
+        s.create(topic_str, partitions=2)
+        producer = s.producer(topic_str, type="str", config={"linger.ms": 0})
+        for i in range(100):
+            producer.produce(f"message {i}", partition=i % 2, timestamp=(1, 1000 + i), headers={"header": f"{i}"})
+        producer.close()
+        self.assertEqual([len(rel_file_str_list) for rel_file_str_list in s.admin.get_partition_files(topic_str).values()], [50, 50])
+        #
+        partition_int_num_files_int_dict = s.merge_segments(topic_str, target_bytes=1024)[topic_str]
+        self.assertTrue(all(1 < num_files_int < 50 for num_files_int in partition_int_num_files_int_dict.values()))
+        num_files_int = sum(partition_int_num_files_int_dict.values())
+        #
+        rel_file_str_list = s.admin.get_partition_files(topic_str, 1)
+        self.assertEqual(rel_file_str_list[0].split(",")[1], "000000000000000000000")
+        self.assertEqual(rel_file_str_list[0].split(",")[3], "1001")
+        self.assertEqual([rel_file_str_list[-1].split(",")[2], rel_file_str_list[-1].split(",")[4]], ["000000000000000000049", "1099"])
+        self.assertTrue(all(int(rel_file_str1.split(",")[2]) + 1 == int(rel_file_str2.split(",")[1]) for rel_file_str1, rel_file_str2 in zip(rel_file_str_list, rel_file_str_list[1:])))
+        self.assertEqual(s.watermarks(topic_str)[topic_str], {0: (0, 50), 1: (0, 50)})
+        # The old partition files are only deleted after file.delete.delay.ms (here: with the next merge).
+        self.assertEqual(len(s.admin.list_partition_files(topic_str)), 100 + num_files_int)
+        self.assertEqual(s.merge_segments(topic_str)[topic_str], {0: 1, 1: 1})
+        self.assertEqual(len(s.admin.list_partition_files(topic_str)), num_files_int + 2)
+        #
+        consumer = s.consumer(topic_str, type="str", offsets={0: 10, 1: 10})
+        message_dict_list = consumer.consume()
+        consumer.close()
+        self.assertEqual(len(message_dict_list), 80)
+        message_dict = [message_dict for message_dict in message_dict_list if message_dict["partition"] == 1 and message_dict["offset"] == 20][0]
+        self.assertEqual((message_dict["value"], message_dict["timestamp"], message_dict["headers"]), ("message 41", (1, 1041), [("header", b"41")]))
+        # Partition files larger than target_bytes are not merged and hence not read (their sizes are taken from the listing).
+        producer = s.producer(topic_str, type="str", config={"linger.ms": 0})
+        producer.produce("x" * 2048, partition=0)
+        producer.produce("message 100", partition=0)
+        producer.produce("message 101", partition=0)
+        producer.close()
+        rel_file_str_list = s.admin.get_partition_files(topic_str, 0)
+        read_abs_path_file_str_list = []
+        def read_bytes(abs_path_file_str, *args, read_bytes_function=s.admin.read_bytes):
+            read_abs_path_file_str_list.append(abs_path_file_str)
+            return read_bytes_function(abs_path_file_str, *args)
+        s.admin.read_bytes = read_bytes
+        self.assertEqual(s.merge_segments(topic_str, target_bytes=1024)[topic_str], {0: 3, 1: 1})
+        del s.admin.read_bytes
+        self.assertEqual([os.path.basename(abs_path_file_str) for abs_path_file_str in read_abs_path_file_str_list], rel_file_str_list[-2:])
+
+    def test_compression(self):
+        s = self.get_storage()
+        s.index_interval_bytes(256)
+        #
+        value_str_list = [f"message {i} " * 20 for i in range(1000)]
+        #
+        topic_str_size_int_dict = {}
+        for compression_type_str in ["none", "zlib", "lzma", "bz2"]:
+            topic_str = self.create_test_topic_name()
+            s.create(topic_str, config={"compression.type": compression_type_str})
+            self.assertEqual(s.admin.get_compression_type(topic_str), compression_type_str)
+            #
+            producer = s.producer(topic_str, type="str")
+            producer.produce(value_str_list, key=[f"key {i}" for i in range(1000)], timestamp=[(1, 1000 + i) for i in range(1000)], headers=[("h1", b"v1")])
+            producer.close()
+            #
+            rel_file_str = s.admin.get_partition_files(topic_str, 0)[0]
+            topic_str_size_int_dict[compression_type_str] = len(s.admin.read_bytes(os.path.join(s.admin.get_topic_abs_path_str(topic_str), "partitions", rel_file_str)))
+            #
+            consumer = s.consumer(topic_str, type="str", offsets={0: 700})
+            message_dict_list = consumer.consume()
+            consumer.close()
+            self.assertEqual([message_dict["value"] for message_dict in message_dict_list], value_str_list[700:])
+            self.assertEqual(message_dict_list[0]["key"], "key 700")
+            self.assertEqual(message_dict_list[0]["headers"], [("h1", b"v1")])
+            #
+            self.assertEqual(s.offsets_for_times(topic_str, {0: 1500})[topic_str][0], 500)
+        #
+        for compression_type_str in ["zlib", "lzma", "bz2"]:
+            self.assertLess(topic_str_size_int_dict[compression_type_str] * 3, topic_str_size_int_dict["none"])
+        # Existing topics can be compressed by changing the compression type and merging their partition files.
+        topic_str = self.create_test_topic_name()
+        s.create(topic_str)
+        producer = s.producer(topic_str, type="str", config={"linger.ms": 0})
+        for value_str in value_str_list[:10]:
+            producer.produce(value_str)
+        producer.close()
+        s.config(topic_str, config={"compression.type": "zlib"})
+        s.merge_segments(topic_str)
+        consumer = s.consumer(topic_str, type="str")
+        self.assertEqual([message_dict["value"] for message_dict in consumer.consume()], value_str_list[:10])
+        consumer.close()
+        #
+        with self.assertRaises(Exception):
+            s.create(self.create_test_topic_name(), config={"compression.type": "zlib"}, format="text")
+        # Unsupported compression types are rejected when creating/configuring the topic (and not only when producing).
+        with self.assertRaises(Exception):
+            s.create(self.create_test_topic_name(), config={"compression.type": "gzip"}, format="binary")
+        with self.assertRaises(Exception):
+            s.config(topic_str, config={"compression.type": "gzip"})
+        self.assertEqual(s.admin.get_compression_type(topic_str), "zlib")
+        # ...as are compression types whose optional packages are not installed.
+        for compression_type_str, package_str in [("zstd", "zstandard"), ("lz4", "lz4")]:
+            module = sys.modules[package_str] if package_str in sys.modules else None
+            sys.modules[package_str] = None
+            try:
+                with self.assertRaisesRegex(Exception, package_str):
+                    s.create(self.create_test_topic_name(), config={"compression.type": compression_type_str}, format="binary")
+                with self.assertRaisesRegex(Exception, package_str):
+                    s.config(topic_str, config={"compression.type": compression_type_str})
+            finally:
+                if module is None:
+                    del sys.modules[package_str]
+                else:
+                    sys.modules[package_str] = module
+        self.assertEqual(s.admin.get_compression_type(topic_str), "zlib")
+
+    def test_batched_commits(self):
+        s = self.get_storage()
+        s.enable_auto_commit(False)
+        s.commit_after_processing(True)
+        #
+        topic_str = self.create_test_topic_name()
+        s.create(topic_str)
+        producer = s.producer(topic_str, type="str")
+        producer.produce([f"message {i}" for i in range(100)])
+        producer.close()
+        #
+        commit_counter_int = 0
+        def set_group_dict(group_str, new_group_dict, set_group_dict_function=s.admin.set_group_dict):
+            nonlocal commit_counter_int
+            if "offsets" in new_group_dict:
+                commit_counter_int += 1
+            return set_group_dict_function(group_str, new_group_dict)
+        s.admin.set_group_dict = set_group_dict
+        #
+        group_str = self.create_test_group_name()
+        consumer = s.consumer(topic_str, group=group_str, type="str", config={"commit.interval.messages": 30, "commit.interval.ms": 3600000})
+        commit_counter_int = 0
+        # Processing fails at message 50 - only the offsets of the messages processed so far are committed.
+        def foldl_function(acc, message_dict):
+            if message_dict["offset"] == 50:
+                raise Exception("Error...")
+            return acc + 1
+        with self.assertRaises(Exception):
+            consumer.foldl(foldl_function, 0)
+        self.assertEqual(commit_counter_int, 2)
+        self.assertEqual(s.group_offsets(group_str)[group_str][topic_str][0], 50)
+        #
+        commit_counter_int = 0
+        self.assertEqual(len(consumer.consume()), 50)
+        self.assertEqual(commit_counter_int, 2)
+        self.assertEqual(s.group_offsets(group_str)[group_str][topic_str][0], 100)
+        consumer.close()
+        #
+        del s.admin.set_group_dict
+
+    def test_prefetch(self):
+        s = self.get_storage()
+        #
+        topic_str1 = self.create_test_topic_name()
+        s.create(topic_str1, partitions=3)
+        producer = s.producer(topic_str1, type="str", config={"linger.ms": 0})
+        for i in range(60):
+            producer.produce([f"message {i}.{j}" for j in range(10)], partition=i % 3)
+        producer.close()
+        # Prefetching partition files concurrently must not change the (round-robin) order of the messages.
+        message_dict_list_list = []
+        for fetch_num_workers_int, fetch_max_bytes_int in [(1, 67108864), (4, 67108864), (4, 1)]:
+            consumer = s.consumer(topic_str1, type="str", config={"fetch.num.workers": fetch_num_workers_int, "fetch.max.bytes": fetch_max_bytes_int})
+            message_dict_list_list.append([(message_dict["topic"], message_dict["partition"], message_dict["offset"], message_dict["value"]) for message_dict in consumer.consume()])
+            consumer.close()
+        #
+        self.assertEqual(len(message_dict_list_list[0]), 600)
+        self.assertEqual(message_dict_list_list[0][10][:3], (topic_str1, 1, 0))
+        self.assertEqual(message_dict_list_list[1], message_dict_list_list[0])
+        self.assertEqual(message_dict_list_list[2], message_dict_list_list[0])
+        # Stop early - all the opened streams of partition files (also the prefetched ones) are closed explicitly with the consumer (keep references to them such that they are not just closed on garbage collection).
+        open_stream_counter_int = 0
+        chunk_bytes_generator_list = []
+        def read_segment_stream(abs_path_file_str, start_pos_int=0, read_segment_stream_function=s.admin.read_segment_stream):
+            (chunk_bytes_generator, start_pos_int) = read_segment_stream_function(abs_path_file_str, start_pos_int)
+            def counting_chunk_bytes_generator():
+                nonlocal open_stream_counter_int
+                open_stream_counter_int += 1
+                try:
+                    yield from chunk_bytes_generator
+                finally:
+                    open_stream_counter_int -= 1
+            chunk_bytes_generator_list.append(counting_chunk_bytes_generator())
+            return (chunk_bytes_generator_list[-1], start_pos_int)
+        s.admin.read_segment_stream = read_segment_stream
+        consumer = s.consumer(topic_str1, type="str", config={"fetch.num.workers": 4})
+        self.assertEqual(len(consumer.consume(n=25)), 25)
+        self.assertGreater(open_stream_counter_int, 0)
+        consumer.close()
+        self.assertEqual(open_stream_counter_int, 0)
+        del s.admin.read_segment_stream
+
+    def test_segment_stream(self):
+        message_dict_list = [{"topic": "topic", "value": f"value {i}".encode("utf-8") * (i % 7), "key": None if i % 3 == 0 else f"key {i}".encode("utf-8"), "timestamp": (1, 1000 + i), "headers": [("h1", b"v1")] if i % 2 == 0 else None, "partition": 0, "offset": i} for i in range(1000)]
+        #
+        for format_str, compression_type_str in [("text", "none"), ("binary", "none"), ("binary", "zlib")]:
+            (segment_bytes, index_tuple_list) = encode_segment(format_str, 0, message_dict_list, 1024, compression_type_str)
+            # Decode from (very) small chunks.
+            chunk_bytes_list = [segment_bytes[i:i + 7] for i in range(0, len(segment_bytes), 7)]
+            self.assertEqual(sum(decode_segment_stream(chunk_bytes_list, "topic"), []), decode_segment(segment_bytes, "topic"))
+            #
+            (offset_int, pos_int, _) = index_tuple_list[5]
+            self.assertEqual(sum(decode_segment_stream(chunk_bytes_list, "topic", pos_int, offset_int + 1), []), decode_segment(segment_bytes, "topic", pos_int, offset_int + 1))
+            #
+            self.assertEqual(find_offset_by_timestamp(chunk_bytes_list, 1500), 500)
+            self.assertIsNone(find_offset_by_timestamp(chunk_bytes_list, 5000))
+
+    def test_mmap(self):
+        s = self.get_storage()
+        #
+        for format_str, compression_type_str in [("text", "none"), ("binary", "none"), ("binary", "zlib")]:
+            topic_str = self.create_test_topic_name()
+            s.create(topic_str, partitions=2, format=format_str, config={"compression.type": compression_type_str})
+            producer = s.producer(topic_str, type="bytes")
+            producer.produce([f"value {i}".encode("utf-8") for i in range(1000)], key=[f"key {i}".encode("utf-8") for i in range(1000)], headers=[("h1", b"v1")])
+            producer.close()
+            #
+            for type_str in ["bytes", "str"]:
+                consumer = s.consumer(topic_str, type=type_str, config={"fetch.mmap": False})
+                message_dict_list1 = consumer.consume()
+                consumer.close()
+                consumer = s.consumer(topic_str, type=type_str, config={"fetch.mmap": True}, offsets={0: 100, 1: 200})
+                message_dict_list2 = consumer.consume()
+                consumer.close()
+                #
+                self.assertEqual(len(message_dict_list2), 700)
+                self.assertEqual([(message_dict["key"], message_dict["value"], message_dict["headers"]) for message_dict in message_dict_list2], [(message_dict["key"], message_dict["value"], message_dict["headers"]) for message_dict in message_dict_list1 if message_dict["offset"] >= (100 if message_dict["partition"] == 0 else 200)])
+                if type_str == "bytes" and format_str == "binary" and compression_type_str == "none":
+                    self.assertIsInstance(message_dict_list2[0]["value"], memoryview)
+                else:
+                    self.assertNotIsInstance(message_dict_list2[0]["value"], memoryview)
+
+    def test_metadata_cache(self):
+        s1 = self.get_storage()
+        s2 = self.get_storage()
+        #
+        topic_str = self.create_test_topic_name()
+        s1.create(topic_str, partitions=2)
+        #
+        read_str_counter_int = 0
+        def read_str(abs_path_file_str, read_str_function=s1.admin.read_str):
+            nonlocal read_str_counter_int
+            read_str_counter_int += 1
+            return read_str_function(abs_path_file_str)
+        s1.admin.read_str = read_str
+        # Validated (by modification time) on each access.
+        s1.metadata_max_age_ms(0)
+        for _ in range(10):
+            self.assertEqual(s1.admin.get_partitions(topic_str), 2)
+        self.assertEqual(read_str_counter_int, 1)
+        # Callers get copies of the cached dicts.
+        s1.admin.get_metadata(topic_str)["partitions"] = 5
+        self.assertEqual(s1.admin.get_partitions(topic_str), 2)
+        # Changes by other storage objects/processes are seen immediately...
+        s2.partitions(topic_str, partitions=3)
+        self.assertEqual(s1.admin.get_partitions(topic_str), 3)
+        self.assertEqual(read_str_counter_int, 2)
+        # ...or after metadata.max.age.ms.
+        s1.metadata_max_age_ms(3600000)
+        s2.partitions(topic_str, partitions=4)
+        self.assertEqual(s1.admin.get_partitions(topic_str), 3)
+        s1.metadata_max_age_ms(0)
+        self.assertEqual(s1.admin.get_partitions(topic_str), 4)
+        # Own changes are seen immediately.
+        s1.metadata_max_age_ms(3600000)
+        s1.partitions(topic_str, partitions=5)
+        self.assertEqual(s1.admin.get_partitions(topic_str), 5)
+        #
+        s1.delete(topic_str)
+        self.assertEqual(s1.admin.get_metadata(topic_str), {})
+        #
+        del s1.admin.read_str
+
+    def test_segment_cache(self):
+        cache_dir_str = os.path.join(self.path_str, "cache")
+        if os.path.exists(cache_dir_str):
+            for file_str in os.listdir(cache_dir_str):
+                os.remove(os.path.join(cache_dir_str, file_str))
+        #
+        segmentCache1 = SegmentCache(cache_dir_str, 30)
+        for key_str in ["a", "b", "c"]:
+            segmentCache1.write_bytes(key_str, key_str.encode("utf-8") * 10)
+        self.assertEqual(segmentCache1.total_size_int, 30)
+        # Inserting does not scan the cache directory again.
+        scandir_function = os.scandir
+        def scandir(*args, **kwargs):
+            raise Exception("scandir")
+        os.scandir = scandir
+        try:
+            # "a" is used again, i.e. "b" is the least recently used file.
+            self.assertEqual(segmentCache1.read_bytes("a"), b"a" * 10)
+            segmentCache1.write_bytes("d", b"d" * 10)
+        finally:
+            os.scandir = scandir_function
+        self.assertEqual(segmentCache1.read_bytes("b"), None)
+        self.assertEqual(segmentCache1.total_size_int, 30)
+        self.assertEqual(len(os.listdir(cache_dir_str)), 3)
+        # A new cache is seeded by one scan of the cache directory.
+        segmentCache2 = SegmentCache(cache_dir_str, 20)
+        self.assertEqual(segmentCache2.total_size_int, 20)
+        self.assertEqual(len(os.listdir(cache_dir_str)), 2)
+        segmentCache2.cache_max_bytes_int = 0
+        segmentCache2.evict()
+        self.assertEqual(os.listdir(cache_dir_str), [])
+
+    def test_list_topics(self):
+        s = self.get_storage()
+        #
+        topic_str = self.create_test_topic_name()
+        s.create(topic_str, partitions=2)
+        #
+        p = s.producer(topic_str, config={"linger.ms": 0, "segment.messages": 1})
+        p.produce([f"message {i}" for i in range(10)])
+        p.close()
+        # Listing the topics must not walk the partition files.
+        def list_dirs_or_files(abs_path_dir_str):
+            raise Exception("Must not be called.")
+        s.admin.list_dirs = list_dirs_or_files
+        s.admin.list_files = list_dirs_or_files
+        #
+        topic_str_list = s.ls()
+        self.assertIn(topic_str, topic_str_list)
+        self.assertNotIn("partitions", topic_str_list)
+        self.assertEqual(s.ls(topic_str), [topic_str])
+        #
+        del s.admin.list_dirs
+        del s.admin.list_files
+        #
+        s.delete(topic_str)
+        self.assertEqual(s.ls(topic_str), [])
+
+    def test_group_index(self):
+        s = self.get_storage()
+        #
+        topic_str = self.create_test_topic_name()
+        s.create(topic_str, partitions=2)
+        p = s.producer(topic_str, config={"linger.ms": 0})
+        p.produce([f"message {i}" for i in range(10)], partition=[i % 2 for i in range(10)])
+        p.close()
+        #
+        group_str_list = [self.create_test_group_name() for _ in range(3)]
+        for group_str in group_str_list:
+            c = s.consumer(topic_str, group=group_str, type="str")
+            c.consume(n=4)
+            c.commit()
+            c.close()
+        # The group files are read once and then indexed.
+        read_str_counter_int = 0
+        def read_str(abs_path_file_str, read_str_function=s.admin.read_str):
+            nonlocal read_str_counter_int
+            if os.path.dirname(abs_path_file_str) == os.path.join(self.path_str, "groups"):
+                read_str_counter_int += 1
+            return read_str_function(abs_path_file_str)
+        s.admin.read_str = read_str
+        #
+        self.assertEqual(s.groups(group_str_list), group_str_list)
+        self.assertEqual(read_str_counter_int, 3)
+        #
+        s2 = self.get_storage()
+        s2.admin.read_str = read_str
+        self.assertEqual(s2.groups(group_str_list), group_str_list)
+        self.assertEqual(s2.groups(group_str_list, state=True), {group_str: "empty" for group_str in group_str_list})
+        self.assertEqual(s2.group_offsets(group_str_list[0]), {group_str_list[0]: {topic_str: {0: 4, 1: -1001}}})
+        self.assertEqual(read_str_counter_int, 3)
+        # Only changed groups are read again (once for the read-modify-write, once for re-indexing).
+        s.group_offsets(group_str_list[1], {topic_str: {0: 5, 1: 3}})
+        self.assertEqual(s2.group_offsets(group_str_list), {group_str_list[0]: {topic_str: {0: 4, 1: -1001}}, group_str_list[1]: {topic_str: {0: 5, 1: 3}}, group_str_list[2]: {topic_str: {0: 4, 1: -1001}}})
+        self.assertEqual(read_str_counter_int, 5)
+        self.assertEqual(s2.lags(group_str_list[1], topic_str), {group_str_list[1]: {topic_str: {0: 0, 1: 2}}})
+        # Deleted groups are removed from the index.
+        s.delete_groups(group_str_list[2])
+        self.assertEqual(s2.groups(group_str_list), group_str_list[:2])
+        self.assertNotIn(group_str_list[2], s2.admin.read_dict_from_file(s2.admin.get_group_index_abs_path_str()))
+        #
+        del s.admin.read_str
+        del s2.admin.read_str
+        s.delete_groups(group_str_list)
+        s.delete(topic_str)
+
+    def test_concurrent_producers(self):
+        from concurrent.futures import ThreadPoolExecutor
+        #
+        topic_str = self.create_test_topic_name()
+        self.get_storage().create(topic_str, partitions=2)
+        # Multiple producers (with their own storage objects) appending to the same partitions concurrently must not assign overlapping offsets.
+        def produce(producer_int):
+            p = self.get_storage().producer(topic_str, type="str", config={"linger.ms": 0, "segment.messages": 10})
+            for i in range(10):
+                p.produce([f"message {producer_int}.{i}.{j}" for j in range(10)], partition=[j % 2 for j in range(10)])
+            p.close()
+        #
+        with ThreadPoolExecutor(max_workers=4) as threadPoolExecutor:
+            list(threadPoolExecutor.map(produce, range(4)))
+        #
+        s = self.get_storage()
+        self.assertEqual(s.watermarks(topic_str)[topic_str], {0: (0, 200), 1: (0, 200)})
+        #
+        c = s.consumer(topic_str, type="str")
+        message_dict_list = c.consume(n=400)
+        c.close()
+        for partition_int in range(2):
+            self.assertEqual([message_dict["offset"] for message_dict in message_dict_list if message_dict["partition"] == partition_int], list(range(200)))
+        self.assertEqual(len(set(message_dict["value"] for message_dict in message_dict_list)), 400)
+        #
+        s.delete(topic_str)
+
+    def test_write_str(self):
+        import threading
+        #
+        s = self.get_storage()
+        #
+        group_str = self.create_test_group_name()
+        group_abs_path_str = os.path.join(s.root_dir(), "groups", group_str)
+        # Concurrent writers of the same file in one process (e.g. a producer and a consumer thread) use different temporary files.
+        exception_list = []
+        def write_str(i):
+            try:
+                for j in range(100):
+                    s.admin.write_str(group_abs_path_str, str({"offsets": {}, "state": "stable", "writer": i * 1000 + j}))
+            except Exception as e:
+                exception_list.append(e)
+        thread_list = [threading.Thread(target=write_str, args=(i,)) for i in range(4)]
+        for thread in thread_list:
+            thread.start()
+        for thread in thread_list:
+            thread.join()
+        self.assertEqual(exception_list, [])
+        self.assertEqual(s.admin.get_group_dict(group_str)["state"], "stable")
+        self.assertEqual([file_str for file_str in os.listdir(os.path.dirname(group_abs_path_str)) if file_str.startswith(group_str)], [group_str])
+        # Temporary files (e.g. left behind by crashed writers) are not listed as groups.
+        with open(f"{group_abs_path_str}.0123456789abcdef.tmp", "w") as bufferedWriter:
+            bufferedWriter.write("{")
+        self.assertEqual(s.groups(group_str), [group_str])
+        self.assertEqual(s.groups(f"{group_str}*"), [group_str])
+        #
+        os.remove(f"{group_abs_path_str}.0123456789abcdef.tmp")
+        s.delete_groups(group_str)
+
+    def test_locks(self):
+        s = self.get_storage()
+        #
+        topic_str = self.create_test_topic_name()
+        s.create(topic_str)
+        #
+        s.lock_timeout_ms(100)
+        lock_token_str = s.admin.acquire_lock(topic_str, "partition-0")
+        with self.assertRaises(Exception):
+            s.admin.acquire_lock(topic_str, "partition-0")
+        s.admin.release_lock(topic_str, "partition-0", lock_token_str)
+        self.assertFalse(s.admin.exists_file(s.admin.get_lock_abs_path_str(topic_str, "partition-0")))
+        # Expired leases (e.g. of crashed producers) are broken.
+        s.lock_lease_ms(0)
+        s.admin.acquire_lock(topic_str, "partition-0")
+        s.lock_lease_ms(60000)
+        lock_token_str = s.admin.acquire_lock(topic_str, "partition-0")
+        s.admin.release_lock(topic_str, "partition-0", lock_token_str)
+        # Empty lock files (e.g. of producers which crashed before writing them) are broken after lock.lease.ms, too.
+        lock_abs_path_str = s.admin.get_lock_abs_path_str(topic_str, "partition-0")
+        self.assertTrue(s.admin.create_file_exclusive(lock_abs_path_str, ""))
+        with self.assertRaises(Exception):
+            s.admin.acquire_lock(topic_str, "partition-0")
+        os.utime(lock_abs_path_str, (0, 0))
+        lock_token_str = s.admin.acquire_lock(topic_str, "partition-0")
+        s.admin.release_lock(topic_str, "partition-0", lock_token_str)
+        # An expired lease is only broken if it has not been broken (and the lock acquired again) by another waiter in the meantime.
+        s.lock_lease_ms(0)
+        s.admin.acquire_lock(topic_str, "partition-0")
+        s1 = self.get_storage()
+        s1.lock_lease_ms(60000)
+        other_lock_token_str = None
+        def read_lock_dict(abs_path_file_str, read_lock_dict_function=s.admin.read_lock_dict):
+            nonlocal other_lock_token_str
+            lock_dict = read_lock_dict_function(abs_path_file_str)
+            if other_lock_token_str is None:
+                other_lock_token_str = s1.admin.acquire_lock(topic_str, "partition-0")
+            return lock_dict
+        s.admin.read_lock_dict = read_lock_dict
+        s.lock_lease_ms(60000)
+        with self.assertRaises(Exception):
+            s.admin.acquire_lock(topic_str, "partition-0")
+        del s.admin.read_lock_dict
+        self.assertEqual(s.admin.read_lock_dict(lock_abs_path_str)["owner"], other_lock_token_str)
+        s1.admin.release_lock(topic_str, "partition-0", other_lock_token_str)
+        self.assertFalse(s.admin.exists_file(lock_abs_path_str))
+        #
+        s.delete(topic_str)
+
+    def test_partition_assignment(self):
+        s = self.get_storage()
+        #
+        topic_str = self.create_test_topic_name()
+        s.create(topic_str, partitions=4)
+        p = s.producer(topic_str, type="str", config={"linger.ms": 0})
+        p.produce([f"message {i}" for i in range(40)], partition=[i % 4 for i in range(40)])
+        p.close()
+        #
+        group_str = self.create_test_group_name()
+        config_dict = {"partition.assignment.strategy": "range", "heartbeat.interval.ms": 0}
+        c1 = s.consumer(topic_str, group=group_str, type="str", config=config_dict)
+        self.assertEqual(c1.assignment(), {topic_str: [0, 1, 2, 3]})
+        # The members of a group split the partitions between them...
+        c2 = s.consumer(topic_str, group=group_str, type="str", config=config_dict)
+        c1.heartbeat()
+        self.assertEqual(sorted(c1.assignment()[topic_str] + c2.assignment()[topic_str]), [0, 1, 2, 3])
+        self.assertEqual(len(c1.assignment()[topic_str]), 2)
+        #
+        message_dict_list1 = c1.consume()
+        message_dict_list2 = c2.consume()
+        self.assertEqual(set(message_dict["partition"] for message_dict in message_dict_list1), set(c1.assignment()[topic_str]))
+        self.assertEqual(sorted(message_dict["value"] for message_dict in message_dict_list1 + message_dict_list2), sorted(f"message {i}" for i in range(40)))
+        # ...and only commit the offsets of their own partitions.
+        self.assertEqual(s.group_offsets(group_str)[group_str][topic_str], {0: 10, 1: 10, 2: 10, 3: 10})
+        # Rebalance when members leave (or do not send heartbeats anymore).
+        c2.close()
+        self.assertEqual(s.groups(group_str, state=True), {group_str: "stable"})
+        self.assertEqual(c1.heartbeat(), {topic_str: [0, 1, 2, 3]})
+        #
+        s.admin.heartbeat(group_str, "crashed", [topic_str], 0)
+        self.assertEqual(c1.heartbeat(), {topic_str: [0, 1, 2, 3]})
+        #
+        c1.close()
+        self.assertEqual(s.groups(group_str, state=True), {group_str: "empty"})
+        #
+        s.delete_groups(group_str)
+        s.delete(topic_str)
+
+    def test_cursor(self):
+        s = self.get_storage()
+        #
+        topic_str = self.create_test_topic_name()
+        s.create(topic_str, partitions=2)
+        p = s.producer(topic_str, type="str", config={"linger.ms": 0})
+        for i in range(10):
+            p.produce([f"message {i}.{j}" for j in range(10)], partition=i % 2)
+        #
+        read_stream_counter_int = 0
+        def read_stream(abs_path_file_str, read_stream_function=s.admin.read_stream):
+            nonlocal read_stream_counter_int
+            read_stream_counter_int += 1
+            return read_stream_function(abs_path_file_str)
+        s.admin.read_stream = read_stream
+        # Repeated small consume() calls continue where the previous call stopped (without re-opening the partition files).
+        c = s.consumer(topic_str, type="str", config={"fetch.num.workers": 1})
+        value_str_list = []
+        for _ in range(20):
+            value_str_list += [message_dict["value"] for message_dict in c.consume(n=5)]
+        self.assertEqual(sorted(value_str_list), sorted(f"message {i}.{j}" for i in range(10) for j in range(10)))
+        self.assertEqual(read_stream_counter_int, 10)
+        self.assertEqual(c.consume(n=5), [])
+        # New messages are picked up by the next call.
+        p.produce([f"message 10.{j}" for j in range(10)], partition=0)
+        p.close()
+        self.assertEqual([message_dict["value"] for message_dict in c.consume(n=20)], [f"message 10.{j}" for j in range(10)])
+        self.assertEqual(read_stream_counter_int, 11)
+        c.close()
+        #
+        del s.admin.read_stream
+        s.delete(topic_str)
+
+    def test_follow(self):
+        import threading
+        import time
+        #
+        s = self.get_storage()
+        #
+        topic_str1 = self.create_test_topic_name()
+        s.create(topic_str1, partitions=2)
+        p = s.producer(topic_str1, type="str", config={"linger.ms": 0})
+        p.produce([f"message {i}" for i in range(10)])
+        #
+        def produce_later():
+            time.sleep(0.2)
+            p.produce([f"message {i}" for i in range(10, 15)])
+        #
+        # Wait for new messages instead of stopping at the end of the topic.
+        thread = threading.Thread(target=produce_later)
+        thread.start()
+        message_dict_list = s.cat(topic_str1, n=15, type="str", follow=True)
+        thread.join()
+        self.assertEqual(sorted(message_dict["value"] for message_dict in message_dict_list), sorted(f"message {i}" for i in range(15)))
+        # Also pick up the partition files appended by another storage object (i.e. not from the cached manifest).
+        s1 = self.get_storage()
+        s1.metadata_max_age_ms(3600000)
+        self.assertEqual(len(s1.cat(topic_str1, type="str")), 15)
+        thread = threading.Thread(target=produce_later)
+        thread.start()
+        self.assertEqual(len(s1.cat(topic_str1, n=20, type="str", follow=True)), 20)
+        thread.join()
+        # Copy in follow mode - incomplete produce batches are written as soon as there are no new messages.
+        topic_str2 = self.create_test_topic_name()
+        thread = threading.Thread(target=produce_later)
+        thread.start()
+        (consume_message_counter_int, produce_message_counter_int) = s.cp(topic_str1, s, topic_str2, n=25, type="str", follow=True, produce_batch_size=1000)
+        thread.join()
+        self.assertEqual((consume_message_counter_int, produce_message_counter_int), (25, 25))
+        self.assertEqual(s.l(topic_str2)[topic_str2], 25)
+        #
+        p.close()
+        s.delete(topic_str1)
+        s.delete(topic_str2)
+        # Stop following once the topic has been deleted (without recreating its manifest).
+        topic_str3 = self.create_test_topic_name()
+        s.create(topic_str3)
+        s.producer(topic_str3, type="str", config={"linger.ms": 0}).produce("message 0")
+        def delete_later():
+            time.sleep(0.2)
+            s1.delete(topic_str3)
+        thread = threading.Thread(target=delete_later)
+        thread.start()
+        self.assertEqual(len(s.cat(topic_str3, type="str", follow=True)), 1)
+        thread.join()
+        self.assertEqual(s.ls(topic_str3), [])
+        # Looking up a topic which does not exist does not create it either.
+        with self.assertRaises(Exception):
+            s.admin.get_partition_files(topic_str3)
+        s.create(topic_str3)
+        self.assertEqual(s.l(topic_str3)[topic_str3], 0)
+        s.delete(topic_str3)
+
+    def test_arrow_segments(self):
+        import pyarrow as pa
+        #
+        s = self.get_storage()
+        #
+        value_str_list = [f"message {i}" for i in range(10000)]
+        #
+        for compression_type_str in ["none", "zstd"]:
+            topic_str = self.create_test_topic_name()
+            s.create(topic_str, partitions=2, config={"compression.type": compression_type_str}, format="arrow")
+            self.assertEqual(s.admin.get_format(topic_str), "arrow")
+            producer = s.producer(topic_str, type="str")
+            producer.produce(value_str_list, key=[f"key {i}" for i in range(10000)], partition=[i % 2 for i in range(10000)], timestamp=[(1, 1000 + i) for i in range(10000)], headers=[("h1", b"v1")])
+            producer.close()
+            # Partition files are plain Arrow IPC streams.
+            rel_file_str = s.admin.get_partition_files(topic_str, 0)[0]
+            table = pa.ipc.open_stream(s.admin.read_bytes(os.path.join(s.admin.get_topic_abs_path_str(topic_str), "partitions", rel_file_str))).read_all()
+            self.assertEqual(table.num_rows, 5000)
+            self.assertEqual(table.column("value")[1].as_py(), b"message 2")
+            # Consume (skipping whole record batches below the start offset).
+            consumer = s.consumer(topic_str, type="str", offsets={0: 4500, 1: 5000})
+            message_dict_list = consumer.consume()
+            consumer.close()
+            self.assertEqual([message_dict["value"] for message_dict in message_dict_list], value_str_list[9000::2])
+            self.assertEqual(message_dict_list[0]["key"], "key 9000")
+            self.assertEqual(message_dict_list[0]["headers"], [("h1", b"v1")])
+            self.assertEqual(message_dict_list[0]["timestamp"], (1, 10000))
+            #
+            self.assertEqual(s.offsets_for_times(topic_str, {0: 1500, 1: 1500})[topic_str], {0: 250, 1: 250})
+            # Read the partition files into a single Arrow table without consuming the individual messages.
+            table = s.topic_to_arrow(topic_str, type="str")
+            self.assertEqual(table.num_rows, 10000)
+            self.assertEqual(table.column("value").type, pa.string())
+            self.assertEqual(sorted(table.column("value").to_pylist()), sorted(value_str_list))
+            self.assertEqual(s.topic_to_arrow(topic_str, n=10, type="bytes").column("value").to_pylist(), [f"message {i}".encode("utf-8") for i in range(0, 20, 2)])
+            # With start offsets (or a group), the messages are consumed like for the other segment formats.
+            self.assertEqual(s.topic_to_arrow(topic_str, type="str", offsets={0: 4500, 1: 5000}).column("value").to_pylist(), value_str_list[9000::2])
+            self.assertEqual(s.topic_to_arrow(topic_str, n=3, type="str", offsets={0: 4998, 1: 4999}).column("value").to_pylist(), [value_str_list[9996], value_str_list[9998], value_str_list[9999]])
+            # Merging keeps the Arrow segment format.
+            s.merge_segments(topic_str)
+            consumer = s.consumer(topic_str, type="str")
+            self.assertEqual(len(consumer.consume(n=10000)), 10000)
+            consumer.close()
+            #
+            s.delete(topic_str)
+        # Topics in other segment formats (or other types) fall back to consuming the messages.
+        topic_str = self.create_test_topic_name()
+        s.create(topic_str, format="binary")
+        producer = s.producer(topic_str, type="json")
+        producer.produce([{"a": i} for i in range(10)])
+        producer.close()
+        table = s.topic_to_arrow(topic_str, type="json")
+        self.assertEqual(table.column("value").to_pylist(), [{"a": i} for i in range(10)])
+        s.delete(topic_str)
+        #
+        with self.assertRaises(Exception):
+            s.create(self.create_test_topic_name(), config={"compression.type": "zlib"}, format="arrow")
@@ -1,4 +1,5 @@
 import os
+import shutil
 import sys
 
 if os.path.basename(os.getcwd()) == "test":
@@ -40,3 +41,67 @@ class Test(TestSingleStorageBase):
 
     def test_compact(self):
         pass
+
+    #
+
+    def test_conditional_requests(self):
+        from minio.error import S3Error
+        #
+
+        s = self.get_storage()
+        # Lock files are created/broken with conditional requests (If-None-Match/If-Match), which the public API of minio does not support.
+        request_tuple_list = []
+        etag_str = "0123456789abcdef"
+        class Response:
+            def close(self):
+                pass
+        def execute(method_str, bucket_name_str, object_name_str, body=None, headers=None, **kwargs):
+            request_tuple_list.append((method_str, bucket_name_str, object_name_str, body, headers))
+            if (method_str == "PUT" and len(request_tuple_list) > 1) or (method_str == "DELETE" and headers["If-Match"] != f"\"{etag_str}\""):
+                raise S3Error(None, "PreconditionFailed", "At least one of the pre-conditions you specified did not hold", object_name_str, None, None)
+            return Response()
+        s.admin.minio._execute = execute
+        #
+        self.assertTrue(s.admin.create_file_exclusive("test/locks/lock", "lock"))
+        self.assertFalse(s.admin.create_file_exclusive("test/locks/lock", "lock"))
+        self.assertFalse(s.admin.delete_file_if_version("test/locks/lock", "fedcba9876543210"))
+        self.assertTrue(s.admin.delete_file_if_version("test/locks/lock", etag_str))
+        self.assertEqual(request_tuple_list, [("PUT", s.bucket_name(), "test/locks/lock", b"lock", {"If-None-Match": "*"}), ("PUT", s.bucket_name(), "test/locks/lock", b"lock", {"If-None-Match": "*"}), ("DELETE", s.bucket_name(), "test/locks/lock", None, {"If-Match": "\"fedcba9876543210\""}), ("DELETE", s.bucket_name(), "test/locks/lock", None, {"If-Match": f"\"{etag_str}\""})])
+
+    def test_segment_cache(self):
+        s = self.get_storage()
+        cache_dir_str = "/tmp/kafi/test/s3/cache"
+        shutil.rmtree(cache_dir_str, ignore_errors=True)
+        s.cache_dir(cache_dir_str)
+        #
+        topic_str = self.create_test_topic_name()
+        s.create(topic_str, partitions=2)
+        producer = s.producer(topic_str, type="str")
+        producer.produce([f"message {i}" for i in range(10)])
+        producer.close()
+        #
+        self.assertEqual(len(s.cat(topic_str, type="str")), 10)
+        # The partition files have been cached while they were read...
+        self.assertEqual(len(os.listdir(cache_dir_str)), 2)
+        # ...and are read from the cache from now on.
+        read_stream = s.admin.read_stream
+        abs_path_file_str_list = []
+        def read_stream1(abs_path_file_str, start_pos_int=0):
+            abs_path_file_str_list.append(abs_path_file_str)
+            return read_stream(abs_path_file_str, start_pos_int)
+        s.admin.read_stream = read_stream1
+        self.assertEqual(sorted(message_dict["value"] for message_dict in s.cat(topic_str, type="str")), sorted(f"message {i}" for i in range(10)))
+        self.assertEqual(abs_path_file_str_list, [])
+        # Re-created topics have new ETags, i.e. their partition files are not read from the cache.
+        s.delete(topic_str)
+        s.create(topic_str, partitions=2)
+        producer = s.producer(topic_str, type="str")
+        producer.produce([f"message {i}" for i in range(10, 20)])
+        producer.close()
+        self.assertEqual(sorted(message_dict["value"] for message_dict in s.cat(topic_str, type="str")), sorted(f"message {i}" for i in range(10, 20)))
+        self.assertEqual(len(abs_path_file_str_list), 2)
+        self.assertEqual(len(os.listdir(cache_dir_str)), 4)
+        # Least recently used partition files are evicted once the cache exceeds cache.max.bytes.
+        s.cache_max_bytes(0)
+        s.cat(topic_str, type="str")
+        self.assertEqual(os.listdir(cache_dir_str), [])
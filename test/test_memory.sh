@@ -0,0 +1,9 @@
+#!/bin/bash
+export KAFI_HOME=".."
+if [ -z $1 ]
+then
+    coverage run -m unittest test_memory.Test
+else
+    coverage run -m unittest test_memory.Test.$1
+fi
+coverage html
@@ -0,0 +1,139 @@
+import os
+import sys
+import threading
+import time
+
+if os.path.basename(os.getcwd()) == "test":
+    sys.path.insert(1, "..")
+else:
+    sys.path.insert(1, ".")
+
+from test.test_single_storage_base import TestSingleStorageBase
+from kafi.sqlite.sqlite import SQLite
+
+#
+
+class Test(TestSingleStorageBase):
+    def setUp(self):
+        super().setUp()
+        self.database_str = "/tmp/kafi/test/sqlite/kafi.db"
+
+    def tearDown(self):
+        super().tearDown()
+
+    #
+
+    def get_storage(self):
+        s = SQLite("local")
+        s.database(self.database_str)
+        #
+        return s
+
+    def is_ccloud(self):
+        return False
+
+    #
+
+    def test_acls(self):
+        pass
+
+    def test_brokers(self):
+        pass
+
+    def test_compact(self):
+        pass
+
+    #
+
+    def test_watermarks_delete_records(self):
+        s = self.get_storage()
+        #
+        topic_str = self.create_test_topic_name()
+        s.create(topic_str, partitions=2)
+        producer = s.producer(topic_str, type="str")
+        producer.produce([f"message {i}" for i in range(10)], partition=[i % 2 for i in range(10)], timestamp=[(1, 1000 + i) for i in range(10)])
+        producer.close()
+        #
+        self.assertEqual(s.watermarks(topic_str)[topic_str], {0: (0, 5), 1: (0, 5)})
+        self.assertEqual(s.offsets_for_times(topic_str, {0: 1003, 1: 1003})[topic_str], {0: 2, 1: 1})
+        # Messages before the given offsets are deleted, and the low watermarks move accordingly.
+        s.delete_records({topic_str: {0: 3}})
+        self.assertEqual(s.watermarks(topic_str)[topic_str], {0: (3, 5), 1: (0, 5)})
+        consumer = s.consumer(topic_str, type="str", offsets={0: 0})
+        self.assertEqual([message_dict["offset"] for message_dict in consumer.consume()], [3, 4])
+        consumer.close()
+        #
+        s.delete_records(topic_str)
+        self.assertEqual(s.l(topic_str)[topic_str], 0)
+        # Offsets continue after the deleted messages.
+        producer = s.producer(topic_str, type="str")
+        producer.produce("message 10", partition=0)
+        producer.close()
+        self.assertEqual(s.watermarks(topic_str)[topic_str][0], (5, 6))
+
+    def test_cursor(self):
+        s = self.get_storage()
+        #
+        topic_str = self.create_test_topic_name()
+        s.create(topic_str, partitions=2)
+        producer = s.producer(topic_str, type="str")
+        producer.produce([f"message {i}" for i in range(10)])
+        producer.close()
+        # Repeated small consume() calls continue where the previous one stopped (reading the partitions in batches of consume.batch.size messages).
+        consumer = s.consumer(topic_str, type="str")
+        message_dict_list = []
+        for _ in range(5):
+            message_dict_list += consumer.consume(n=2, consume_batch_size=3)
+        self.assertEqual(sorted(message_dict["value"] for message_dict in message_dict_list), sorted(f"message {i}" for i in range(10)))
+        self.assertEqual(consumer.consume(n=2), [])
+        #
+        producer = s.producer(topic_str, type="str")
+        producer.produce("message 10", partition=1)
+        producer.close()
+        self.assertEqual([message_dict["value"] for message_dict in consumer.consume(n=2)], ["message 10"])
+        consumer.close()
+
+    def test_follow(self):
+        s = self.get_storage()
+        #
+        topic_str = self.create_test_topic_name()
+        s.create(topic_str)
+        producer = s.producer(topic_str, type="str")
+        producer.produce([f"message {i}" for i in range(5)])
+        #
+        def produce_later():
+            time.sleep(0.2)
+            # Each thread uses its own connection.
+            producer.produce([f"message {i}" for i in range(5, 10)])
+        #
+        thread = threading.Thread(target=produce_later)
+        thread.start()
+        message_dict_list = s.cat(topic_str, n=10, type="str", follow=True)
+        thread.join()
+        self.assertEqual([message_dict["value"] for message_dict in message_dict_list], [f"message {i}" for i in range(10)])
+        #
+        producer.close()
+
+    def test_concurrent_producers(self):
+        s = self.get_storage()
+        #
+        topic_str = self.create_test_topic_name()
+        s.create(topic_str)
+        #
+        def produce():
+            # Separate storage objects (i.e. connections) writing to the same partition.
+            producer = self.get_storage().producer(topic_str, type="str")
+            for i in range(20):
+                producer.produce([f"message {i}"] * 5)
+            producer.close()
+        #
+        thread_list = [threading.Thread(target=produce) for _ in range(4)]
+        for thread in thread_list:
+            thread.start()
+        for thread in thread_list:
+            thread.join()
+        #
+        self.assertEqual(s.watermarks(topic_str)[topic_str][0], (0, 400))
+        consumer = s.consumer(topic_str, type="str")
+        self.assertEqual([message_dict["offset"] for message_dict in consumer.consume()], list(range(400)))
+        consumer.close()